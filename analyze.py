@@ -1,8 +1,8 @@
-import csv
-import os
+from fact_checker.results_store import read_results
 
 # Il file CSV generato da evaluate.py
-RESULTS_FILE_PATH = "output/evaluation_results.csv" 
+# Archivio Parquet scritto da evaluate.py (che vi importa anche il CSV di output già esistente)
+RESULTS_DATASET = "output/evaluation_results"
 
 PF_TRUE_LABELS = {'true', 'mostly-true'}
 PF_FALSE_LABELS = {'false', 'pants-on-fire'}
@@ -15,13 +15,9 @@ RAG_NO_PREDICTION = {'BASELESS', 'ERRORE'}
 
 def analyze_strict_metrics():
     """
-    Legge il file CSV e calcola le metriche complete (Precision, Recall, F1)
+    Legge i risultati e calcola le metriche complete (Precision, Recall, F1)
     usando solo i claim "Netti" (ignora 'half-true' e 'mostly-false').
     """
-    if not os.path.exists(RESULTS_FILE_PATH):
-        print(f"ERRORE: File dei risultati non trovato: {RESULTS_FILE_PATH}")
-        return
-
     # Contatori per le nostre metriche
     total_rows = 0
     rag_failures = 0
@@ -33,41 +29,44 @@ def analyze_strict_metrics():
     fn = 0  # False Negative
 
     try:
-        with open(RESULTS_FILE_PATH, mode='r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
+        # Solo le due colonne necessarie, lette dall'archivio Parquet (file mappati in memoria)
+        df = read_results(RESULTS_DATASET, columns=['politifact_label', 'rag_label'])
+        if df is None:
+            print(f"ERRORE: Archivio dei risultati non trovato: {RESULTS_DATASET}")
+            print("Esegui prima evaluate.py (o 'python run_sharded.py politifact --merge-only' per importare solo il CSV di output).")
+            return
+        for pf_label, rag_label in zip(df['politifact_label'].fillna(''), df['rag_label'].fillna('')):
+            total_rows += 1
             
-            for row in reader:
-                total_rows += 1
-                
-                pf_label = row.get('politifact_label', '').lower().strip()
-                rag_label = row.get('rag_label', '').upper().strip()
-
-                # --- 1. Filtriamo i fallimenti del RAG ---
-                if rag_label in RAG_NO_PREDICTION:
-                    rag_failures += 1
-                    continue 
-
-                # --- 2. Filtriamo i claim ambigui di PolitiFact ---
-                if pf_label in PF_AMBIGUOUS_LABELS:
-                    pf_ambiguous += 1
-                    continue 
-
-                # --- 3. Valutazione dei claim "Netti" (Veri o Falsi) ---                
-                is_pf_true = pf_label in PF_TRUE_LABELS
-                is_pf_false = pf_label in PF_FALSE_LABELS
-                is_rag_positive = rag_label in RAG_POSITIVE_PREDICTION
-                is_rag_negative = rag_label in RAG_NEGATIVE_PREDICTION
-
-                # --- MODIFICA: Popoliamo la Matrice di Confusione ---
-                if is_rag_positive and is_pf_true:
-                    tp += 1
-                elif is_rag_positive and is_pf_false:
-                    fp += 1
-                elif is_rag_negative and is_pf_false:
-                    tn += 1
-                elif is_rag_negative and is_pf_true:
-                    fn += 1
-                # --- FINE MODIFICA ---
+            pf_label = pf_label.lower().strip()
+            rag_label = rag_label.upper().strip()
+
+            # --- 1. Filtriamo i fallimenti del RAG ---
+            if rag_label in RAG_NO_PREDICTION:
+                rag_failures += 1
+                continue 
+
+            # --- 2. Filtriamo i claim ambigui di PolitiFact ---
+            if pf_label in PF_AMBIGUOUS_LABELS:
+                pf_ambiguous += 1
+                continue 
+
+            # --- 3. Valutazione dei claim "Netti" (Veri o Falsi) ---                
+            is_pf_true = pf_label in PF_TRUE_LABELS
+            is_pf_false = pf_label in PF_FALSE_LABELS
+            is_rag_positive = rag_label in RAG_POSITIVE_PREDICTION
+            is_rag_negative = rag_label in RAG_NEGATIVE_PREDICTION
+
+            # --- MODIFICA: Popoliamo la Matrice di Confusione ---
+            if is_rag_positive and is_pf_true:
+                tp += 1
+            elif is_rag_positive and is_pf_false:
+                fp += 1
+            elif is_rag_negative and is_pf_false:
+                tn += 1
+            elif is_rag_negative and is_pf_true:
+                fn += 1
+            # --- FINE MODIFICA ---
 
     except Exception as e:
         print(f"ERRORE durante la lettura del file: {e}")
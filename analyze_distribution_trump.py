@@ -1,17 +1,13 @@
-import csv
-import os
 from collections import Counter
 import random
+from fact_checker.results_store import read_results
 
 
-INPUT_FILE = "output/trump_results.csv"  # File generato da evaluate_trump.py
+# Archivio Parquet scritto da evaluate_trump.py (che vi importa anche il CSV di output già esistente)
+INPUT_DATASET = "output/trump_results"
 
 
 def analyze_trump_claims():
-    if not os.path.exists(INPUT_FILE):
-        print(f"ERRORE: File {INPUT_FILE} non trovato.")
-        return
-
     # Contatori
     counts = Counter()
     total = 0
@@ -25,28 +21,32 @@ def analyze_trump_claims():
     }
 
     try:
-        with open(INPUT_FILE, mode='r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            
-            # Recupera tutti i dati in una lista per poterli mescolare (per esempi casuali)
-            rows = list(reader)
-            random.shuffle(rows)
+        # Solo le colonne usate dal report, lette dall'archivio Parquet (file mappati in memoria)
+        df = read_results(INPUT_DATASET, columns=['claim', 'rag_label', 'rag_motivation'])
+        if df is None:
+            print(f"ERRORE: Archivio dei risultati non trovato: {INPUT_DATASET}")
+            print("Esegui prima evaluate_trump.py (o 'python run_sharded.py trump --merge-only' per importare solo il CSV di output).")
+            return
+        
+        # Recupera tutti i dati in una lista per poterli mescolare (per esempi casuali)
+        rows = df.fillna({'rag_label': 'ERRORE', 'rag_motivation': ''}).to_dict('records')
+        random.shuffle(rows)
 
-            for row in rows:
-                # Normalizza l'etichetta
-                label = row.get('rag_label', 'ERRORE').upper().strip()
-                
-                # Correggi eventuali etichette sporche se necessario
-                if "SUPPORT" in label: label = "SUPPORTED"
-                elif "NEGAT" in label: label = "NEGATE"
-                elif "BASE" in label: label = "BASELESS"
-                
-                counts[label] += 1
-                total += 1
-                
-                # Salva fino a 5 esempi per categoria
-                if len(examples.get(label, [])) < 5:
-                    examples.setdefault(label, []).append(row)
+        for row in rows:
+            # Normalizza l'etichetta
+            label = row.get('rag_label', 'ERRORE').upper().strip()
+            
+            # Correggi eventuali etichette sporche se necessario
+            if "SUPPORT" in label: label = "SUPPORTED"
+            elif "NEGAT" in label: label = "NEGATE"
+            elif "BASE" in label: label = "BASELESS"
+            
+            counts[label] += 1
+            total += 1
+            
+            # Salva fino a 5 esempi per categoria
+            if len(examples.get(label, [])) < 5:
+                examples.setdefault(label, []).append(row)
 
     except Exception as e:
         print(f"Errore lettura file: {e}")
@@ -81,7 +81,7 @@ def analyze_trump_claims():
         if examples[label]:
             print(f"\n--- Esempi di {label} ---")
             for i, ex in enumerate(examples[label][:3]): # Mostra i primi 3 esempi
-                clean_claim = ex['claim_text'].replace("\n", " ")[:100] + "..."
+                clean_claim = ex['claim'].replace("\n", " ")[:100] + "..."
                 clean_mot = ex['rag_motivation'].replace("\n", " ")[:150] + "..."
                 
                 print(f"{i+1}. CLAIM: \"{clean_claim}\"")
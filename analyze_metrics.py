@@ -1,7 +1,7 @@
-import csv
-import os
+from fact_checker.results_store import read_results
 
-RESULTS_FILE_PATH = "output/evaluation_results.csv"
+# Archivio Parquet scritto da evaluate.py (che vi importa anche il CSV di output già esistente)
+RESULTS_DATASET = "output/evaluation_results"
 
 # Come consideriamo le etichette di PolitiFact
 PF_POSITIVE_LABELS = {'true', 'mostly-true', 'half-true'}
@@ -18,10 +18,6 @@ def analyze_full_metrics():
     Calcola la matrice di confusione e le metriche (Precision, Recall, F1)
     usando una mappatura "tollerante" che include 'half-true' e 'mostly-false'.
     """
-    if not os.path.exists(RESULTS_FILE_PATH):
-        print(f"ERRORE: File dei risultati non trovato: {RESULTS_FILE_PATH}")
-        return
-
     # Contatori per la Matrice di Confusione
     tp = 0  # True Positive
     fp = 0  # False Positive
@@ -32,40 +28,43 @@ def analyze_full_metrics():
     rag_failures = 0 # 'BASELESS' o 'ERRORE'
 
     try:
-        with open(RESULTS_FILE_PATH, mode='r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
+        # Solo le due colonne necessarie, lette dall'archivio Parquet (file mappati in memoria)
+        df = read_results(RESULTS_DATASET, columns=['politifact_label', 'rag_label'])
+        if df is None:
+            print(f"ERRORE: Archivio dei risultati non trovato: {RESULTS_DATASET}")
+            print("Esegui prima evaluate.py (o 'python run_sharded.py politifact --merge-only' per importare solo il CSV di output).")
+            return
+        for pf_label, rag_label in zip(df['politifact_label'].fillna(''), df['rag_label'].fillna('')):
+            total_rows += 1
+            pf_label = pf_label.lower().strip()
+            rag_label = rag_label.upper().strip()
+
+            # --- 1. Filtra i fallimenti del RAG ---
+            # Se il RAG non ha fatto una previsione, non possiamo valutarlo.
+            if rag_label in RAG_NO_PREDICTION:
+                rag_failures += 1
+                continue
             
-            for row in reader:
-                total_rows += 1
-                pf_label = row.get('politifact_label', '').lower().strip()
-                rag_label = row.get('rag_label', '').upper().strip()
-
-                # --- 1. Filtra i fallimenti del RAG ---
-                # Se il RAG non ha fatto una previsione, non possiamo valutarlo.
-                if rag_label in RAG_NO_PREDICTION:
-                    rag_failures += 1
-                    continue
-                
-                # --- 2. Determina la Verità e la Previsione ---
-                is_pf_positive = pf_label in PF_POSITIVE_LABELS
-                is_pf_negative = pf_label in PF_NEGATIVE_LABELS
-                
-                # Se l'etichetta PF non è in nessuna delle nostre liste, la saltiamo
-                if not is_pf_positive and not is_pf_negative:
-                    continue
-
-                is_rag_positive = rag_label in RAG_POSITIVE_PREDICTION
-                is_rag_negative = rag_label in RAG_NEGATIVE_PREDICTION
-
-                # --- 3. Popola la Matrice di Confusione ---
-                if is_rag_positive and is_pf_positive:
-                    tp += 1
-                elif is_rag_positive and is_pf_negative:
-                    fp += 1
-                elif is_rag_negative and is_pf_negative:
-                    tn += 1
-                elif is_rag_negative and is_pf_positive:
-                    fn += 1
+            # --- 2. Determina la Verità e la Previsione ---
+            is_pf_positive = pf_label in PF_POSITIVE_LABELS
+            is_pf_negative = pf_label in PF_NEGATIVE_LABELS
+            
+            # Se l'etichetta PF non è in nessuna delle nostre liste, la saltiamo
+            if not is_pf_positive and not is_pf_negative:
+                continue
+
+            is_rag_positive = rag_label in RAG_POSITIVE_PREDICTION
+            is_rag_negative = rag_label in RAG_NEGATIVE_PREDICTION
+
+            # --- 3. Popola la Matrice di Confusione ---
+            if is_rag_positive and is_pf_positive:
+                tp += 1
+            elif is_rag_positive and is_pf_negative:
+                fp += 1
+            elif is_rag_negative and is_pf_negative:
+                tn += 1
+            elif is_rag_negative and is_pf_positive:
+                fn += 1
 
     except Exception as e:
         print(f"ERRORE durante la lettura del file: {e}")
@@ -0,0 +1,211 @@
+"""
+Benchmark end-to-end della pipeline con provider finti in locale.
+
+Esempi (dalla cartella principale del progetto):
+    python -m benchmarks.bench_pipeline --claims 200 --concurrency 1 8 32
+    python -m benchmarks.bench_pipeline --target trump --tavily-latency 1.2 --error-rate 0.02
+    python -m benchmarks.bench_pipeline --record-cassette cache/cassettes/bench.jsonl.gz
+    python -m benchmarks.bench_pipeline --cassette cache/cassettes/bench.jsonl.gz
+    python -m benchmarks.bench_pipeline --output bench.json --baseline nightly.json --tolerance 0.1
+
+Ogni esecuzione gira in un processo separato (avviato con 'spawn'), così
+RSS di picco e tempo CPU sono misurati per singola configurazione.
+"""
+import argparse
+import contextlib
+import csv
+import glob
+import io
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_servers import ProviderProfile, StubProviders, WORDS
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+TARGETS = ('pipeline', 'politifact', 'trump')
+STAGES = ('planner', 'planner_batch', 'retrieval', 'rerank', 'dedup', 'context', 'judge', 'total')
+
+
+def synthetic_claims(n, seed=0):
+    rng = random.Random(seed)
+    return [f"Claim {i}: " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 25))) for i in range(n)]
+
+
+def write_inputs(target, claims):
+    """Scrive l'input sintetico nel percorso relativo atteso dallo script di valutazione."""
+    if target == 'politifact':
+        path, headers = "data/politifact.csv", ['quote', 'rating_label', 'author', 'context', 'date']
+        rows = [{'quote': c, 'rating_label': 'false', 'author': 'Bench', 'context': 'a speech', 'date': '2024-01-01'} for c in claims]
+    else:
+        path, headers = "trump-truth/trump_posts_classified.csv", ['post_text', 'classification', 'date']
+        rows = [{'post_text': c, 'classification': 'CLAIM', 'date': '2024-01-01'} for c in claims]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode='w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=headers)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run_once(target, concurrency, n_claims, env, verbose=False):
+    """
+    Corpo del processo figlio: configura l'ambiente PRIMA di importare il
+    pacchetto (config/settings.py legge le variabili all'import), lavora in
+    una cartella temporanea ed esegue il target.
+    """
+    os.environ.update(env)
+    os.environ["MAX_CONCURRENCY"] = str(concurrency)
+    workdir = tempfile.mkdtemp(prefix="factcheck-bench-")
+    metrics_dir = os.path.join(workdir, "metrics")
+    os.environ.update({
+        "METRICS_DIR": metrics_dir,
+        "COST_LEDGER_PATH": os.path.join(workdir, "cost_ledger.json"),
+        "LLM_CACHE_MODE": "bypass",
+        "RETRIEVAL_CACHE_MODE": "bypass",
+        "COST_BUDGET_USD": "1000000",   # Nessun input() di conferma negli script di valutazione
+    })
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+
+    import asyncio
+    import resource
+
+    claims = synthetic_claims(n_claims)
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    started, cpu_started = time.perf_counter(), time.process_time()
+    with output:
+        if target == 'pipeline':
+            from fact_checker.pipeline import FactCheckPipeline
+            pipeline = FactCheckPipeline()
+            asyncio.run(pipeline.run_many([{'claim': c} for c in claims], concurrency=concurrency))
+        elif target == 'politifact':
+            write_inputs(target, claims)
+            import evaluate
+            evaluate.EVALUATION_LIMIT = n_claims
+            evaluate.run_evaluation()
+        else:
+            write_inputs(target, claims)
+            import evaluate_trump
+            evaluate_trump.BATCH_SIZE = n_claims
+            evaluate_trump.run_batch_evaluation()
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+
+    summary_files = sorted(glob.glob(os.path.join(metrics_dir, "metrics_*.json")))
+    summary = json.load(open(summary_files[-1], encoding='utf-8')) if summary_files else {"histograms": [], "counters": []}
+    completed = sum(c["value"] for c in summary["counters"] if c["name"] == "claims")
+    stages = {
+        h["labels"]["stage"]: {q: h[q] for q in ("p50", "p95", "p99")}
+        for h in summary["histograms"] if h["name"] == "stage_seconds"
+    }
+    errors = {c["labels"].get("provider"): c["value"] for c in summary["counters"] if c["name"] == "errors"}
+    return {
+        "target": target,
+        "concurrency": concurrency,
+        "claims": n_claims,
+        "completed": completed,
+        "wall_seconds": wall,
+        "claims_per_second": completed / wall if wall else 0.0,
+        "cpu_seconds": cpu,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "stages": stages,
+        "errors": errors,
+    }
+
+
+def print_report(results):
+    print("\n" + "=" * 78)
+    print(f"{'target':<11}{'conc':>5}{'claim':>7}{'claim/s':>9}{'wall s':>8}{'cpu s':>8}{'RSS MB':>8}  errori")
+    print("-" * 78)
+    for r in results:
+        print(f"{r['target']:<11}{r['concurrency']:>5}{r['completed']:>7}{r['claims_per_second']:>9.2f}"
+              f"{r['wall_seconds']:>8.1f}{r['cpu_seconds']:>8.1f}{r['peak_rss_mb']:>8.0f}  {r['errors'] or '-'}")
+    for r in results:
+        print(f"\n  {r['target']} @ {r['concurrency']}  (secondi per fase)")
+        for stage in STAGES:
+            if stage in r['stages']:
+                s = r['stages'][stage]
+                print(f"    {stage:<14} p50={s['p50']:.3f}  p95={s['p95']:.3f}  p99={s['p99']:.3f}")
+    print("=" * 78)
+
+
+def compare_with_baseline(results, baseline_path, tolerance):
+    """Restituisce le configurazioni il cui throughput è sceso oltre la tolleranza."""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['target'], r['concurrency']): r for r in json.load(f)}
+    regressions = []
+    for r in results:
+        previous = baseline.get((r['target'], r['concurrency']))
+        if previous and r['claims_per_second'] < previous['claims_per_second'] * (1 - tolerance):
+            regressions.append((r, previous))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark di throughput con provider Tavily/OpenAI finti.")
+    parser.add_argument('--target', choices=TARGETS, nargs='+', default=['pipeline'])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--claims', type=int, default=100)
+    parser.add_argument('--tavily-latency', type=float, default=0.8, help="Latenza mediana Tavily (s).")
+    parser.add_argument('--openai-latency', type=float, default=1.5, help="Latenza mediana OpenAI (s).")
+    parser.add_argument('--latency-sigma', type=float, default=0.4, help="Dispersione log-normale delle latenze.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Frazione di richieste con errore HTTP 500.")
+    parser.add_argument('--results', type=int, default=100, help="Risultati per ricerca Tavily.")
+    parser.add_argument('--content-chars', type=int, default=1200, help="Caratteri per risultato Tavily.")
+    parser.add_argument('--cassette', help="Riproduce una cassetta registrata invece dei server stub.")
+    parser.add_argument('--record-cassette', help="Registra il traffico verso gli stub in questa cassetta.")
+    parser.add_argument('--output', help="Salva i risultati in JSON.")
+    parser.add_argument('--baseline', help="JSON di un'esecuzione precedente da confrontare.")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="Calo di throughput tollerato rispetto alla baseline.")
+    parser.add_argument('--verbose', action='store_true', help="Mostra l'output della pipeline.")
+    args = parser.parse_args()
+
+    env = {"OPENAI_API_KEY": "bench", "TAVILY_API_KEY": "tvly-bench"}
+    stubs = None
+    if args.cassette:
+        # Nessun server: le risposte (e le loro latenze) vengono dalla cassetta
+        env.update({"CASSETTE_MODE": "replay", "CASSETTE_PATH": os.path.abspath(args.cassette), "CASSETTE_LATENCY": "recorded"})
+    else:
+        stubs = StubProviders(
+            tavily=ProviderProfile(args.tavily_latency, args.latency_sigma, args.error_rate,
+                                   results=args.results, content_chars=args.content_chars),
+            openai=ProviderProfile(args.openai_latency, args.latency_sigma, args.error_rate, content_chars=300),
+        ).start()
+        env.update({"TAVILY_BASE_URL": stubs.tavily_url, "OPENAI_BASE_URL": stubs.openai_url})
+        if args.record_cassette:
+            env.update({"CASSETTE_MODE": "record", "CASSETTE_PATH": os.path.abspath(args.record_cassette)})
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    try:
+        for target in args.target:
+            for concurrency in args.concurrency:
+                print(f"▶ {target} con concorrenza {concurrency} ({args.claims} claim)...")
+                with context.Pool(1) as pool:
+                    results.append(pool.apply(run_once, (target, concurrency, args.claims, env, args.verbose)))
+    finally:
+        if stubs is not None:
+            stubs.stop()
+
+    print_report(results)
+    if args.output:
+        with open(args.output, mode='w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Risultati salvati in {args.output}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        for current, previous in regressions:
+            print(f"❌ Regressione {current['target']} @ {current['concurrency']}: "
+                  f"{current['claims_per_second']:.2f} claim/s (baseline {previous['claims_per_second']:.2f})")
+        if regressions:
+            sys.exit(1)
+        print("✅ Nessuna regressione di throughput rispetto alla baseline.")
+
+
+if __name__ == "__main__":
+    main()
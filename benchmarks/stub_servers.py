@@ -0,0 +1,216 @@
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Domini dei risultati finti: un misto di fonti in sources.json e di siti sconosciuti,
+# così il re-ranker lavora come su dati reali
+STUB_DOMAINS = [
+    "www.reuters.com", "apnews.com", "www.politifact.com", "www.factcheck.org", "www.bbc.com",
+    "www.nytimes.com", "edition.cnn.com", "www.foxnews.com", "example-blog.net", "news-aggregator.io",
+    "randomforum.org", "x.com", "www.facebook.com", "substack-writer.com", "localpaper.us",
+]
+
+WORDS = (
+    "president senate tax jobs economy immigration border vote election fraud inflation "
+    "million billion percent report claim false true evidence study data budget deficit "
+    "court ruling health care wall crime police trade tariff china energy oil climate"
+).split()
+
+VERDICTS = ["SUPPORTED", "NEGATE", "BASELESS"]
+
+
+@dataclass
+class ProviderProfile:
+    """
+    Comportamento di un provider finto: latenza log-normale (mediana e
+    dispersione in secondi), tasso di errori HTTP e dimensione delle risposte.
+    """
+    latency_median: float = 0.5
+    latency_sigma: float = 0.4
+    error_rate: float = 0.0
+    error_status: int = 500
+    results: int = 100          # Solo Tavily: risultati per ricerca
+    content_chars: int = 1200   # Tavily: caratteri per risultato; OpenAI: caratteri della motivazione
+
+    def sample_latency(self, rng):
+        if self.latency_median <= 0:
+            return 0.0
+        return self.latency_median * rng.lognormvariate(0.0, self.latency_sigma)
+
+
+def _text(rng, chars, seed_words=()):
+    words = list(seed_words)
+    size = sum(len(w) + 1 for w in words)
+    while size < chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:chars]
+
+
+def tavily_response(body, profile, rng):
+    query = str(body.get("query", ""))
+    query_words = [w for w in re.findall(r"\w+", query.lower()) if len(w) > 3][:8]
+    n_results = min(profile.results, int(body.get("max_results", profile.results)))
+    results = []
+    for i in range(n_results):
+        domain = rng.choice(STUB_DOMAINS)
+        results.append({
+            "url": f"https://{domain}/article/{rng.randrange(10 ** 6)}-{i}",
+            "title": _text(rng, 60, query_words[:3]),
+            "content": _text(rng, profile.content_chars, query_words),
+            "score": round(rng.random(), 4),
+            "raw_content": None,
+        })
+    return {"query": query, "results": results, "response_time": 0.0, "images": [], "answer": None}
+
+
+def chat_completion_response(body, profile, rng):
+    model = body.get("model", "stub-model")
+    prompt = " ".join(str(m.get("content", "")) for m in body.get("messages", []))
+
+    fanout = re.search(r"Genera (\d+) query DIVERSE", prompt)
+    n_queries = int(fanout.group(1)) if fanout else 1
+    ids = sorted({int(i) for i in re.findall(r'"id": (\d+)', prompt)})
+
+    if ids and '"queries"' in prompt:
+        # Pianificatore in batch: una query (o una lista, con il fan-out) per ogni id nel prompt
+        if n_queries > 1:
+            items = [{"id": i, "queries": [f"stub claim {i} variant {v} fact-check" for v in range(n_queries)]} for i in ids]
+        else:
+            items = [{"id": i, "query": f"stub claim {i} fact-check"} for i in ids]
+        content = json.dumps({"queries": items})
+    elif '"queries"' in prompt:
+        content = json.dumps({"queries": [f"stub query variant {v} fact-check" for v in range(n_queries)]})
+    elif '"query"' in prompt:
+        claim = re.search(r'CLAIM: "(.*?)"', prompt, re.DOTALL)
+        content = json.dumps({"query": f"{claim.group(1)[:80] if claim else 'claim'} fact-check"})
+    else:
+        content = json.dumps({
+            "verdetto": rng.choice(VERDICTS),
+            "motivazione": _text(rng, profile.content_chars),
+        }, ensure_ascii=False)
+
+    prompt_tokens = len(prompt) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "id": f"chatcmpl-stub-{rng.randrange(10 ** 9)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content, "refusal": None},
+            "finish_reason": "stop",
+            "logprobs": None,
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+class StubProviders:
+    """
+    Server HTTP locale che emula Tavily (`POST /search`) e OpenAI
+    (`POST /v1/chat/completions`). Ogni richiesta gira nel proprio thread,
+    attende la latenza campionata dal profilo del provider e, con
+    probabilità `error_rate`, risponde con un errore HTTP.
+
+    Uso:
+        with StubProviders(tavily=ProviderProfile(...), openai=ProviderProfile(...)) as stubs:
+            os.environ["TAVILY_BASE_URL"] = stubs.tavily_url
+            os.environ["OPENAI_BASE_URL"] = stubs.openai_url
+    """
+
+    def __init__(self, tavily=None, openai=None, seed=0, host="127.0.0.1", port=0):
+        self.profiles = {"tavily": tavily or ProviderProfile(), "openai": openai or ProviderProfile(content_chars=300)}
+        self.seed = seed
+        self.requests = {"tavily": 0, "openai": 0}
+        self.errors = {"tavily": 0, "openai": 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def tavily_url(self):
+        return self.url
+
+    @property
+    def openai_url(self):
+        return f"{self.url}/v1"
+
+    def _next_rng(self, provider):
+        # Un generatore per richiesta, derivato dal seme e dal contatore: esecuzioni ripetibili
+        with self._lock:
+            self.requests[provider] += 1
+            return random.Random(f"{self.seed}-{provider}-{self.requests[provider]}")
+
+    def _make_handler(self):
+        stubs = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    return self._send(400, {"error": "invalid json"})
+
+                if self.path.rstrip("/").endswith("/search"):
+                    provider, build = "tavily", tavily_response
+                elif self.path.rstrip("/").endswith("/chat/completions"):
+                    provider, build = "openai", chat_completion_response
+                else:
+                    return self._send(404, {"error": f"unknown path {self.path}"})
+
+                profile = stubs.profiles[provider]
+                rng = stubs._next_rng(provider)
+                time.sleep(profile.sample_latency(rng))
+                if rng.random() < profile.error_rate:
+                    with stubs._lock:
+                        stubs.errors[provider] += 1
+                    return self._send(profile.error_status, {"error": {"message": "stub error", "type": "server_error"}})
+                self._send(200, build(body, profile, rng))
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -13,6 +13,90 @@ DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 NOVITA_API_KEY = os.getenv("NOVITA_API_KEY")
 
+# Chiavi multiple (separate da virgola) per distribuire i worker di run_sharded.py
+OPENAI_API_KEYS = [k.strip() for k in os.getenv("OPENAI_API_KEYS", "").split(",") if k.strip()] or [OPENAI_API_KEY]
+TAVILY_API_KEYS = [k.strip() for k in os.getenv("TAVILY_API_KEYS", "").split(",") if k.strip()] or [TAVILY_API_KEY]
+
+# Endpoint alternativi (es. i server stub di benchmarks/); vuoto = API ufficiali
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+TAVILY_BASE_URL = os.getenv("TAVILY_BASE_URL") or None
+
 # Impostazioni RAG
 TAVILY_MAX_RESULTS = 100 # Recuperiamo il massimo possibile
+# Ricerca adattiva: prima una ricerca basic piccola, poi quella advanced solo se
+# i domini molto affidabili (agenzie, fact-checker) trovati sono troppo pochi
+RETRIEVAL_STRATEGY = os.getenv("RETRIEVAL_STRATEGY", "advanced")  # "advanced" (sempre la ricerca completa) o "adaptive" (basic, poi advanced se servono più fonti)
+ADAPTIVE_BASIC_RESULTS = 20        # Risultati della ricerca basic iniziale
+ADAPTIVE_TRUST_THRESHOLD = 10      # Credibilità minima per contare un dominio (high_trust e fact_checkers)
+ADAPTIVE_MIN_TRUSTED_DOMAINS = 2   # Sotto questa soglia si passa alla ricerca advanced
+# Fan-out del recupero: il Pianificatore genera più query diverse, eseguite in parallelo
+# e fuse con la Reciprocal Rank Fusion prima del re-ranking (1 = una sola query)
+QUERY_FANOUT = int(os.getenv("QUERY_FANOUT", 1))
+RRF_K = 60                         # Costante di smorzamento della RRF
+# Percorso veloce: ricerca sulla query template ("claim" fact-check) in parallelo al
+# Pianificatore; se la copertura affidabile basta il Pianificatore viene annullato
+PLANNER_BYPASS = os.getenv("PLANNER_BYPASS", "0") == "1"
+PLANNER_BYPASS_MIN_TRUSTED_DOMAINS = 3
+TEMPLATE_QUERY_MAX_CHARS = 300     # I post lunghi vengono troncati a fine parola
 TOP_K_ARTICLES = 30      # Passiamo i migliori 20 all'LLM
+# Fusione del re-ranker: peso di credibilità (1-10), score Tavily (0-1) e BM25 normalizzato (0-1).
+# Con questi pesi la rilevanza lessicale riordina solo all'interno della stessa fascia di credibilità.
+RERANK_WEIGHTS = {"credibility": 10.0, "relevance": 1.0, "lexical": 5.0}
+RERANK_CANDIDATES = 60   # Candidati estratti dal re-ranker (margine per i quasi duplicati scartati prima del Giudice)
+EVIDENCE_DEDUP_THRESHOLD = 0.8  # Jaccard stimata oltre cui due frammenti sono copie della stessa notizia
+CONTEXT_TOKEN_BUDGET = 8000  # Token massimi del contesto passato al Giudice
+MAX_SNIPPET_TOKENS = 400     # Oltre questa soglia un frammento viene troncato a fine frase
+
+# Cache su disco delle ricerche Tavily (modalità: read_write, read_only, bypass)
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', 'cache')
+RETRIEVAL_CACHE_PATH = os.path.join(CACHE_DIR, 'tavily.sqlite')
+RETRIEVAL_CACHE_MODE = os.getenv("RETRIEVAL_CACHE_MODE", "read_write")
+RETRIEVAL_CACHE_TTL = 30 * 24 * 3600        # Secondi (30 giorni)
+RETRIEVAL_CACHE_MAX_BYTES = 1024 ** 3       # 1 GB, oltre si eliminano le voci meno usate
+
+# Memoizzazione delle risposte LLM (Pianificatore e Giudice)
+LLM_CACHE_PATH = os.path.join(CACHE_DIR, 'llm.sqlite')
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "read_write")
+LLM_CACHE_MAX_BYTES = 512 * 1024 ** 2       # 512 MB
+
+# Cassette di registrazione/riproduzione del traffico Tavily e OpenAI (modalità: off, record, replay)
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")
+CASSETTE_PATH = os.getenv("CASSETTE_PATH") or os.path.join(CACHE_DIR, 'cassettes', 'session.jsonl.gz')
+CASSETTE_LATENCY = os.getenv("CASSETTE_LATENCY", "")  # vuoto, "recorded" o secondi fissi (solo replay)
+
+# Resilienza delle chiamate ai provider (fact_checker/resilience.py):
+# richieste al secondo e raffica massima per provider, retry con backoff e circuit breaker
+PROVIDER_LIMITS = {
+    "openai": {"rate": float(os.getenv("OPENAI_RPS", 8)), "burst": 16},
+    "tavily": {"rate": float(os.getenv("TAVILY_RPS", 15)), "burst": 15},
+    "novita": {"rate": float(os.getenv("NOVITA_RPS", 0.33)), "burst": 1},
+    "factbase": {"rate": float(os.getenv("FACTBASE_RPS", 4)), "burst": 4},   # API di trump-truth/scrape_api.py
+}
+RETRY_MAX_ATTEMPTS = 5         # Tentativi totali per chiamata
+RETRY_BASE_DELAY = 1.0         # Secondi, raddoppiati a ogni tentativo (con jitter)
+RETRY_MAX_DELAY = 60.0
+CIRCUIT_FAILURE_THRESHOLD = 8  # Errori temporanei consecutivi prima di aprire il circuito
+CIRCUIT_RESET_SECONDS = 30.0   # Durata dell'apertura prima della chiamata di prova
+
+# Registro dei costi: prezzi in USD (modelli per 1M token, Tavily per chiamata)
+MODEL_PRICES = {
+    "gpt-4.1-mini": {"input": 0.40, "output": 1.60},
+    "gpt-5-mini": {"input": 0.25, "output": 2.00},
+}
+TAVILY_PRICES = {"basic": 0.008, "advanced": 0.016}  # 1 o 2 crediti da $0.008
+COST_LEDGER_PATH = os.getenv("COST_LEDGER_PATH") or os.path.join(os.path.dirname(__file__), '..', 'output', 'cost_ledger.json')
+DEFAULT_COST_PER_CLAIM = 0.015  # Stima usata finché non ci sono costi reali registrati
+# Budget per esecuzione (vuoto = nessun limite). Con un budget i batch partono senza conferma.
+COST_BUDGET_USD = float(os.getenv("COST_BUDGET_USD") or 0) or None
+COST_BUDGET_TOKENS = int(os.getenv("COST_BUDGET_TOKENS") or 0) or None
+
+# Impostazioni batch
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", 8))  # Claim elaborati in parallelo da FactCheckPipeline.run_many
+METRICS_DIR = os.getenv("METRICS_DIR") or os.path.join(os.path.dirname(__file__), '..', 'output', 'metrics')  # JSONL per claim + riepiloghi
+PLANNER_BATCH_SIZE = 10 # Claim pianificati con una sola chiamata al Pianificatore (1 = nessun batch)
+NEAR_DUPLICATE_THRESHOLD = 0.9  # Jaccard stimata oltre cui un post riusa il verdetto di uno già verificato
+# Archivio colonnare dei risultati (fact_checker/results_store.py)
+RESULTS_TOP_K_EVIDENCE = 10  # Articoli del contesto salvati per claim (URL e punteggio del re-ranking)
+# Un file Parquet ogni N claim o T secondi, come il commit del checkpoint (fact_checker/checkpoint.py)
+RESULTS_FLUSH_EVERY = 25
+RESULTS_FLUSH_INTERVAL = 5.0
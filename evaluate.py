@@ -1,47 +1,78 @@
+import asyncio
 import csv
 import os
 from fact_checker.pipeline import FactCheckPipeline
+from fact_checker.checkpoint import open_checkpoint
+from fact_checker.results_store import open_results
+from config.settings import MAX_CONCURRENCY
 
 
 # 1. Specifica il percorso del tuo file CSV di PolitiFact
 INPUT_FILE_PATH = "data/politifact.csv"
 
-# 2. Questo sarà il nostro file di output e di checkpoint
+# 2. Questo sarà il nostro file di output, rigenerato dal checkpoint indicizzato
 OUTPUT_FILE_PATH = "output/evaluation_results.csv"
+CHECKPOINT_PATH = "output/evaluation_results.sqlite"
+# Archivio Parquet con verdetti, tempi, token e prove (URL e score) di ogni claim
+RESULTS_DATASET = "output/evaluation_results"
 
 # 3. Quante *nuove* righe vogliamo processare in questo batch
 EVALUATION_LIMIT = 250
 
-# 4. Le colonne del nostro file di output
+# 4. Le colonne del nostro file di output (KEY_FIELD identifica il claim nel checkpoint)
 OUTPUT_HEADERS = ['claim', 'politifact_label', 'rag_label', 'rag_motivation']
+KEY_FIELD = 'claim'
 
 
+def iter_input_jobs():
+    """
+    Legge il CSV di PolitiFact in streaming e produce un job per ogni claim
+    (vedi FactCheckPipeline.run_many), nell'ordine del file.
+    """
+    with open(INPUT_FILE_PATH, mode='r', encoding='utf-8') as infile:
+        # Usiamo DictReader per leggere facilmente le colonne per nome
+        reader = csv.DictReader(infile)
+
+        for row in reader:
+            # Estrai i dati dal CSV di PolitiFact
+            claim = row.get('quote', '').strip().replace('â\x80\x9c', '“').replace('â\x80\x9d', '”')
+
+            if not claim:
+                continue # Salta righe vuote
+            
+            # --- NUOVA PARTE: ESTRAZIONE METADATI ---
+            metadata = {
+                'author': row.get('author', '').strip(),
+                'context': row.get('context', '').strip(),
+                'date': row.get('date', '').strip()
+            }
+
+            yield {'claim': claim, 'metadata': metadata, 'politifact_label': row.get('rating_label', '').strip()}
+
+def build_output_row(job, rag_result):
+    return {
+        'claim': job['claim'],
+        'politifact_label': job['politifact_label'],
+        'rag_label': rag_result.get('verdetto'),
+        'rag_motivation': rag_result.get('motivazione')
+    }
+
 def load_processed_claims(filepath):
     """
-    Legge il file di output per capire quali claim abbiamo GIA' processato.
-    Questo è il nostro meccanismo di CHECKPOINT.
+    Apre il checkpoint per capire quali claim abbiamo GIA' processato.
+    Questo è il nostro meccanismo di CHECKPOINT: un indice SQLite per impronta
+    del claim (vedi fact_checker/checkpoint.py), inizializzato dal CSV di output
+    se esiste già.
     """
-    processed_claims = set()
-    
     # Assicurati che la cartella 'output/' esista
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    
-    try:
-        with open(filepath, mode='r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if 'claim' in row:
-                    processed_claims.add(row['claim'])
-        print(f"Trovati {len(processed_claims)} claim già processati. Saranno saltati.")
-    except FileNotFoundError:
-        # È la prima esecuzione, il file non esiste ancora.
-        print("File di output non trovato. Inizio una nuova esecuzione.")
-        # Creiamo il file e scriviamo l'intestazione
-        with open(filepath, mode='w', encoding='utf-8', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=OUTPUT_HEADERS)
-            writer.writeheader()
-    
-    return processed_claims
+
+    store = open_checkpoint(CHECKPOINT_PATH, filepath, key_field=KEY_FIELD)
+    if len(store):
+        print(f"Trovati {len(store)} claim già processati. Saranno saltati.")
+    else:
+        print("Nessun checkpoint trovato. Inizio una nuova esecuzione.")
+    return store
 
 def run_evaluation():
     """
@@ -53,68 +84,50 @@ def run_evaluation():
         return
 
     # 1. Carica i claim già processati per il checkpoint
-    processed_claims = load_processed_claims(OUTPUT_FILE_PATH)
+    checkpoint = load_processed_claims(OUTPUT_FILE_PATH)
+    results = open_results(RESULTS_DATASET, OUTPUT_FILE_PATH, KEY_FIELD, checkpoint=checkpoint)
     
     # 2. Inizializza la pipeline RAG
     pipeline = FactCheckPipeline()
     
+    # 3. Leggiamo l'input e prepariamo il batch di claim ancora da processare
+    jobs = []
+    batch_claims = set()
+    for job in iter_input_jobs():
+        # 4. LOGICA DI CHECKPOINT:
+        if job['claim'] in checkpoint or job['claim'] in batch_claims:
+            continue # Già fatto (o già nel batch), salta
+
+        # 5. LOGICA DI BATCH:
+        if len(jobs) >= EVALUATION_LIMIT:
+            print(f"Limite di {EVALUATION_LIMIT} nuove righe raggiunto. Interrompo il batch.")
+            break
+
+        batch_claims.add(job['claim'])
+        jobs.append(job)
+
     new_rows_processed = 0
-    
-    # 3. Apri entrambi i file: leggiamo dall'input e scriviamo (in append) sull'output
+
+    # 6. Esegui il RAG in parallelo (Queste sono le chiamate API a pagamento!)
     try:
-        with open(INPUT_FILE_PATH, mode='r', encoding='utf-8') as infile, \
-             open(OUTPUT_FILE_PATH, mode='a', encoding='utf-8', newline='') as outfile:
-            
-            # Usiamo DictReader per leggere facilmente le colonne per nome
-            reader = csv.DictReader(infile)
-            
-            # Usiamo DictWriter per scrivere facilmente le colonne per nome
-            writer = csv.DictWriter(outfile, fieldnames=OUTPUT_HEADERS)
-
-            for row in reader:
-                # 4. Estrai i dati dal CSV di PolitiFact
-                claim = row.get('quote', '').strip().replace('â\x80\x9c', '“').replace('â\x80\x9d', '”')
-                politifact_label = row.get('rating_label', '').strip()
-                
-                # --- NUOVA PARTE: ESTRAZIONE METADATI ---
-                metadata = {
-                    'author': row.get('author', '').strip(),
-                    'context': row.get('context', '').strip(),
-                    'date': row.get('date', '').strip()
-                }
-
-                if not claim:
-                    continue # Salta righe vuote
-
-                # 5. LOGICA DI CHECKPOINT:
-                if claim in processed_claims:
-                    continue # Già fatto, salta
-
-                # 6. LOGICA DI BATCH:
-                if new_rows_processed >= EVALUATION_LIMIT:
-                    print(f"Limite di {EVALUATION_LIMIT} nuove righe raggiunto. Interrompo il batch.")
-                    break # Abbiamo finito il nostro batch da 100
-
-                # 7. Esegui il RAG (Questa è la chiamata API a pagamento!)
-                print(f"Processing ({new_rows_processed + 1}/{EVALUATION_LIMIT}): {claim[:70]}...")
-                rag_result = pipeline.run(claim, metadata)
-                
-                # 8. Prepara la riga di output
-                output_row = {
-                    'claim': claim,
-                    'politifact_label': politifact_label,
-                    'rag_label': rag_result.get('verdetto'),
-                    'rag_motivation': rag_result.get('motivazione')
-                }
-                
-                # 9. Scrivi il risultato IMMEDIATAMENTE (salva i progressi)
-                writer.writerow(output_row)
-                processed_claims.add(claim) # Aggiorna il nostro set in memoria
-                new_rows_processed += 1
+        def save_result(job, rag_result):
+            # 7. Registra il risultato IMMEDIATAMENTE nel checkpoint (commit a gruppi)
+            checkpoint.add(build_output_row(job, rag_result))
+            results.add(job['claim'], rag_result, politifact_label=job['politifact_label'])
+
+        print(f"Avvio di {len(jobs)} claim con concorrenza {MAX_CONCURRENCY} "
+              f"(costo stimato ~${pipeline.ledger.project(len(jobs)):.2f})...")
+        new_rows_processed = asyncio.run(pipeline.run_many(jobs, on_result=save_result))
 
     except Exception as e:
         print(f"\nERRORE durante l'elaborazione: {e}")
-        print("Il processo è stato interrotto, ma i risultati finora ottenuti sono salvi in " + OUTPUT_FILE_PATH)
+        print("Il processo è stato interrotto, ma i risultati finora ottenuti sono salvi in " + CHECKPOINT_PATH)
+
+    finally:
+        # 8. Rigenera il CSV di output dal checkpoint (scrittura atomica)
+        checkpoint.export_csv(OUTPUT_FILE_PATH, OUTPUT_HEADERS)
+        checkpoint.close()
+        results.close()
 
     print(f"\nValutazione batch completata. {new_rows_processed} nuove righe processate.")
 
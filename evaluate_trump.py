@@ -1,11 +1,22 @@
+import asyncio
 import csv
 import os
 import sys
 from fact_checker.pipeline import FactCheckPipeline
+from fact_checker.dedup import ClaimDeduplicator, LSHIndex
+from fact_checker.checkpoint import open_checkpoint
+from fact_checker.results_store import open_results
+from fact_checker.costs import CostLedger
+from config.settings import MAX_CONCURRENCY, NEAR_DUPLICATE_THRESHOLD
 
 # --- IMPOSTAZIONI ---
 INPUT_FILE_PATH = "trump-truth/trump_posts_classified.csv"
 OUTPUT_FILE_PATH = "output/trump_results.csv"
+CHECKPOINT_PATH = "output/trump_results.sqlite"
+# Archivio Parquet con verdetti, tempi, token e prove (URL e score) di ogni claim
+RESULTS_DATASET = "output/trump_results"
+# Indice dei quasi-duplicati (firme MinHash) derivato dal checkpoint
+DEDUP_INDEX_PATH = "output/trump_results.lsh.sqlite"
 
 # Nomi colonne confermati dal debug
 TEXT_COLUMN = 'post_text'      
@@ -16,6 +27,7 @@ TARGET_LABEL = 'CLAIM'
 BATCH_SIZE = 500 
 
 OUTPUT_HEADERS = ['claim_text', 'rag_label', 'rag_motivation']
+KEY_FIELD = 'claim_text'
 
 # Aumenta limite CSV
 try:
@@ -23,60 +35,81 @@ try:
 except OverflowError:
     csv.field_size_limit(sys.maxsize // 10)
 
-def count_remaining_work(filepath, class_col, target_val, processed_set):
+def iter_input_jobs():
+    """
+    Legge in streaming il CSV classificato e produce un job (vedi
+    FactCheckPipeline.run_many) per ogni post etichettato come CLAIM.
+    """
+    # USA utf-8-sig PER GESTIRE IL BOM (\ufeff)
+    with open(INPUT_FILE_PATH, mode='r', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        
+        # Verifica preliminare colonne
+        if TEXT_COLUMN not in (reader.fieldnames or []):
+            raise ValueError(f"La colonna '{TEXT_COLUMN}' non esiste nel CSV! Colonne trovate: {reader.fieldnames}")
+
+        for i, row in enumerate(reader):
+            # È un CLAIM?
+            if row.get(CLASS_COLUMN, '').strip() != TARGET_LABEL:
+                continue
+            
+            claim_txt = row.get(TEXT_COLUMN, '').strip()
+            
+            # DEBUG: Se trova il claim ma il testo è vuoto
+            if not claim_txt:
+                print(f"⚠️ ATTENZIONE: Riga {i+2} è CLASSIFIED come CLAIM ma il testo è vuoto!")
+                continue
+
+            metadata = {}
+            # Se nel CSV hai la data, puoi passarla:
+            if 'date' in row: metadata['date'] = row['date']
+
+            yield {'claim': claim_txt, 'metadata': metadata}
+
+def build_output_row(job, rag_result):
+    return {
+        'claim_text': job['claim'],
+        'rag_label': rag_result.get('verdetto'),
+        'rag_motivation': rag_result.get('motivazione')
+    }
+
+def scan_input(checkpoint, batch_size):
+    """
+    Unico passaggio in streaming sul file di input: conta i claim totali e
+    quelli rimanenti, e intanto raccoglie i primi `batch_size` job da processare.
+    Restituisce (totale_claim, rimanenti, candidati).
+    """
     total_claims_in_file = 0
     claims_left_to_do = 0
+    candidates = []
+    seen_in_batch = set()
     
-    if not os.path.exists(filepath):
-        return 0, 0
+    if not os.path.exists(INPUT_FILE_PATH):
+        return 0, 0, []
 
     try:
-        # USA utf-8-sig PER GESTIRE IL BOM (\ufeff)
-        with open(filepath, mode='r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            
-            # Verifica preliminare colonne
-            if TEXT_COLUMN not in reader.fieldnames:
-                print(f"❌ ERRORE FATALE: La colonna '{TEXT_COLUMN}' non esiste nel CSV!")
-                print(f"Colonne trovate: {reader.fieldnames}")
-                return 0, 0
-
-            for i, row in enumerate(reader):
-                # È un CLAIM?
-                if row.get(class_col, '').strip() == target_val:
-                    total_claims_in_file += 1
-                    
-                    claim_txt = row.get(TEXT_COLUMN, '').strip()
-                    
-                    # DEBUG: Se trova il claim ma il testo è vuoto
-                    if not claim_txt:
-                        print(f"⚠️ ATTENZIONE: Riga {i+2} è CLASSIFIED come CLAIM ma il testo è vuoto!")
-                        continue
-
-                    # È già stato fatto?
-                    if claim_txt not in processed_set:
-                        claims_left_to_do += 1
+        for job in iter_input_jobs():
+            total_claims_in_file += 1
+
+            # È già stato fatto?
+            if job['claim'] in checkpoint or job['claim'] in seen_in_batch:
+                continue
+            claims_left_to_do += 1
+
+            if len(candidates) < batch_size:
+                candidates.append(job)
+                seen_in_batch.add(job['claim'])
                         
     except Exception as e:
         print(f"Errore lettura preliminare: {e}")
-        return 0, 0
+        return 0, 0, []
         
-    return total_claims_in_file, claims_left_to_do
+    return total_claims_in_file, claims_left_to_do, candidates
 
 def load_processed_claims(filepath):
-    processed = set()
+    """Apre il checkpoint indicizzato (inizializzato dal CSV di output se esiste già)."""
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    try:
-        with open(filepath, mode='r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if 'claim_text' in row:
-                    processed.add(row['claim_text'])
-    except FileNotFoundError:
-        with open(filepath, mode='w', encoding='utf-8', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=OUTPUT_HEADERS)
-            writer.writeheader()
-    return processed
+    return open_checkpoint(CHECKPOINT_PATH, filepath, key_field=KEY_FIELD)
 
 def run_batch_evaluation():
     if not os.path.exists(INPUT_FILE_PATH):
@@ -84,23 +117,38 @@ def run_batch_evaluation():
         return
 
     print("--- 1. Caricamento Checkpoint ---")
-    processed_claims = load_processed_claims(OUTPUT_FILE_PATH)
-    print(f"Claim già analizzati e salvati: {len(processed_claims)}")
+    checkpoint = load_processed_claims(OUTPUT_FILE_PATH)
+    print(f"Claim già analizzati e salvati: {len(checkpoint)}")
+    results = open_results(RESULTS_DATASET, OUTPUT_FILE_PATH, KEY_FIELD, checkpoint=checkpoint)
 
+    try:
+        process_batch(checkpoint, results)
+    finally:
+        # Il CSV di output viene rigenerato dal checkpoint in modo atomico
+        checkpoint.export_csv(OUTPUT_FILE_PATH, OUTPUT_HEADERS)
+        checkpoint.close()
+        results.close()
+
+def process_batch(checkpoint, results):
     print(f"Analisi del file di input...")
-    total_claims, remaining = count_remaining_work(INPUT_FILE_PATH, CLASS_COLUMN, TARGET_LABEL, processed_claims)
+    total_claims, remaining, candidates = scan_input(checkpoint, BATCH_SIZE)
 
-    to_process_now = min(remaining, BATCH_SIZE)
+    to_process_now = len(candidates)
 
     print("\n" + "="*60)
     print(f"📊 STATO DEL PROGETTO")
     print(f"   Totale Claim nel file:      {total_claims}")
-    print(f"   Già completati:             {len(processed_claims)}")
+    print(f"   Già completati:             {len(checkpoint)}")
     print(f"   Rimanenti da fare:          {remaining}")
     print("-" * 60)
     print(f"📦 BATCH CORRENTE:             {to_process_now} claim")
-    est_cost = to_process_now * 0.015
-    print(f"💰 Costo stimato per questo batch: ~${est_cost:.2f}")
+    # Stima dalla media reale per claim delle esecuzioni precedenti (vedi fact_checker/costs.py)
+    ledger = CostLedger()
+    print(f"💰 Costo stimato per questo batch: ~${ledger.project(to_process_now):.2f} "
+          f"(${ledger.average_cost_per_claim():.4f}/claim)")
+    print(f"   Costo stimato per tutti i rimanenti: ~${ledger.project(remaining):.2f}")
+    if ledger.budget_usd is not None or ledger.budget_tokens is not None:
+        print(f"⛔ Budget: ${ledger.budget_usd or '-'} / {ledger.budget_tokens or '-'} token")
     print("="*60)
 
     if to_process_now == 0:
@@ -110,58 +158,72 @@ def run_batch_evaluation():
              print("❌ Non ho trovato nessun CLAIM nel file. Controlla la colonna 'classification'.")
         return
 
-    confirm = input(f"\nVuoi avviare l'analisi per questo blocco di {to_process_now} claim? (s/n): ").lower()
-    if confirm != 's':
-        print("Operazione annullata.")
-        return
+    # Con un budget configurato il batch è protetto dal registro dei costi: nessuna conferma
+    if ledger.budget_usd is None and ledger.budget_tokens is None:
+        confirm = input(f"\nVuoi avviare l'analisi per questo blocco di {to_process_now} claim? (s/n): ").lower()
+        if confirm != 's':
+            print("Operazione annullata.")
+            return
 
     print("\n🚀 Avvio Pipeline RAG...")
-    pipeline = FactCheckPipeline()
+    pipeline = FactCheckPipeline(ledger=ledger)
     new_processed_count = 0
+
+    # Indice dei claim già verificati: i post quasi identici ne riutilizzano il verdetto.
+    # Si indicizzano solo le righe del checkpoint aggiunte dall'ultima esecuzione
+    deduplicator = ClaimDeduplicator(checkpoint, DEDUP_INDEX_PATH, threshold=NEAR_DUPLICATE_THRESHOLD)
+    indexed = deduplicator.sync()
+    if indexed:
+        print(f"Indice dei quasi-duplicati aggiornato: {indexed} claim aggiunti.")
+
+    def write_row(claim, rag_result, source='pipeline'):
+        # Ogni riga entra nel checkpoint (commit a gruppi): un crash non perde i claim già pagati
+        checkpoint.add(build_output_row({'claim': claim}, rag_result))
+        results.add(claim, rag_result, source=source)
+
+    def save_result(job, rag_result):
+        write_row(job['claim'], rag_result)
+        deduplicator.add(job['claim'], rag_result)
+        for duplicate in job['duplicates']:
+            reused = deduplicator.reuse(duplicate)
+            # Se il verdetto non è riutilizzabile (es. ERRORE) il duplicato verrà ritentato
+            if reused is not None:
+                write_row(duplicate, reused, source='reused')
     
     try:
-        # Usa utf-8-sig anche qui
-        with open(INPUT_FILE_PATH, mode='r', encoding='utf-8-sig') as infile, \
-             open(OUTPUT_FILE_PATH, mode='a', encoding='utf-8', newline='') as outfile:
-            
-            reader = csv.DictReader(infile)
-            writer = csv.DictWriter(outfile, fieldnames=OUTPUT_HEADERS)
-
-            for row in reader:
-                if new_processed_count >= to_process_now:
-                    break
-
-                classification = row.get(CLASS_COLUMN, '').strip()
-                claim = row.get(TEXT_COLUMN, '').strip()
-
-                if classification != TARGET_LABEL: continue
-                if not claim: continue
-                if claim in processed_claims: continue
-
-                print(f"[{new_processed_count + 1}/{to_process_now}] Analisi: {claim[:50]}...")
-                
-                # --- ESECUZIONE RAG ---
-                metadata = {} 
-                # Se nel CSV hai la data, puoi passarla:
-                if 'date' in row: metadata['date'] = row['date']
-
-                rag_result = pipeline.run(claim, metadata)
-                
-                output_row = {
-                    'claim_text': claim,
-                    'rag_label': rag_result.get('verdetto'),
-                    'rag_motivation': rag_result.get('motivazione')
-                }
-                
-                writer.writerow(output_row)
-                processed_claims.add(claim) 
-                new_processed_count += 1
+        jobs = []
+        pending = LSHIndex(threshold=NEAR_DUPLICATE_THRESHOLD)
+        for candidate in candidates:
+            claim = candidate['claim']
+            # Quasi-duplicato di un claim già verificato: nessuna chiamata API
+            reused = deduplicator.reuse(claim)
+            if reused is not None:
+                write_row(claim, reused, source='reused')
+                continue
+
+            # Quasi-duplicato di un claim di questo stesso batch: aspetta il suo verdetto
+            leaders = pending.query(claim)
+            if leaders:
+                leaders[0][1]['duplicates'].append(claim)
+                continue
+
+            job = {**candidate, 'duplicates': []}
+            pending.add(claim, claim, job)
+            jobs.append(job)
+
+        # --- ESECUZIONE RAG (in parallelo) ---
+        print(f"Concorrenza: {MAX_CONCURRENCY} claim in parallelo.")
+        new_processed_count = asyncio.run(pipeline.run_many(jobs, on_result=save_result))
 
     except Exception as e:
         print(f"\n❌ ERRORE CRITICO: {e}")
         return
+    finally:
+        deduplicator.close()
 
     print(f"\n✅ Batch completato! {new_processed_count} claim salvati.")
+    print(f"♻️  Quasi-duplicati riutilizzati: {deduplicator.reused} "
+          f"(chiamate API risparmiate: {deduplicator.calls_saved})")
 
 if __name__ == "__main__":
     run_batch_evaluation()
\ No newline at end of file
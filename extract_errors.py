@@ -1,42 +1,44 @@
 import csv
-import os
+from fact_checker.results_store import read_results
 
 # --- CONFIGURAZIONE ---
-INPUT_FILE = "output/evaluation_results.csv"  
+# Archivio Parquet scritto da evaluate.py (che vi importa anche il CSV di output già esistente)
+INPUT_DATASET = "output/evaluation_results"
 OUTPUT_FILE = "output/falsi_positivi.csv"     
 
 # Definizioni per l'analisi "Tollerante"
 RAG_POSITIVE = 'SUPPORTED'
 PF_NEGATIVE_LABELS = {'false', 'pants-on-fire', 'mostly-false'}
+
+# Colonne esportate: oltre al verdetto, le fonti (URL e score) che lo hanno determinato
+OUTPUT_COLUMNS = ['claim', 'politifact_label', 'rag_label', 'rag_motivation', 'evidence_urls', 'evidence_scores']
 # ----------------------
 
 def extract_false_positives():
-    if not os.path.exists(INPUT_FILE):
-        print(f"Errore: File {INPUT_FILE} non trovato.")
-        return
-
     fp_count = 0
     
     try:
-        with open(INPUT_FILE, mode='r', encoding='utf-8') as infile, \
-             open(OUTPUT_FILE, mode='w', encoding='utf-8', newline='') as outfile:
-            
-            reader = csv.DictReader(infile)
-            # Copiamo le intestazioni originali
-            writer = csv.DictWriter(outfile, fieldnames=reader.fieldnames)
+        print(f"Analisi di {INPUT_DATASET} in corso...")
+        df = read_results(INPUT_DATASET, columns=OUTPUT_COLUMNS)
+        if df is None:
+            print(f"Errore: Archivio dei risultati non trovato: {INPUT_DATASET}")
+            print("Esegui prima evaluate.py (o 'python run_sharded.py politifact --merge-only' per importare solo il CSV di output).")
+            return
+
+        # Logica Falso Positivo:
+        # RAG dice "SUPPORTED" MA PolitiFact dice "Falso/Pants-on-fire/Mostly-false"
+        rag_labels = df['rag_label'].fillna('').str.upper().str.strip()
+        pf_labels = df['politifact_label'].fillna('').str.lower().str.strip()
+        false_positives = df[(rag_labels == RAG_POSITIVE) & pf_labels.isin(PF_NEGATIVE_LABELS)]
+
+        with open(OUTPUT_FILE, mode='w', encoding='utf-8', newline='') as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=OUTPUT_COLUMNS)
             writer.writeheader()
-
-            print(f"Analisi di {INPUT_FILE} in corso...")
-
-            for row in reader:
-                rag_label = row.get('rag_label', '').upper().strip()
-                pf_label = row.get('politifact_label', '').lower().strip()
-
-                # Logica Falso Positivo:
-                # RAG dice "SUPPORTED" MA PolitiFact dice "Falso/Pants-on-fire/Mostly-false"
-                if rag_label == RAG_POSITIVE and pf_label in PF_NEGATIVE_LABELS:
-                    writer.writerow(row)
-                    fp_count += 1
+            for row in false_positives.to_dict('records'):
+                row['evidence_urls'] = " | ".join(row['evidence_urls'] if row['evidence_urls'] is not None else [])
+                row['evidence_scores'] = " | ".join(f"{score:.3f}" for score in (row['evidence_scores'] if row['evidence_scores'] is not None else []))
+                writer.writerow(row)
+                fp_count += 1
 
         print(f"\n✅ Estrazione completata.")
         print(f"Trovati {fp_count} Falsi Positivi.")
@@ -46,4 +48,4 @@ def extract_false_positives():
         print(f"Errore durante l'elaborazione: {e}")
 
 if __name__ == "__main__":
-    extract_false_positives()
\ No newline at end of file
+    extract_false_positives()
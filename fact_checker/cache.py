@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Modalità di funzionamento della cache
+CACHE_READ_WRITE = "read_write"  # Legge dalla cache e salva le nuove risposte
+CACHE_READ_ONLY = "read_only"    # Legge dalla cache ma non scrive mai (utile per replay condivisi)
+CACHE_BYPASS = "bypass"          # Ignora completamente la cache
+
+CACHE_MODES = {CACHE_READ_WRITE, CACHE_READ_ONLY, CACHE_BYPASS}
+
+# Granularità (secondi) dell'ora di ultimo accesso usata per l'LRU: un hit aggiorna
+# accessed_at solo se è più vecchio di così, e la scrittura è rimandata al prossimo set()
+ACCESS_TOUCH_INTERVAL = 3600
+
+
+def make_cache_key(payload):
+    """Hash SHA-256 stabile di un oggetto JSON-serializzabile (chiavi ordinate)."""
+    serialized = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def normalize_query(query):
+    """Normalizza una query di ricerca: spazi compattati e minuscolo."""
+    return " ".join((query or "").split()).lower()
+
+
+class DiskCache:
+    """
+    Cache chiave/valore persistente su SQLite, indirizzata per contenuto.
+    Supporta scadenza (TTL) ed evizione LRU quando la dimensione totale
+    supera `max_bytes`. I valori devono essere JSON-serializzabili.
+    """
+
+    def __init__(self, path, mode=CACHE_READ_WRITE, ttl_seconds=None, max_bytes=None):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Modalità cache non valida: '{mode}'. Valori ammessi: {sorted(CACHE_MODES)}")
+
+        self.path = path
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+        self._touched = {}  # key -> ora di accesso non ancora scritta su disco
+        self.hits = 0
+        self.misses = 0
+
+        if self.mode == CACHE_BYPASS:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        """
+        Restituisce il valore salvato per `key`, oppure None se assente o scaduto.
+        Non scrive mai su disco: le voci scadute vengono rimosse da _evict() e
+        l'ora di accesso viene solo annotata (vedi ACCESS_TOUCH_INTERVAL).
+        """
+        if self._conn is None:
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at, accessed_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            value, created_at, accessed_at = row
+            now = time.time()
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self.misses += 1
+                return None
+
+            if self.mode == CACHE_READ_WRITE and now - accessed_at > ACCESS_TOUCH_INTERVAL:
+                self._touched[key] = now
+            self.hits += 1
+
+        return json.loads(value)
+
+    def set(self, key, value):
+        """Salva `value` sotto `key` (solo in modalità read_write)."""
+        if self._conn is None or self.mode != CACHE_READ_WRITE:
+            return
+
+        serialized = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, serialized, len(serialized.encode('utf-8')), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _flush_touched(self):
+        """Scrive le ore di accesso annotate dai get() (senza commit: lo fa il chiamante)."""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE cache SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _evict(self):
+        """Rimuove le voci scadute e poi le meno usate di recente finché si rientra in `max_bytes`."""
+        # L'ordine LRU deve tenere conto degli hit annotati finora
+        self._flush_touched()
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+
+        if self.max_bytes is None:
+            return
+
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM cache ORDER BY accessed_at ASC"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM cache WHERE key = ?", victims)
+
+    def invalidate(self, key):
+        """Elimina una singola voce. Restituisce True se esisteva."""
+        if self._conn is None or self.mode == CACHE_READ_ONLY:
+            return False
+
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount
+            self._conn.commit()
+        return deleted > 0
+
+    def clear(self):
+        """Svuota completamente la cache."""
+        if self._conn is None or self.mode == CACHE_READ_ONLY:
+            return
+
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def stats(self):
+        """Contatori di hit/miss dall'avvio del processo."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                if self._touched:
+                    self._flush_touched()
+                    self._conn.commit()
+            self._conn.close()
+            self._conn = None
+
+
+class MemoryCache:
+    """
+    Cache in memoria con la stessa interfaccia di DiskCache (get/set/invalidate/clear/stats).
+    Utile per i test o per run brevi in cui non serve persistenza.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if self.max_entries is not None:
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    stats = DiskCache.stats
+
+    def close(self):
+        pass
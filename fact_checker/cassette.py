@@ -0,0 +1,269 @@
+import asyncio
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+from .cache import make_cache_key
+from config.settings import CASSETTE_MODE, CASSETTE_PATH, CASSETTE_LATENCY
+
+# Modalità: off (client reali), record (client reali + registrazione), replay (solo cassetta)
+CASSETTE_MODES = ("off", "record", "replay")
+
+
+class CassetteMiss(KeyError):
+    """La richiesta non è presente nella cassetta (modalità replay)."""
+
+
+def _to_jsonable(obj):
+    """Converte una risposta dell'SDK (modello pydantic o oggetto semplice) in JSON."""
+    if hasattr(obj, 'model_dump'):
+        return obj.model_dump(mode='json')
+    if isinstance(obj, SimpleNamespace):
+        return {k: _to_jsonable(v) for k, v in vars(obj).items()}
+    if isinstance(obj, dict):
+        return {k: _to_jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_jsonable(v) for v in obj]
+    return obj
+
+
+def _to_namespace(data):
+    """Ricostruisce una risposta OpenAI navigabile ad attributi (response.choices[0].message...)."""
+    if isinstance(data, dict):
+        return SimpleNamespace(**{k: _to_namespace(v) for k, v in data.items()})
+    if isinstance(data, list):
+        return [_to_namespace(v) for v in data]
+    return data
+
+
+class Cassette:
+    """
+    Registrazione e riproduzione del traffico verso Tavily e OpenAI.
+
+    In modalità `record` ogni coppia richiesta/risposta (con la latenza
+    osservata) viene salvata in un file JSONL compresso con gzip; in modalità
+    `replay` le risposte vengono restituite dalla cassetta senza rete, nello
+    stesso ordine in cui sono state registrate per richieste identiche.
+
+    `latency` controlla la latenza simulata in replay: None (nessuna attesa),
+    "recorded" (la latenza registrata, moltiplicata per `latency_scale`)
+    oppure un numero fisso di secondi.
+
+    Nota: in replay conviene usare RETRIEVAL_CACHE_MODE / LLM_CACHE_MODE
+    "bypass", altrimenti le cache locali rispondono prima della cassetta.
+    """
+
+    def __init__(self, path, mode="replay", latency=None, latency_scale=1.0):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Modalità cassetta non valida: {mode} (attese: {', '.join(CASSETTE_MODES)})")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._positions = {}
+        self._recorded = []
+        self.hits = 0
+        self.misses = 0
+
+        if mode == "replay":
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Cassetta non trovata: {path}")
+            for entry in self._read(path):
+                self._entries.setdefault(entry["key"], []).append(entry)
+            print(f"Cassetta caricata: {sum(len(v) for v in self._entries.values())} interazioni da {path}")
+        elif mode == "record":
+            atexit.register(self.save)
+
+    @staticmethod
+    def _read(path):
+        with gzip.open(path, mode='rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    @staticmethod
+    def key(provider, request):
+        return make_cache_key({"provider": provider, "request": request})
+
+    def _next(self, provider, request):
+        key = self.key(provider, request)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                raise CassetteMiss(f"Richiesta {provider} non presente nella cassetta {self.path}")
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            self.hits += 1
+        # Richieste ripetute più volte di quante registrate: si ricomincia dalla prima
+        return entries[position % len(entries)]
+
+    def _delay(self, entry):
+        if self.latency is None:
+            return 0.0
+        if self.latency == "recorded":
+            return entry.get("elapsed", 0.0) * self.latency_scale
+        return float(self.latency)
+
+    def _record(self, provider, request, response, elapsed):
+        entry = {
+            "key": self.key(provider, request),
+            "provider": provider,
+            "request": request,
+            "response": _to_jsonable(response),
+            "elapsed": elapsed,
+        }
+        with self._lock:
+            self._recorded.append(entry)
+
+    def call(self, provider, request, live_call):
+        """Esegue (o riproduce) una chiamata sincrona."""
+        if self.mode == "replay":
+            entry = self._next(provider, request)
+            delay = self._delay(entry)
+            if delay:
+                time.sleep(delay)
+            return entry["response"]
+
+        started = time.perf_counter()
+        response = live_call()
+        if self.mode == "record":
+            self._record(provider, request, response, time.perf_counter() - started)
+        return response
+
+    async def acall(self, provider, request, live_call):
+        """Versione asincrona di call (`live_call` restituisce una coroutine)."""
+        if self.mode == "replay":
+            entry = self._next(provider, request)
+            delay = self._delay(entry)
+            if delay:
+                await asyncio.sleep(delay)
+            return entry["response"]
+
+        started = time.perf_counter()
+        response = await live_call()
+        if self.mode == "record":
+            self._record(provider, request, response, time.perf_counter() - started)
+        return response
+
+    def save(self):
+        """
+        Scrive le interazioni registrate, aggiungendole a quelle già presenti
+        nel file (scrittura atomica su file temporaneo).
+        """
+        with self._lock:
+            recorded, self._recorded = self._recorded, []
+        if not recorded:
+            return
+        previous = list(self._read(self.path)) if os.path.exists(self.path) else []
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with gzip.open(tmp_path, mode='wt', encoding='utf-8') as f:
+            for entry in previous + recorded:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+        print(f"Cassetta salvata: {len(recorded)} nuove interazioni in {self.path}")
+
+    def stats(self):
+        return {"mode": self.mode, "hits": self.hits, "misses": self.misses, "recorded": len(self._recorded)}
+
+
+class CassetteTavilyClient:
+    """Sostituto di TavilyClient/AsyncTavilyClient: espone solo `search`."""
+
+    def __init__(self, cassette, client=None, is_async=False):
+        self.cassette = cassette
+        self.client = client
+        self.is_async = is_async
+
+    def search(self, **params):
+        if self.is_async:
+            return self.cassette.acall("tavily", params, lambda: self.client.search(**params))
+        return self.cassette.call("tavily", params, lambda: self.client.search(**params))
+
+
+class CassetteOpenAIClient:
+    """Sostituto di OpenAI/AsyncOpenAI: espone solo `chat.completions.create`."""
+
+    def __init__(self, cassette, client=None, is_async=False):
+        self.cassette = cassette
+        self.client = client
+        self.is_async = is_async
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **request):
+        live_call = lambda: self.client.chat.completions.create(**request)
+        if self.is_async:
+            return self._acreate(request, live_call)
+        response = self.cassette.call("openai", request, live_call)
+        return _to_namespace(response) if self.cassette.mode == "replay" else response
+
+    async def _acreate(self, request, live_call):
+        response = await self.cassette.acall("openai", request, live_call)
+        return _to_namespace(response) if self.cassette.mode == "replay" else response
+
+
+_cassettes = {}
+
+def get_cassette(path=None, mode=None, latency=None):
+    """
+    Cassetta condivisa del processo (una per percorso), configurata da
+    CASSETTE_MODE / CASSETTE_PATH / CASSETTE_LATENCY se non specificato.
+    """
+    mode = mode or CASSETTE_MODE
+    path = path or CASSETTE_PATH
+    if latency is None and CASSETTE_LATENCY:
+        latency = CASSETTE_LATENCY if CASSETTE_LATENCY == "recorded" else float(CASSETTE_LATENCY)
+    if (path, mode) not in _cassettes:
+        _cassettes[(path, mode)] = Cassette(path, mode=mode, latency=latency)
+    return _cassettes[(path, mode)]
+
+class LoopLocalClient:
+    """
+    Client asincrono creato pigramente per l'event loop in esecuzione.
+    AsyncOpenAI e AsyncTavilyClient legano il pool HTTP al primo loop che lo
+    usa: con un client unico un secondo `asyncio.run` sulla stessa pipeline
+    (es. arun seguito da run_many) fallirebbe con "Event loop is closed".
+    Gli attributi vanno risolti dentro il loop (es. in una lambda passata a
+    guard.acall), quindi ogni loop ottiene un client nuovo.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._loop = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _current(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._loop is not loop:
+                # Il client del loop precedente (ormai chiuso) viene abbandonato
+                self._client = self._factory()
+                self._loop = loop
+            return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._current(), name)
+
+
+def wrap_clients(provider, make_sync, make_async, cassette=None):
+    """
+    Restituisce la coppia (client sincrono, client asincrono) per `provider`
+    ("tavily" o "openai") secondo la modalità della cassetta. In replay i
+    client reali non vengono nemmeno creati, quindi non servono chiavi API.
+    Il client asincrono reale viene creato per ogni event loop (LoopLocalClient).
+    """
+    cassette = cassette or get_cassette()
+    if cassette.mode == "off":
+        return make_sync(), LoopLocalClient(make_async)
+
+    wrapper = CassetteTavilyClient if provider == "tavily" else CassetteOpenAIClient
+    if cassette.mode == "replay":
+        return wrapper(cassette), wrapper(cassette, is_async=True)
+    return wrapper(cassette, make_sync()), wrapper(cassette, LoopLocalClient(make_async), is_async=True)
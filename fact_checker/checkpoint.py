@@ -0,0 +1,156 @@
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+
+def content_hash(text):
+    """Impronta a 64 bit (con segno, per SQLite) del testo di un claim."""
+    digest = hashlib.blake2b((text or "").strip().encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+class CheckpointStore:
+    """
+    Checkpoint indicizzato delle valutazioni, su SQLite in modalità WAL.
+
+    Ogni riga è indicizzata dall'impronta a 64 bit del testo del claim: le
+    impronte sono tenute anche in un set in memoria, quindi il controllo
+    "già fatto?" è O(1) senza tenere in RAM i testi. Le scritture sono
+    raggruppate (group commit) e rese durevoli ogni `commit_every` righe o
+    `commit_interval` secondi. Il CSV di output viene rigenerato in modo
+    atomico da `export_csv`, quindi un crash non lo lascia mai a metà riga.
+    """
+
+    def __init__(self, path, key_field, commit_every=25, commit_interval=5.0):
+        self.path = path
+        self.key_field = key_field
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL: ogni commit (cioè ogni gruppo di righe) viene sincronizzato su disco
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoint ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " hash INTEGER NOT NULL UNIQUE,"
+            " row TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self._hashes = {h for (h,) in self._conn.execute("SELECT hash FROM checkpoint")}
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, key):
+        return content_hash(key) in self._hashes
+
+    def add(self, row):
+        """Registra una riga di output; il commit avviene a gruppi."""
+        key_hash = content_hash(row[self.key_field])
+        if key_hash in self._hashes:
+            return False
+
+        self._conn.execute(
+            "INSERT OR IGNORE INTO checkpoint (hash, row) VALUES (?, ?)",
+            (key_hash, json.dumps(row, ensure_ascii=False))
+        )
+        self._hashes.add(key_hash)
+        self._pending += 1
+        if self._pending >= self.commit_every or time.monotonic() - self._last_commit >= self.commit_interval:
+            self.flush()
+        return True
+
+    def flush(self):
+        if self._pending:
+            self._conn.commit()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def get(self, key):
+        """Riga salvata per il claim `key`, oppure None."""
+        return self.get_hash(content_hash(key))
+
+    def get_hash(self, key_hash):
+        """Riga salvata per l'impronta `key_hash` (vedi content_hash), oppure None."""
+        if key_hash not in self._hashes:
+            return None
+        found = self._conn.execute("SELECT row FROM checkpoint WHERE hash = ?", (key_hash,)).fetchone()
+        return json.loads(found[0]) if found else None
+
+    def rows(self):
+        """Itera le righe salvate nell'ordine in cui sono state scritte."""
+        for _, row in self.rows_since(0):
+            yield row
+
+    def rows_since(self, seq):
+        """Itera (seq, riga) delle righe scritte dopo la posizione `seq`, in ordine."""
+        for position, row in self._conn.execute("SELECT seq, row FROM checkpoint WHERE seq > ? ORDER BY seq", (seq,)):
+            yield position, json.loads(row)
+
+    def import_csv(self, csv_path):
+        """
+        Importa un CSV di output esistente (esecuzioni precedenti al checkpoint
+        su SQLite). Restituisce il numero di righe importate.
+        """
+        if not os.path.exists(csv_path):
+            return 0
+
+        imported = 0
+        with open(csv_path, mode='r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                if row.get(self.key_field) and self.add(row):
+                    imported += 1
+        self.flush()
+        return imported
+
+    def export_csv(self, csv_path, fieldnames, order=None):
+        """
+        Riscrive il CSV di output dal checkpoint: file temporaneo + rename atomico.
+        Se `order` è un iterabile di claim, le righe seguono quell'ordine (es.
+        l'ordine del file di input) e quelle non presenti vengono accodate.
+        """
+        self.flush()
+        tmp_path = csv_path + ".tmp"
+        with open(tmp_path, mode='w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            written = set()
+            for key in (order or ()):
+                key_hash = content_hash(key)
+                if key_hash in written:
+                    continue
+                row = self.get(key)
+                if row is not None:
+                    writer.writerow(row)
+                    written.add(key_hash)
+            for row in self.rows():
+                if content_hash(row[self.key_field]) not in written:
+                    writer.writerow(row)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, csv_path)
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+def open_checkpoint(store_path, csv_path, key_field):
+    """
+    Apre il checkpoint e, al primo utilizzo, vi importa il CSV di output
+    già esistente così da non rifare i claim delle esecuzioni precedenti.
+    """
+    store = CheckpointStore(store_path, key_field)
+    if len(store) == 0:
+        imported = store.import_csv(csv_path)
+        if imported:
+            print(f"Importate {imported} righe da {csv_path} nel checkpoint {store_path}.")
+    return store
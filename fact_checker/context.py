@@ -0,0 +1,82 @@
+import math
+import re
+
+# Fine frase: punto/esclamativo/interrogativo (eventualmente seguiti da virgolette) e spazio
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])["\'”»)]*\s+')
+
+
+def estimate_tokens(text):
+    """
+    Stima veloce del numero di token (circa 4 caratteri per token per i
+    tokenizer OpenAI). Evita di dipendere da un tokenizer esterno.
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text) / 4)
+
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    Tronca `text` a circa `max_tokens` token fermandosi all'ultima fine frase
+    disponibile; se nessuna frase intera entra, taglia all'ultimo spazio.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    max_chars = max_tokens * 4
+    head = text[:max_chars]
+    boundaries = [m.start() for m in _SENTENCE_END_RE.finditer(head)]
+    if boundaries:
+        return head[:boundaries[-1]].rstrip()
+
+    cut = head.rfind(' ')
+    return (head[:cut] if cut > 0 else head).rstrip() + "..."
+
+
+class ContextBuilder:
+    """
+    Costruisce il contesto per il Giudice rispettando un budget di token.
+    Le prove arrivano già ordinate dal re-ranker e vengono inserite in modo
+    greedy: i frammenti troppo lunghi vengono troncati a fine frase e i
+    contenuti identici vengono saltati.
+    """
+
+    def __init__(self, token_budget, max_snippet_tokens, max_items=None, min_snippet_tokens=40):
+        self.token_budget = token_budget
+        self.max_snippet_tokens = max_snippet_tokens
+        self.max_items = max_items
+        self.min_snippet_tokens = min_snippet_tokens
+
+    def build(self, ranked_evidence):
+        """
+        Restituisce (prove_selezionate, contesto, token_usati).
+        """
+        parts = []
+        selected = []
+        seen_contents = set()
+        tokens_used = 0
+
+        for doc in ranked_evidence:
+            if self.max_items is not None and len(selected) >= self.max_items:
+                break
+
+            content = (doc.get('content') or 'N/A').strip()
+            fingerprint = " ".join(content.lower().split())
+            if fingerprint in seen_contents:
+                continue
+
+            header = f"PROVA {len(selected) + 1} (Fonte: {doc.get('url')})\n"
+            overhead = estimate_tokens(header) + estimate_tokens("CONTENUTO: \n\n")
+            remaining = self.token_budget - tokens_used - overhead
+            if remaining < self.min_snippet_tokens:
+                break
+
+            snippet = truncate_to_tokens(content, min(self.max_snippet_tokens, remaining))
+            block = f"{header}CONTENUTO: {snippet}\n\n"
+
+            parts.append(block)
+            selected.append(doc)
+            seen_contents.add(fingerprint)
+            tokens_used += estimate_tokens(block)
+
+        return selected, "".join(parts), tokens_used
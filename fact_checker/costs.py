@@ -0,0 +1,183 @@
+import json
+import os
+import threading
+from config.settings import (
+    MODEL_PRICES, TAVILY_PRICES, COST_LEDGER_PATH,
+    COST_BUDGET_USD, COST_BUDGET_TOKENS, DEFAULT_COST_PER_CLAIM
+)
+
+
+class CostLedger:
+    """
+    Registro dei costi reali: token per modello (dal campo `usage` di OpenAI)
+    e chiamate Tavily, valorizzati con la tabella prezzi di config/settings.py.
+
+    Il registro viene alimentato dalle tracce di fact_checker/metrics.py
+    (vedi `charge`) e fa rispettare un budget in dollari e/o in token:
+    `can_start` rifiuta nuovi claim quando la spesa, più il costo medio
+    previsto dei claim ancora in volo, raggiunge il budget.
+
+    I totali storici vengono salvati in `path` (JSON), così anche il primo
+    batch di una nuova esecuzione ha una stima del costo medio per claim.
+    """
+
+    def __init__(self, budget_usd=COST_BUDGET_USD, budget_tokens=COST_BUDGET_TOKENS,
+                 model_prices=None, tavily_prices=None, path=COST_LEDGER_PATH):
+        self.budget_usd = budget_usd
+        self.budget_tokens = budget_tokens
+        self.model_prices = MODEL_PRICES if model_prices is None else model_prices
+        self.tavily_prices = TAVILY_PRICES if tavily_prices is None else tavily_prices
+        self.path = path
+        self._lock = threading.Lock()
+        self._unpriced = set()
+
+        # Totali della sessione corrente
+        self.spent_usd = 0.0
+        self.tokens = 0
+        self.claims = 0
+        self.in_flight = 0
+        self.refused = 0
+        self.by_model = {}
+        self.tavily_calls = {}
+
+        # Totali delle esecuzioni precedenti (solo per la stima del costo medio)
+        self.history = self._load_history()
+
+    def _load_history(self):
+        if not self.path or not os.path.exists(self.path):
+            return {"spent_usd": 0.0, "claims": 0}
+        try:
+            with open(self.path, mode='r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"spent_usd": 0.0, "claims": 0}
+
+    def price_llm(self, model, prompt_tokens, completion_tokens):
+        """Costo in USD di una chiamata (prezzi per 1M token)."""
+        prices = self.model_prices.get(model)
+        if prices is None:
+            if model not in self._unpriced:
+                self._unpriced.add(model)
+                print(f"ATTENZIONE: prezzo non configurato per il modello '{model}', costo considerato 0.")
+            return 0.0
+        return (prompt_tokens * prices["input"] + completion_tokens * prices["output"]) / 1_000_000
+
+    def price_tavily(self, search_depth, calls=1):
+        return self.tavily_prices.get(search_depth, 0.0) * calls
+
+    def charge(self, trace_data, is_claim=True):
+        """
+        Addebita i consumi di una traccia (token per modello e chiamate Tavily).
+        Le tracce dei batch del Pianificatore si addebitano con is_claim=False:
+        contano nella spesa ma non nel numero di claim.
+        Restituisce il costo della traccia.
+        """
+        cost = 0.0
+        tokens = 0
+        with self._lock:
+            for model, usage in trace_data.get("usage", {}).items():
+                prompt, completion = usage["prompt_tokens"], usage["completion_tokens"]
+                model_cost = self.price_llm(model, prompt, completion)
+                totals = self.by_model.setdefault(model, {"prompt_tokens": 0, "completion_tokens": 0, "usd": 0.0})
+                totals["prompt_tokens"] += prompt
+                totals["completion_tokens"] += completion
+                totals["usd"] += model_cost
+                cost += model_cost
+                tokens += prompt + completion
+            for depth, calls in trace_data.get("tavily_calls", {}).items():
+                self.tavily_calls[depth] = self.tavily_calls.get(depth, 0) + calls
+                cost += self.price_tavily(depth, calls)
+
+            self.spent_usd += cost
+            self.tokens += tokens
+            if is_claim:
+                self.claims += 1
+        trace_data["cost_usd"] = cost
+        return cost
+
+    def average_cost_per_claim(self):
+        """Media corrente per claim; senza dati usa lo storico o la stima di default."""
+        if self.claims:
+            return self.spent_usd / self.claims
+        if self.history.get("claims"):
+            return self.history["spent_usd"] / self.history["claims"]
+        return DEFAULT_COST_PER_CLAIM
+
+    def average_tokens_per_claim(self):
+        return self.tokens / self.claims if self.claims else 0
+
+    def project(self, n_claims):
+        """Costo previsto per `n_claims` claim con la media corrente."""
+        return n_claims * self.average_cost_per_claim()
+
+    def over_budget(self):
+        """True se la spesa (in dollari o in token) ha già raggiunto il budget."""
+        if self.budget_usd is not None and self.spent_usd >= self.budget_usd:
+            return True
+        return self.budget_tokens is not None and self.tokens >= self.budget_tokens
+
+    def can_start(self):
+        """
+        True se un nuovo claim può partire senza superare il budget.
+        I claim in volo vengono contati al costo medio previsto, così con
+        molti claim in parallelo il budget non viene sforato.
+        """
+        with self._lock:
+            reserved = self.in_flight + 1
+            if self.budget_usd is not None:
+                if self.spent_usd + reserved * self.average_cost_per_claim() > self.budget_usd:
+                    self.refused += 1
+                    return False
+            if self.budget_tokens is not None and self.claims:
+                if self.tokens + reserved * self.average_tokens_per_claim() > self.budget_tokens:
+                    self.refused += 1
+                    return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        """Da chiamare quando un claim avviato con can_start termina (anche con errore)."""
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+    def summary(self):
+        with self._lock:
+            return {
+                "spent_usd": round(self.spent_usd, 6),
+                "tokens": self.tokens,
+                "claims": self.claims,
+                "refused": self.refused,
+                "average_usd_per_claim": round(self.average_cost_per_claim(), 6),
+                "by_model": self.by_model,
+                "tavily_calls": self.tavily_calls,
+                "budget_usd": self.budget_usd,
+                "budget_tokens": self.budget_tokens,
+            }
+
+    def print_report(self, remaining=None):
+        print("\n--- Costi ---")
+        for model, totals in sorted(self.by_model.items()):
+            print(f"  {model:<14} in={totals['prompt_tokens']:<9} out={totals['completion_tokens']:<9} ${totals['usd']:.4f}")
+        for depth, calls in sorted(self.tavily_calls.items()):
+            print(f"  tavily/{depth:<7} chiamate={calls:<5} ${self.price_tavily(depth, calls):.4f}")
+        print(f"  Totale: ${self.spent_usd:.4f} per {self.claims} claim "
+              f"(media ${self.average_cost_per_claim():.4f}/claim)")
+        if self.refused:
+            print(f"  ⛔ Budget raggiunto: {self.refused} claim non avviati.")
+        if remaining:
+            print(f"  Costo previsto per i {remaining} claim rimanenti: ~${self.project(remaining):.2f}")
+
+    def save(self):
+        """Aggiunge i totali della sessione allo storico su disco."""
+        if not self.path or not self.claims:
+            return
+        with self._lock:
+            history = {
+                "spent_usd": self.history.get("spent_usd", 0.0) + self.spent_usd,
+                "claims": self.history.get("claims", 0) + self.claims,
+            }
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, mode='w', encoding='utf-8') as f:
+            json.dump(history, f, indent=2)
+        os.replace(tmp_path, self.path)
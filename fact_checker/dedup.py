@@ -0,0 +1,343 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import numpy as np
+
+from .checkpoint import content_hash
+
+# Primo di Mersenne usato per le permutazioni universali di MinHash
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def shingles(text, size=3):
+    """Insieme degli n-grammi di parole (shingle) di un testo normalizzato."""
+    tokens = _TOKEN_RE.findall((text or "").lower())
+    if len(tokens) < size:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+class MinHasher:
+    """
+    Calcola firme MinHash di lunghezza `num_perm` sugli shingle di parole.
+    La frazione di componenti uguali tra due firme stima la similarità di Jaccard.
+    """
+
+    def __init__(self, num_perm=128, shingle_size=3, seed=1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        tokens = shingles(text, self.shingle_size)
+        if not tokens:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(t.encode('utf-8'), digest_size=4).digest(), 'little') for t in tokens),
+            dtype=np.uint64, count=len(tokens)
+        )
+        # (a*h + b) mod p, troncato a 32 bit, per ogni permutazione e ogni shingle
+        permuted = ((np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME) & _MAX_HASH
+        return permuted.min(axis=0)
+
+
+def estimate_jaccard(sig_a, sig_b):
+    return float(np.count_nonzero(sig_a == sig_b)) / len(sig_a)
+
+
+def _choose_bands(num_perm, threshold):
+    """Sceglie (bande, righe) in modo che la soglia LSH (1/b)^(1/r) sia vicina a `threshold`."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class LSHIndex:
+    """
+    Indice Locality-Sensitive Hashing su firme MinHash. Ogni elemento viene
+    inserito in `bands` bucket; una query confronta solo i candidati che
+    condividono almeno un bucket e li verifica con la Jaccard stimata.
+    """
+
+    def __init__(self, threshold=0.9, hasher=None):
+        self.threshold = threshold
+        self.hasher = hasher or MinHasher()
+        self.bands, self.rows = _choose_bands(self.hasher.num_perm, threshold)
+        self._buckets = [dict() for _ in range(self.bands)]
+        self._signatures = {}
+        self._payloads = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key, text, payload=None):
+        signature = self.hasher.signature(text)
+        self._signatures[key] = signature
+        self._payloads[key] = payload
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, []).append(key)
+        return signature
+
+    def query(self, text):
+        """Restituisce [(chiave, payload, similarità)] sopra soglia, dalla più simile."""
+        signature = self.hasher.signature(text)
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(band_key, ()))
+
+        matches = []
+        for key in candidates:
+            similarity = estimate_jaccard(signature, self._signatures[key])
+            if similarity >= self.threshold:
+                matches.append((key, self._payloads[key], similarity))
+        matches.sort(key=lambda m: m[2], reverse=True)
+        return matches
+
+
+class PersistentLSHIndex:
+    """
+    Come LSHIndex, ma firme e bucket sono salvati in SQLite (WAL) e le chiavi
+    sono le impronte a 64 bit del checkpoint (content_hash): in memoria non
+    resta nulla che cresca con lo storico e all'avvio non si ricalcola nessuna
+    firma. Le scritture sono raggruppate come nel checkpoint; l'indice è
+    derivato dal checkpoint, quindi un crash al più lo lascia indietro e
+    ClaimDeduplicator.sync lo riallinea.
+    """
+
+    def __init__(self, path, threshold=0.9, hasher=None, commit_every=25, commit_interval=5.0):
+        self.threshold = threshold
+        self.hasher = hasher or MinHasher()
+        self.bands, self.rows = _choose_bands(self.hasher.num_perm, threshold)
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS signatures (hash INTEGER PRIMARY KEY, signature BLOB NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS buckets (band INTEGER NOT NULL, band_key BLOB NOT NULL, hash INTEGER NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS buckets_key ON buckets (band, band_key)")
+
+        # Con parametri diversi (soglia, firme) i bucket salvati non valgono più: si riparte da zero
+        params = json.dumps({'num_perm': self.hasher.num_perm, 'shingle_size': self.hasher.shingle_size,
+                             'bands': self.bands, 'rows': self.rows})
+        if self._meta('params') != params:
+            self._conn.execute("DELETE FROM signatures")
+            self._conn.execute("DELETE FROM buckets")
+            self._conn.execute("DELETE FROM meta")
+            self._set_meta('params', params)
+        self._conn.commit()
+
+    def _meta(self, name):
+        found = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return found[0] if found else None
+
+    def _set_meta(self, name, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    @property
+    def position(self):
+        """Ultima riga del checkpoint (seq) già considerata per l'indice."""
+        return int(self._meta('checkpoint_seq') or 0)
+
+    @position.setter
+    def position(self, seq):
+        self._set_meta('checkpoint_seq', str(seq))
+        self._pending += 1
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def __contains__(self, key):
+        return self._conn.execute("SELECT 1 FROM signatures WHERE hash = ?", (key,)).fetchone() is not None
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key, text):
+        """Indicizza `text` con la chiave `key`; False se la chiave era già presente."""
+        if key in self:
+            return False
+        signature = self.hasher.signature(text)
+        self._conn.execute("INSERT INTO signatures (hash, signature) VALUES (?, ?)", (key, signature.tobytes()))
+        self._conn.executemany(
+            "INSERT INTO buckets (band, band_key, hash) VALUES (?, ?, ?)",
+            [(band, band_key, key) for band, band_key in self._band_keys(signature)]
+        )
+        self._pending += 1
+        if self._pending >= self.commit_every or time.monotonic() - self._last_commit >= self.commit_interval:
+            self.flush()
+        return True
+
+    def query(self, text):
+        """Restituisce [(chiave, similarità)] sopra soglia, dalla più simile."""
+        signature = self.hasher.signature(text)
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            rows = self._conn.execute("SELECT hash FROM buckets WHERE band = ? AND band_key = ?", (band, band_key))
+            candidates.update(key for (key,) in rows)
+
+        matches = []
+        for key in candidates:
+            (stored,) = self._conn.execute("SELECT signature FROM signatures WHERE hash = ?", (key,)).fetchone()
+            similarity = estimate_jaccard(signature, np.frombuffer(stored, dtype=np.uint64))
+            if similarity >= self.threshold:
+                matches.append((key, similarity))
+        matches.sort(key=lambda m: m[1], reverse=True)
+        return matches
+
+    def flush(self):
+        if self._pending:
+            self._conn.commit()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+# Inizio della motivazione dei verdetti riutilizzati (vedi ClaimDeduplicator.reuse)
+REUSED_PREFIX = "[Verdetto riutilizzato da un claim quasi identico"
+
+
+class ClaimDeduplicator:
+    """
+    Ricorda i claim già verificati e, per un nuovo claim quasi identico (es.
+    post ripubblicati con minime modifiche), restituisce il verdetto esistente
+    invece di rieseguire la pipeline completa.
+
+    L'indice (PersistentLSHIndex in `index_path`) contiene solo impronte e
+    firme; il verdetto viene letto dal checkpoint quando c'è una corrispondenza.
+    I verdetti a loro volta riutilizzati non entrano nell'indice, così le
+    catene di quasi-duplicati non accumulano annotazioni.
+    """
+
+    # Chiamate API risparmiate per ogni claim riutilizzato: Pianificatore, Tavily, Giudice
+    CALLS_PER_CLAIM = 3
+
+    # Verdetti che non ha senso propagare (errori transitori)
+    NON_REUSABLE_LABELS = {'ERRORE', ''}
+
+    def __init__(self, checkpoint, index_path, threshold=0.9):
+        self.checkpoint = checkpoint
+        self.index = PersistentLSHIndex(index_path, threshold=threshold)
+        self.reused = 0
+
+    def _reusable(self, label, motivation):
+        if (label or '').strip().upper() in self.NON_REUSABLE_LABELS:
+            return False
+        return not (motivation or '').startswith(REUSED_PREFIX)
+
+    def sync(self):
+        """
+        Indicizza le righe del checkpoint scritte dopo l'ultima sincronizzazione
+        (tutte, la prima volta). Restituisce il numero di claim aggiunti.
+        """
+        added = 0
+        position = self.index.position
+        for position, row in self.checkpoint.rows_since(position):
+            if self._reusable(row.get('rag_label'), row.get('rag_motivation')):
+                claim = row[self.checkpoint.key_field]
+                added += self.index.add(content_hash(claim), claim)
+        self.index.position = position
+        self.index.flush()
+        return added
+
+    def add(self, claim, verdict):
+        """Indicizza un claim appena verificato (già registrato nel checkpoint)."""
+        if self._reusable(verdict.get('verdetto'), verdict.get('motivazione')):
+            self.index.add(content_hash(claim), claim)
+
+    def find(self, claim):
+        """Restituisce (riga del checkpoint, similarità) del claim più simile, oppure None."""
+        for key, similarity in self.index.query(claim):
+            row = self.checkpoint.get_hash(key)
+            if row is not None:
+                return row, similarity
+        return None
+
+    def reuse(self, claim):
+        """
+        Se esiste un claim quasi identico restituisce una copia del suo verdetto,
+        con la motivazione annotata; altrimenti None.
+        """
+        match = self.find(claim)
+        if match is None:
+            return None
+
+        row, similarity = match
+        self.reused += 1
+        return {
+            'verdetto': row.get('rag_label'),
+            'motivazione': f"{REUSED_PREFIX} (similarità {similarity:.2f})] {row.get('rag_motivation') or ''}",
+            'source_claim': row[self.checkpoint.key_field]
+        }
+
+    @property
+    def calls_saved(self):
+        return self.reused * self.CALLS_PER_CLAIM
+
+    def close(self):
+        self.index.close()
+
+
+class EvidenceDeduplicator:
+    """
+    Raggruppa i frammenti quasi identici (es. lo stesso lancio AP/Reuters
+    ripubblicato da molte testate) e tiene un solo rappresentante per gruppo.
+    I frammenti arrivano ordinati dal re-ranker, quindi il primo di ogni
+    gruppo è il più credibile; le copie scartate sono registrate nei campi
+    'cluster_size' e 'duplicate_urls' del rappresentante.
+    """
+
+    def __init__(self, threshold=0.8, hasher=None):
+        self.threshold = threshold
+        self.hasher = hasher or MinHasher()
+
+    def dedupe(self, ranked_evidence):
+        index = LSHIndex(threshold=self.threshold, hasher=self.hasher)
+        representatives = []
+
+        for position, doc in enumerate(ranked_evidence):
+            text = doc.get('content') or doc.get('title') or ''
+            matches = index.query(text) if text else []
+            if matches:
+                leader = matches[0][1]
+                leader['cluster_size'] += 1
+                leader['duplicate_urls'].append(doc.get('url'))
+                continue
+
+            # Copia: i risultati possono provenire dalla cache e non vanno modificati
+            representative = {**doc, 'cluster_size': 1, 'duplicate_urls': []}
+            if text:
+                index.add(position, text, representative)
+            representatives.append(representative)
+
+        removed = len(ranked_evidence) - len(representatives)
+        if removed:
+            print(f"Rimossi {removed} frammenti quasi duplicati ({len(representatives)} gruppi distinti).")
+        return representatives
@@ -0,0 +1,149 @@
+import json
+import os
+import time
+from functools import lru_cache
+from urllib.parse import urlparse
+
+# Suffissi pubblici multi-etichetta più comuni: per questi il dominio
+# registrabile (eTLD+1) ha tre etichette invece di due (es. bbc.co.uk).
+MULTI_LABEL_SUFFIXES = {
+    "co.uk", "org.uk", "gov.uk", "ac.uk", "ltd.uk", "plc.uk", "me.uk",
+    "com.au", "net.au", "org.au", "gov.au", "edu.au",
+    "co.nz", "org.nz", "govt.nz",
+    "co.jp", "or.jp", "go.jp", "ac.jp",
+    "com.br", "gov.br", "org.br",
+    "com.mx", "gob.mx", "com.ar", "gob.ar",
+    "co.in", "gov.in", "co.za", "gov.za",
+    "com.cn", "gov.cn", "com.hk", "com.sg", "gov.sg", "com.tr", "gov.it",
+}
+
+
+@lru_cache(maxsize=65536)
+def split_url(url):
+    """
+    Estrae (host, path) da un URL: host in minuscolo, senza porta né 'www.'.
+    Il risultato è memoizzato perché gli stessi URL ricorrono tra claim diversi.
+    """
+    try:
+        parsed = urlparse(url)
+        host = (parsed.hostname or "").rstrip('.')
+        if host.startswith('www.'):
+            host = host[4:]
+        return host, parsed.path or "/"
+    except (ValueError, AttributeError):
+        return "", "/"
+
+
+def registrable_domain(host):
+    """Dominio registrabile (eTLD+1): 'edition.cnn.com' -> 'cnn.com', 'news.bbc.co.uk' -> 'bbc.co.uk'."""
+    labels = host.split('.')
+    if len(labels) >= 3 and ".".join(labels[-2:]) in MULTI_LABEL_SUFFIXES:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+class DomainIndex:
+    """
+    Indice compilato dei punteggi di credibilità da config/sources.json.
+
+    Le voci sono indicizzate per suffisso di host (mappa suffisso -> punteggio),
+    quindi un sottodominio eredita il punteggio del dominio più specifico
+    presente in configurazione (es. 'es.reuters.com' -> 'reuters.com').
+    Le voci con un percorso (es. 'washingtonpost.com/fact-checker') valgono
+    solo per gli URL sotto quel percorso e hanno la precedenza sull'host.
+    La ricerca costa O(numero di etichette dell'host).
+    """
+
+    def __init__(self, sources, path=None, mtime=None):
+        self.path = path
+        self.mtime = mtime
+        self.default_score = sources.get('default_score', 3)
+        self.host_scores = {}
+        self.path_scores = {}
+
+        # Appiattisce la struttura JSON per categoria
+        for category, data in sources.items():
+            if isinstance(data, dict) and 'domains' in data:
+                score = data.get('score', self.default_score)
+                for entry in data['domains']:
+                    self._add(entry, score)
+
+    def _add(self, entry, score):
+        entry = entry.strip().lower()
+        if entry.startswith('www.'):
+            entry = entry[4:]
+        host, _, path = entry.partition('/')
+        if path:
+            rules = self.path_scores.setdefault(host, [])
+            rules.append(('/' + path.rstrip('/'), score))
+            # Il prefisso più lungo deve vincere
+            rules.sort(key=lambda rule: len(rule[0]), reverse=True)
+        else:
+            self.host_scores[host] = score
+
+    def __len__(self):
+        return len(self.host_scores) + sum(len(rules) for rules in self.path_scores.values())
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r') as f:
+            config = json.load(f)
+        return cls(config['sources'], path=path, mtime=os.path.getmtime(path))
+
+    def maybe_reload(self):
+        """Un indice statico non si ricarica mai (vedi ReloadingDomainIndex)."""
+        return False
+
+    def lookup(self, url):
+        """Punteggio di credibilità di un URL (default_score se il dominio è sconosciuto)."""
+        host, url_path = split_url(url)
+        if not host:
+            return self.default_score
+
+        # Scorre i suffissi dal più specifico fino al dominio registrabile (eTLD+1),
+        # senza mai scendere al solo suffisso pubblico ('com', 'co.uk').
+        stop = host.count('.') - registrable_domain(host).count('.')
+        labels = host.split('.')
+        for i in range(stop + 1):
+            suffix = ".".join(labels[i:])
+            for prefix, score in self.path_scores.get(suffix, ()):
+                if url_path == prefix or url_path.startswith(prefix + '/'):
+                    return score
+            if suffix in self.host_scores:
+                return self.host_scores[suffix]
+        return self.default_score
+
+
+class ReloadingDomainIndex:
+    """
+    Avvolge un DomainIndex e lo ricompila quando il file di configurazione
+    cambia (controllo dell'mtime al massimo ogni `check_interval` secondi),
+    senza dover ricreare la pipeline.
+    """
+
+    def __init__(self, path, check_interval=5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._last_check = time.monotonic()
+        self.index = DomainIndex.from_file(path)
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime == self.index.mtime:
+                return False
+            self.index = DomainIndex.from_file(self.path)
+            print(f"Re-Ranker: {self.path} modificato, ricaricati {len(self.index)} domini.")
+            return True
+        except Exception as e:
+            # Un file temporaneamente non valido non deve fermare la pipeline: teniamo l'indice attuale
+            print(f"Errore durante il ricaricamento di sources.json: {e}")
+            return False
+
+    def lookup(self, url):
+        return self.index.lookup(url)
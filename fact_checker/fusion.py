@@ -0,0 +1,32 @@
+def reciprocal_rank_fusion(result_lists, k=60):
+    """
+    Unisce le liste di risultati di più query con la Reciprocal Rank Fusion:
+    ogni URL riceve la somma di 1 / (k + posizione) sulle liste in cui compare,
+    così i documenti trovati da più query salgono in classifica.
+
+    Restituisce un'unica lista senza URL ripetuti, ordinata per punteggio RRF.
+    Il campo "score" (la rilevanza usata dal re-ranker) viene sostituito dal
+    punteggio RRF normalizzato in [0, 1]; quello originale di Tavily resta in
+    "tavily_score".
+    """
+    fused = {}
+    first_seen = {}
+    for results in result_lists:
+        for rank, article in enumerate(results, start=1):
+            url = article.get('url') or f"__no_url_{id(article)}"
+            if url not in fused:
+                fused[url] = 0.0
+                first_seen[url] = article
+            fused[url] += 1.0 / (k + rank)
+
+    if not fused:
+        return []
+    best = max(fused.values())
+    merged = []
+    for url in sorted(fused, key=fused.get, reverse=True):
+        article = dict(first_seen[url])
+        article['tavily_score'] = article.get('score', 0.0)
+        article['rrf_score'] = fused[url]
+        article['score'] = fused[url] / best
+        merged.append(article)
+    return merged
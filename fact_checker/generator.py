@@ -1,19 +1,55 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from config.settings import OPENAI_API_KEY, DEEPSEEK_API_KEY, GROQ_API_KEY, NOVITA_API_KEY
+from config.settings import LLM_CACHE_PATH, LLM_CACHE_MODE, LLM_CACHE_MAX_BYTES, OPENAI_BASE_URL
+from config.settings import QUERY_FANOUT
+from .cache import DiskCache, make_cache_key
+from .metrics import record_llm_call
+from .resilience import get_guard, is_transient
+from .cassette import wrap_clients
 import json
+import re
 
 class LLMGenerator:
-    def __init__(self):
+    def __init__(self, cache=None, api_key=None):
         
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        api_key = api_key or OPENAI_API_KEY
+        # Con CASSETTE_MODE=record/replay i client vengono registrati o sostituiti (vedi cassette.py)
+        self.client, self.async_client = wrap_clients(
+            "openai",
+            lambda: OpenAI(api_key=api_key, base_url=OPENAI_BASE_URL, max_retries=0),
+            lambda: AsyncOpenAI(api_key=api_key, base_url=OPENAI_BASE_URL, max_retries=0)
+        )
+        # Limite di frequenza, retry e circuit breaker condivisi (i retry interni dell'SDK sono disattivati)
+        self.guard = get_guard("openai")
         self.query_model = "gpt-4.1-mini"
         self.verdict_model = "gpt-5-mini" 
+        # Query diverse da generare per claim (1 = una sola query, comportamento classico)
+        self.query_fanout = QUERY_FANOUT
+
+        # Qualsiasi oggetto con get/set/invalidate/clear/stats (es. DiskCache, MemoryCache)
+        self.cache = cache if cache is not None else DiskCache(
+            LLM_CACHE_PATH, mode=LLM_CACHE_MODE, max_bytes=LLM_CACHE_MAX_BYTES
+        )
         
 
     def _get_fallback_query(self, claim):
         """Genera una query di fallback semplice se l'LLM fallisce."""
         print("ATTENZIONE: Attivazione query di fallback.")
         return claim.strip()
+
+    def _get_fallback_queries(self, claim, n_queries):
+        """Versione multi-query del fallback: il claim così com'è e tra virgolette con 'fact-check'."""
+        fallback = self._get_fallback_query(claim)
+        return [fallback, f'"{fallback}" fact-check'][:max(1, n_queries)]
+
+    def _fanout_instructions(self, n_queries):
+        """Istruzioni per ottenere query diverse tra loro (fan-out del recupero)."""
+        return (
+            f"Genera {n_queries} query DIVERSE tra loro, per aumentare la copertura della ricerca:\n"
+            f"- una in inglese (e una nella lingua originale del claim, se diversa);\n"
+            f"- una con il claim tra virgolette seguito da 'fact-check';\n"
+            f"- una con le entità principali (persone, luoghi, cifre) e la data, se nota.\n"
+        )
     
     def _clean_and_parse_json(self, raw_content):
         """
@@ -36,14 +72,30 @@ class LLMGenerator:
         
         return json.loads(cleaned_content)
 
-    def generate_tavily_query(self, claim, metadata):
-        print("--- 1a. Pianificazione Query (Modalità Fact-Check) ---")
-        
+    def _format_metadata(self, metadata):
         metadata_str = ""
         if metadata.get('author'): metadata_str += f"Autore: {metadata.get('author')}\n"
         if metadata.get('context'): metadata_str += f"Contesto: {metadata.get('context')}\n"
         if metadata.get('date'): metadata_str += f"Data: {metadata.get('date')}\n"
+        return metadata_str
 
+    def _build_query_request(self, claim, metadata, n_queries=1):
+        """
+        Costruisce i parametri della richiesta al Pianificatore.
+        Con `n_queries` > 1 chiede una lista di query diverse invece di una sola.
+        """
+        metadata_str = self._format_metadata(metadata)
+        if n_queries > 1:
+            answer_format = (
+                self._fanout_instructions(n_queries) + "\n"
+                f"RISPONDI SOLO ED ESCLUSIVAMENTE CON UN OGGETTO JSON VALID:\n"
+                f"{{\"queries\": [\"...prima query...\", \"...seconda query...\"]}}"
+            )
+        else:
+            answer_format = (
+                f"RISPONDI SOLO ED ESCLUSIVAMENTE CON UN OGGETTO JSON VALID:\n"
+                f"{{\"query\": \"...tua stringa di ricerca...\"}}"
+            )
         
         full_prompt = (
             f"Agisci come un esperto di ricerca per il fact-checking.\n"
@@ -54,42 +106,310 @@ class LLMGenerator:
             f"DATI:\n"
             f"CLAIM: \"{claim}\"\n"
             f"METADATI: {metadata_str}\n\n"
-            f"RISPONDI SOLO ED ESCLUSIVAMENTE CON UN OGGETTO JSON VALID:\n"
-            f"{{\"query\": \"...tua stringa di ricerca...\"}}"
+            f"{answer_format}"
         )
 
-        try:
-            response = self.client.chat.completions.create(
-                model=self.query_model, 
-                messages=[
-                    {"role": "user", "content": full_prompt}
-                ],
-                max_completion_tokens=1000, 
-                response_format={"type": "json_object"} 
+        return {
+            "model": self.query_model,
+            "messages": [
+                {"role": "user", "content": full_prompt}
+            ],
+            "max_completion_tokens": 1000 * max(1, n_queries),
+            "response_format": {"type": "json_object"}
+        }
+
+    def _build_batch_query_request(self, claims_with_metadata, n_queries=1):
+        """
+        Richiesta unica al Pianificatore per un gruppo di claim: le istruzioni
+        sono inviate una sola volta e ogni claim è identificato dal suo indice.
+        Con `n_queries` > 1 chiede per ogni claim una lista di query diverse.
+        """
+        items = [
+            {"id": i, "claim": claim, "metadati": self._format_metadata(metadata or {})}
+            for i, (claim, metadata) in enumerate(claims_with_metadata)
+        ]
+        if n_queries > 1:
+            answer_format = (
+                self._fanout_instructions(n_queries) + "\n"
+                f"RISPONDI SOLO ED ESCLUSIVAMENTE CON UN OGGETTO JSON VALID, con {n_queries} query per ogni id:\n"
+                f"{{\"queries\": [{{\"id\": 0, \"queries\": [\"...prima query...\", \"...seconda query...\"]}}, ...]}}"
             )
-            
-            raw_content = response.choices[0].message.content
-            
-            # Debug
-            if not raw_content:
-                print(f"[DEBUG ERROR] Motivo stop: {response.choices[0].finish_reason}")
-                print(f"[DEBUG ERROR] Refusal: {getattr(response.choices[0], 'refusal', 'None')}")
-            
-            params = self._clean_and_parse_json(raw_content)
-            query = params.get('query', '').strip()
-            
-            print(f"Query Pianificata: {query}")
-            return query
+        else:
+            answer_format = (
+                f"RISPONDI SOLO ED ESCLUSIVAMENTE CON UN OGGETTO JSON VALID, con una query per ogni id:\n"
+                f"{{\"queries\": [{{\"id\": 0, \"query\": \"...tua stringa di ricerca...\"}}, ...]}}"
+            )
+
+        full_prompt = (
+            f"Agisci come un esperto di ricerca per il fact-checking.\n"
+            f"Il tuo compito è generare una stringa di ricerca ottimizzata per Tavily per OGNUNO dei claim seguenti.\n"
+            f"L'obiettivo NON è trovare la fonte originale, ma trovare fonti affidabili (fact-checkers, media, report) "
+            f"che verifichino o smentiscano il claim.\n"
+            f"Includi sempre la parola 'fact-check' o 'verità' in ogni query.\n\n"
+            f"DATI (lista JSON di claim con id e metadati):\n"
+            f"{json.dumps(items, ensure_ascii=False)}\n\n"
+            f"{answer_format}"
+        )
+
+        return {
+            "model": self.query_model,
+            "messages": [
+                {"role": "user", "content": full_prompt}
+            ],
+            "max_completion_tokens": 200 * max(1, n_queries) * len(items) + 200,
+            "response_format": {"type": "json_object"}
+        }
+
+    def _parse_batch_query_response(self, raw_content):
+        """
+        Restituisce un dizionario id -> query dalla risposta batch del Pianificatore
+        (id -> lista di query se il Pianificatore ne ha restituite più d'una).
+        """
+        params = self._clean_and_parse_json(raw_content)
+        queries = {}
+        for item in params.get('queries', []):
+            try:
+                if isinstance(item.get('queries'), list):
+                    query = self._clean_query_list(item['queries'])
+                else:
+                    query = str(item.get('query', '')).strip()
+                if query:
+                    queries[int(item['id'])] = query
+            except (KeyError, TypeError, ValueError, AttributeError):
+                continue
+        if not queries:
+            raise ValueError("Nessuna query valida nella risposta batch del Pianificatore.")
+        return queries
+
+    def _map_batch_queries(self, claims_with_metadata, queries, n_queries=1):
+        """
+        Riallinea le query agli input; i claim senza query usano il fallback.
+        Con `n_queries` > 1 ogni elemento è una lista di query, altrimenti una stringa.
+        """
+        result = []
+        for i, (claim, _) in enumerate(claims_with_metadata):
+            query = queries.get(i)
+            if not query:
+                query = self._get_fallback_queries(claim, n_queries) if n_queries > 1 else self._get_fallback_query(claim)
+            elif n_queries > 1:
+                query = [query] if isinstance(query, str) else query[:n_queries]
+            elif isinstance(query, list):
+                query = query[0]
+            result.append(query)
+        print(f"Query pianificate in batch: {len(queries)}/{len(claims_with_metadata)}")
+        return result
+
+    def _request_cache_key(self, request):
+        """Chiave di memoizzazione: hash di modello, messaggi, formato e limite di token."""
+        return make_cache_key({
+            "model": request["model"],
+            "messages": request["messages"],
+            "response_format": request.get("response_format"),
+            "max_completion_tokens": request.get("max_completion_tokens")
+        })
+
+    def _response_content(self, response):
+        raw_content = response.choices[0].message.content
+        
+        # Debug
+        if not raw_content:
+            print(f"[DEBUG ERROR] Motivo stop: {response.choices[0].finish_reason}")
+            print(f"[DEBUG ERROR] Refusal: {getattr(response.choices[0], 'refusal', 'None')}")
+        return raw_content
+
+    def _complete(self, request, parse, cache=True):
+        """
+        Esegue la richiesta (o la rilegge dalla cache) e la passa a `parse`.
+        Il contenuto grezzo viene salvato in cache solo se il parsing riesce,
+        così una risposta malformata non viene mai rigiocata. Con cache=False
+        la richiesta non viene memoizzata (es. batch del Pianificatore, vedi
+        _cached_batch_queries).
+        """
+        key = self._request_cache_key(request) if cache else None
+        cached = self.cache.get(key) if cache else None
+        if cached is not None:
+            record_llm_call(request["model"], cached=True)
+            return parse(cached)
+
+        response = self.guard.call(lambda: self.client.chat.completions.create(**request))
+        record_llm_call(request["model"], getattr(response, 'usage', None))
+        raw_content = self._response_content(response)
+        parsed = parse(raw_content)
+        if cache:
+            self.cache.set(key, raw_content)
+        return parsed
+
+    async def _acomplete(self, request, parse, cache=True):
+        """Versione asincrona di _complete."""
+        key = self._request_cache_key(request) if cache else None
+        cached = self.cache.get(key) if cache else None
+        if cached is not None:
+            record_llm_call(request["model"], cached=True)
+            return parse(cached)
+
+        response = await self.guard.acall(lambda: self.async_client.chat.completions.create(**request))
+        record_llm_call(request["model"], getattr(response, 'usage', None))
+        raw_content = self._response_content(response)
+        parsed = parse(raw_content)
+        if cache:
+            self.cache.set(key, raw_content)
+        return parsed
+
+    def _batch_claim_cache_key(self, claim, metadata, n_queries):
+        """
+        Chiave di cache di un singolo claim pianificato in batch: dipende solo dal
+        claim e dai suoi metadati, non dagli altri claim del gruppo, così una
+        ripresa (o un input filtrato) con gruppi diversi ritrova le query già pagate.
+        """
+        return make_cache_key({
+            "model": self.query_model,
+            "planner": "batch",
+            "claim": claim,
+            "metadata": self._format_metadata(metadata or {}),
+            "n_queries": n_queries
+        })
+
+    def _cached_batch_queries(self, claims_with_metadata, n_queries):
+        """Restituisce (id -> query già in cache, indici dei claim da pianificare)."""
+        cached, missing = {}, []
+        for i, (claim, metadata) in enumerate(claims_with_metadata):
+            query = self.cache.get(self._batch_claim_cache_key(claim, metadata, n_queries))
+            if query:
+                cached[i] = query
+            else:
+                missing.append(i)
+        if cached:
+            record_llm_call(self.query_model, cached=True)
+        return cached, missing
+
+    def _store_batch_queries(self, claims_with_metadata, missing, planned, n_queries):
+        """
+        Riporta le query pianificate per i soli claim mancanti (id locali) agli
+        indici dell'input e le salva in cache claim per claim.
+        """
+        queries = {}
+        for local_id, query in planned.items():
+            if not 0 <= local_id < len(missing):
+                continue
+            i = missing[local_id]
+            claim, metadata = claims_with_metadata[i]
+            self.cache.set(self._batch_claim_cache_key(claim, metadata, n_queries), query)
+            queries[i] = query
+        return queries
+
+    def _parse_query_response(self, raw_content):
+        """Estrae la query pianificata dalla risposta del Pianificatore."""
+        params = self._clean_and_parse_json(raw_content)
+        query = params.get('query', '').strip()
+        
+        print(f"Query Pianificata: {query}")
+        return query
+
+    def _clean_query_list(self, items):
+        """Query non vuote e senza ripetizioni, nell'ordine del Pianificatore."""
+        queries = []
+        for item in items:
+            query = str(item).strip()
+            if query and query not in queries:
+                queries.append(query)
+        return queries
+
+    def _parse_query_set_response(self, raw_content):
+        """Estrae la lista di query dalla risposta multi-query del Pianificatore."""
+        params = self._clean_and_parse_json(raw_content)
+        queries = self._clean_query_list(params.get('queries', []))
+        if not queries:
+            raise ValueError("Nessuna query valida nella risposta del Pianificatore.")
+        print(f"Query Pianificate: {queries}")
+        return queries
+
+    def generate_query_set(self, claim, metadata, n_queries=None):
+        """
+        Pianifica fino a `n_queries` query diverse per lo stesso claim
+        (default: QUERY_FANOUT). Restituisce sempre una lista.
+        """
+        n_queries = n_queries or self.query_fanout
+        if n_queries <= 1:
+            return [self.generate_tavily_query(claim, metadata)]
+        request = self._build_query_request(claim, metadata, n_queries)
+
+        try:
+            return self._complete(request, self._parse_query_set_response)[:n_queries]
+        except Exception as e:
+            print(f"Errore generazione query: {e}")
+            return self._get_fallback_queries(claim, n_queries)
+
+    async def agenerate_query_set(self, claim, metadata, n_queries=None):
+        """Versione asincrona di generate_query_set."""
+        n_queries = n_queries or self.query_fanout
+        if n_queries <= 1:
+            return [await self.agenerate_tavily_query(claim, metadata)]
+        request = self._build_query_request(claim, metadata, n_queries)
+
+        try:
+            return (await self._acomplete(request, self._parse_query_set_response))[:n_queries]
+        except Exception as e:
+            print(f"Errore generazione query: {e}")
+            return self._get_fallback_queries(claim, n_queries)
+
+    def generate_tavily_query(self, claim, metadata):
+        print("--- 1a. Pianificazione Query (Modalità Fact-Check) ---")
+        request = self._build_query_request(claim, metadata)
+
+        try:
+            return self._complete(request, self._parse_query_response)
             
         except Exception as e:
             print(f"Errore generazione query: {e}")
             return self._get_fallback_query(claim)
 
-    def generate_verdict(self, claim, context):
+    async def agenerate_tavily_query(self, claim, metadata):
+        """Versione asincrona di generate_tavily_query."""
+        request = self._build_query_request(claim, metadata)
+
+        try:
+            return await self._acomplete(request, self._parse_query_response)
+
+        except Exception as e:
+            print(f"Errore generazione query: {e}")
+            return self._get_fallback_query(claim)
+
+    def generate_tavily_queries(self, claims_with_metadata, n_queries=1):
         """
-        Genera un verdetto.
+        Pianifica le query per una lista di (claim, metadata) con una sola chiamata.
+        Restituisce una lista di query nello stesso ordine dell'input
+        (una lista di query per claim se `n_queries` > 1).
         """
-        print("--- Generazione verdetto LLM ---")
+        print(f"--- 1a. Pianificazione Query in batch ({len(claims_with_metadata)} claim) ---")
+        if not claims_with_metadata:
+            return []
+        # Solo i claim senza query in cache vanno al Pianificatore
+        queries, missing = self._cached_batch_queries(claims_with_metadata, n_queries)
+        if missing:
+            request = self._build_batch_query_request([claims_with_metadata[i] for i in missing], n_queries)
+            try:
+                planned = self._complete(request, self._parse_batch_query_response, cache=False)
+                queries.update(self._store_batch_queries(claims_with_metadata, missing, planned, n_queries))
+            except Exception as e:
+                print(f"Errore generazione query in batch: {e}")
+        return self._map_batch_queries(claims_with_metadata, queries, n_queries)
+
+    async def agenerate_tavily_queries(self, claims_with_metadata, n_queries=1):
+        """Versione asincrona di generate_tavily_queries."""
+        if not claims_with_metadata:
+            return []
+        queries, missing = self._cached_batch_queries(claims_with_metadata, n_queries)
+        if missing:
+            request = self._build_batch_query_request([claims_with_metadata[i] for i in missing], n_queries)
+            try:
+                planned = await self._acomplete(request, self._parse_batch_query_response, cache=False)
+                queries.update(self._store_batch_queries(claims_with_metadata, missing, planned, n_queries))
+            except Exception as e:
+                print(f"Errore generazione query in batch: {e}")
+        return self._map_batch_queries(claims_with_metadata, queries, n_queries)
+
+    def _build_verdict_request(self, claim, context):
+        """Costruisce i parametri della richiesta al Giudice."""
         system_prompt = (
             "Sei un analista di fact-checking esperto. Il tuo compito è valutare la veridicità "
             "di un claim basandoti sulle prove fornite."
@@ -126,16 +446,47 @@ class LLMGenerator:
             f"Rispondi JSON (in ITALIANO!): {{\"verdetto\": \"...\", \"motivazione\": \"...\"}}"
         )
 
+        return {
+            "model": self.verdict_model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "response_format": {"type": "json_object"}
+        }
+
+    def generate_verdict(self, claim, context):
+        """
+        Genera un verdetto.
+        """
+        print("--- Generazione verdetto LLM ---")
+        request = self._build_verdict_request(claim, context)
+
         try:
-            response = self.client.chat.completions.create(
-                model=self.verdict_model, 
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                response_format={"type": "json_object"}
-            )
-            return json.loads(response.choices[0].message.content)
+            return self._complete(request, json.loads)
+        except Exception as e:
+            # Un errore temporaneo (rate limit, 5xx, rete) non è un verdetto: il claim va ritentato
+            if is_transient(e):
+                raise
+            print(f"Errore durante la chiamata all'LLM: {e}")
+            return {"verdetto": "ERRORE", "motivazione": str(e)}
+
+    async def agenerate_verdict(self, claim, context):
+        """Versione asincrona di generate_verdict."""
+        request = self._build_verdict_request(claim, context)
+
+        try:
+            return await self._acomplete(request, json.loads)
         except Exception as e:
+            if is_transient(e):
+                raise
             print(f"Errore durante la chiamata all'LLM: {e}")
             return {"verdetto": "ERRORE", "motivazione": str(e)}
+
+    def invalidate_query(self, claim, metadata):
+        """Rimuove dalla cache la query pianificata per questo claim/metadati."""
+        return self.cache.invalidate(self._request_cache_key(self._build_query_request(claim, metadata)))
+
+    def invalidate_verdict(self, claim, context):
+        """Rimuove dalla cache il verdetto per questo claim/contesto."""
+        return self.cache.invalidate(self._request_cache_key(self._build_verdict_request(claim, context)))
\ No newline at end of file
@@ -0,0 +1,64 @@
+import math
+import re
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Parole vuote (inglese e italiano) che non aiutano a distinguere i frammenti
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "he", "her",
+    "his", "i", "in", "is", "it", "its", "of", "on", "or", "our", "she", "that", "the", "their",
+    "they", "this", "to", "was", "we", "were", "will", "with", "you",
+    "che", "chi", "con", "da", "del", "della", "di", "e", "gli", "il", "in", "la", "le", "lo",
+    "per", "un", "una", "uno", "è",
+}
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+class BM25Scorer:
+    """
+    BM25 locale tra il testo del claim e i frammenti recuperati per quel claim.
+    Le statistiche (IDF, lunghezza media) sono calcolate sui soli risultati
+    del claim, e la matrice delle frequenze è limitata ai termini del claim
+    (documenti x termini della query): piccola, densa e calcolata in un passaggio.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+
+    def score(self, query, documents):
+        """
+        Restituisce un array NumPy con un punteggio in [0, 1] per documento
+        (normalizzato sul massimo del claim; tutti zero se nessun termine coincide).
+        """
+        n_docs = len(documents)
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if n_docs == 0 or not query_terms:
+            return np.zeros(n_docs)
+
+        term_index = {term: j for j, term in enumerate(query_terms)}
+        tf = np.zeros((n_docs, len(query_terms)))
+        doc_lengths = np.zeros(n_docs)
+        for i, document in enumerate(documents):
+            tokens = tokenize(document)
+            doc_lengths[i] = len(tokens)
+            for token in tokens:
+                j = term_index.get(token)
+                if j is not None:
+                    tf[i, j] += 1
+
+        df = np.count_nonzero(tf, axis=0)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+
+        avg_length = doc_lengths.mean() or 1.0
+        norm = self.k1 * (1 - self.b + self.b * doc_lengths / avg_length)
+        scores = ((tf * (self.k1 + 1)) / (tf + norm[:, None])) @ idf
+
+        best = scores.max()
+        if best <= 0 or math.isnan(best):
+            return np.zeros(n_docs)
+        return scores / best
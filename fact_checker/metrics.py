@@ -0,0 +1,259 @@
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Traccia attiva (per claim). Ogni task asyncio ha la sua copia del contesto,
+# quindi anche con molti claim in parallelo le misure non si mescolano.
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _percentile(sorted_values, q):
+    """Percentile nearest-rank su una lista già ordinata."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class MetricsRegistry:
+    """
+    Registro in-process di istogrammi e contatori con etichette.
+    Gli istogrammi conservano i campioni grezzi (poche migliaia per batch),
+    così i percentili sono esatti. Può essere esportato in JSON o nel formato
+    testuale di Prometheus, e può scrivere una riga JSONL per ogni claim.
+    """
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, prefix="factcheck", trace_path=None):
+        self.prefix = prefix
+        self.trace_path = trace_path
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._trace_file = None
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            self._histograms.setdefault((name, _label_key(labels)), []).append(float(value))
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            key = (name, _label_key(labels))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def start_trace(self, claim=None, kind='claim'):
+        """Crea una traccia e la rende attiva nel contesto corrente."""
+        trace = Trace(self, claim, kind)
+        trace._token = _current_trace.set(trace)
+        return trace
+
+    def write_trace(self, data):
+        if not self.trace_path:
+            return
+        with self._lock:
+            if self._trace_file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.trace_path)), exist_ok=True)
+                self._trace_file = open(self.trace_path, mode='a', encoding='utf-8')
+            self._trace_file.write(json.dumps(data, ensure_ascii=False) + "\n")
+            self._trace_file.flush()
+
+    def summary(self):
+        """Statistiche di tutti gli istogrammi e contatori, come dizionario JSON-serializzabile."""
+        with self._lock:
+            histograms = {k: sorted(v) for k, v in self._histograms.items()}
+            counters = dict(self._counters)
+
+        result = {"histograms": [], "counters": []}
+        for (name, labels), values in sorted(histograms.items()):
+            stats = {
+                "name": name, "labels": dict(labels),
+                "count": len(values), "sum": sum(values),
+                "mean": sum(values) / len(values) if values else 0.0,
+                "max": values[-1] if values else 0.0,
+            }
+            for q in self.QUANTILES:
+                stats[f"p{int(q * 100)}"] = _percentile(values, q)
+            result["histograms"].append(stats)
+        for (name, labels), value in sorted(counters.items()):
+            result["counters"].append({"name": name, "labels": dict(labels), "value": value})
+        return result
+
+    def to_prometheus(self):
+        """Esporta nel formato testuale di Prometheus (istogrammi come summary)."""
+        def fmt_labels(labels, **extra):
+            items = list(labels.items()) + list(extra.items())
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+        lines = []
+        summary = self.summary()
+        declared = set()
+        for h in summary["histograms"]:
+            metric = f"{self.prefix}_{h['name']}"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} summary")
+                declared.add(metric)
+            for q in self.QUANTILES:
+                lines.append(f"{metric}{fmt_labels(h['labels'], quantile=q)} {h[f'p{int(q * 100)}']}")
+            lines.append(f"{metric}_sum{fmt_labels(h['labels'])} {h['sum']}")
+            lines.append(f"{metric}_count{fmt_labels(h['labels'])} {h['count']}")
+        for c in summary["counters"]:
+            metric = f"{self.prefix}_{c['name']}_total"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            lines.append(f"{metric}{fmt_labels(c['labels'])} {c['value']}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, json_path=None, prometheus_path=None):
+        for path in (json_path, prometheus_path):
+            if path:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if json_path:
+            with open(json_path, mode='w', encoding='utf-8') as f:
+                json.dump(self.summary(), f, indent=2)
+        if prometheus_path:
+            with open(prometheus_path, mode='w', encoding='utf-8') as f:
+                f.write(self.to_prometheus())
+
+    def print_stage_report(self):
+        print("\n--- Latenza per fase (secondi) ---")
+        for h in self.summary()["histograms"]:
+            if h["name"] == "stage_seconds":
+                print(f"  {h['labels'].get('stage', '?'):<14} n={h['count']:<5} "
+                      f"p50={h['p50']:.2f}  p95={h['p95']:.2f}  max={h['max']:.2f}")
+
+    def close(self):
+        if self._trace_file is not None:
+            self._trace_file.close()
+            self._trace_file = None
+
+
+class Trace:
+    """Misure di un singolo claim: durata delle fasi, token, chiamate e conteggi."""
+
+    def __init__(self, registry, claim=None, kind='claim'):
+        self.registry = registry
+        self.kind = kind
+        self._token = None
+        self._started = time.perf_counter()
+        self.data = {
+            "claim": (claim or "")[:200],
+            "stages": {},
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "llm_calls": 0,
+            "llm_cache_hits": 0,
+            "retries": 0,
+            "usage": {},
+            "tavily_calls": {},
+        }
+
+    def finish(self, result=None):
+        """Chiude la traccia: registra la durata totale e la scrive nel JSONL."""
+        total = time.perf_counter() - self._started
+        self.data["stages"]["total"] = total
+        if self._token is not None:
+            _current_trace.reset(self._token)
+            self._token = None
+
+        if self.kind != 'claim':
+            return self.data
+        self.registry.observe("stage_seconds", total, stage="total")
+        self.registry.inc("claims", verdict=(result or {}).get('verdetto', 'NONE'))
+        if result is not None:
+            self.data["verdict"] = result.get('verdetto')
+            self.data["context_tokens"] = result.get('context_tokens')
+        self.registry.write_trace(self.data)
+        return self.data
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def stage(name):
+    """Misura la durata di una fase della pipeline nella traccia attiva (se presente)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.data["stages"][name] = trace.data["stages"].get(name, 0.0) + elapsed
+            trace.registry.observe("stage_seconds", elapsed, stage=name)
+
+
+def record_count(name, value):
+    """Registra un conteggio per claim (es. risultati Tavily, prove selezionate)."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.data[name] = value
+        trace.registry.observe(name, value)
+
+
+def record_label(name, value):
+    """Registra una decisione per claim (es. il livello di ricerca usato) e la conta per valore."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.data[name] = value
+        trace.registry.inc(name, choice=value)
+
+
+def record_llm_call(model, usage=None, cached=False):
+    """Registra una chiamata LLM con i token dal campo `usage` della risposta OpenAI."""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    registry = trace.registry
+    if cached:
+        trace.data["llm_cache_hits"] += 1
+        registry.inc("llm_cache_hits", model=model)
+        return
+
+    trace.data["llm_calls"] += 1
+    registry.inc("llm_calls", model=model)
+    if usage is not None:
+        prompt = getattr(usage, 'prompt_tokens', 0) or 0
+        completion = getattr(usage, 'completion_tokens', 0) or 0
+        trace.data["prompt_tokens"] += prompt
+        trace.data["completion_tokens"] += completion
+        model_usage = trace.data["usage"].setdefault(model, {"prompt_tokens": 0, "completion_tokens": 0})
+        model_usage["prompt_tokens"] += prompt
+        model_usage["completion_tokens"] += completion
+        registry.inc("prompt_tokens", prompt, model=model)
+        registry.inc("completion_tokens", completion, model=model)
+
+
+def record_tavily_call(search_depth):
+    """Registra una ricerca Tavily effettivamente eseguita (non servita dalla cache)."""
+    trace = _current_trace.get()
+    if trace is not None:
+        calls = trace.data["tavily_calls"]
+        calls[search_depth] = calls.get(search_depth, 0) + 1
+        trace.registry.inc("tavily_calls", search_depth=search_depth)
+
+
+def record_retry(provider):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.data["retries"] += 1
+        trace.registry.inc("retries", provider=provider)
+
+
+def record_error(provider):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.registry.inc("errors", provider=provider)
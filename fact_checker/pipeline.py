@@ -1,46 +1,411 @@
+import asyncio
+import contextvars
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from .retriever import TavilyRetriever
 from .reranker import CredibilityReranker
 from .generator import LLMGenerator
-from config.settings import TOP_K_ARTICLES 
+from .context import ContextBuilder
+from .dedup import EvidenceDeduplicator
+from .metrics import MetricsRegistry, stage, record_count, record_label
+from .costs import CostLedger
+from .cassette import get_cassette
+from .fusion import reciprocal_rank_fusion
+from config.settings import TOP_K_ARTICLES, RERANK_CANDIDATES, MAX_CONCURRENCY, PLANNER_BATCH_SIZE
+from config.settings import CONTEXT_TOKEN_BUDGET, MAX_SNIPPET_TOKENS, EVIDENCE_DEDUP_THRESHOLD
+from config.settings import METRICS_DIR
+from config.settings import RRF_K, PLANNER_BYPASS, PLANNER_BYPASS_MIN_TRUSTED_DOMAINS, TEMPLATE_QUERY_MAX_CHARS
+from config.settings import RETRIEVAL_STRATEGY, ADAPTIVE_BASIC_RESULTS, ADAPTIVE_TRUST_THRESHOLD, ADAPTIVE_MIN_TRUSTED_DOMAINS
 
 class FactCheckPipeline:
-    def __init__(self):
-        self.retriever = TavilyRetriever()
+    def __init__(self, openai_api_key=None, tavily_api_key=None, ledger=None):
+        # Le chiavi esplicite servono ai runner multi-processo (una chiave per shard);
+        # se assenti si usano quelle di config/settings.py
+        self.retriever = TavilyRetriever(api_key=tavily_api_key)
         self.reranker = CredibilityReranker()
-        self.generator = LLMGenerator()
+        self.generator = LLMGenerator(api_key=openai_api_key)
+        self.evidence_deduplicator = EvidenceDeduplicator(threshold=EVIDENCE_DEDUP_THRESHOLD)
+        self.context_builder = ContextBuilder(
+            token_budget=CONTEXT_TOKEN_BUDGET,
+            max_snippet_tokens=MAX_SNIPPET_TOKENS,
+            max_items=TOP_K_ARTICLES
+        )
+        # Latenze per fase, token e conteggi (vedi fact_checker/metrics.py)
+        self.metrics = MetricsRegistry()
+        # Costi reali (token e chiamate Tavily) e budget del batch
+        self.ledger = ledger if ledger is not None else CostLedger()
 
-    def run(self, claim, metadata={}): 
+    def _finish_trace(self, trace, result, is_claim=True):
+        """Addebita i consumi della traccia al registro dei costi e la chiude."""
+        cost = self.ledger.charge(trace.data, is_claim=is_claim)
+        if is_claim:
+            self.metrics.observe("claim_cost_usd", cost)
+        return trace.finish(result)
+
+    def _needs_escalation(self, basic_results):
         """
-        Esegue la pipeline di fact-checking completa di Re-Ranking.
+        Decide se la ricerca basic basta: servono almeno ADAPTIVE_MIN_TRUSTED_DOMAINS
+        domini distinti molto affidabili (agenzie o fact-checker) tra i risultati.
+        La decisione viene registrata nella traccia del claim.
         """
-        
-        # --- FASE 1: PIANIFICAZIONE QUERY ---
-        tavily_query = self.generator.generate_tavily_query(claim, metadata)
-        
-        # --- FASE 2: RECUPERO ---
-        print("Fase 1b: Recupero contesto con Tavily...")
-        evidence_results = self.retriever.search(tavily_query)
-        
-        if not evidence_results:
-            return {"verdetto": "BASELESS", "motivazione": "Nessuna informazione trovata da Tavily.", "evidence": []}
+        trusted = self.reranker.trusted_domains(basic_results, ADAPTIVE_TRUST_THRESHOLD)
+        escalate = len(trusted) < ADAPTIVE_MIN_TRUSTED_DOMAINS
+        record_count('trusted_domains_basic', len(trusted))
+        record_label('retrieval_tier', 'advanced' if escalate else 'basic')
+        print(f"Ricerca adattiva: {len(trusted)} domini affidabili nella ricerca basic "
+              f"({', '.join(sorted(trusted)) or 'nessuno'}) -> "
+              f"{'passo alla ricerca advanced' if escalate else 'basta la ricerca basic'}.")
+        return escalate
+
+    @staticmethod
+    def _merge_results(*result_lists):
+        """Unisce più liste di risultati Tavily eliminando gli URL ripetuti (vince la prima)."""
+        merged, seen = [], set()
+        for results in result_lists:
+            for article in results:
+                url = article.get('url')
+                if url in seen:
+                    continue
+                seen.add(url)
+                merged.append(article)
+        return merged
+
+    def _retrieve(self, tavily_query):
+        """Recupero con strategia RETRIEVAL_STRATEGY (vedi _needs_escalation)."""
+        if RETRIEVAL_STRATEGY != "adaptive":
+            return self.retriever.search(tavily_query)
+        basic_results = self.retriever.search(tavily_query, search_depth="basic", max_results=ADAPTIVE_BASIC_RESULTS)
+        if not self._needs_escalation(basic_results):
+            return basic_results
+        return self._merge_results(self.retriever.search(tavily_query), basic_results)
+
+    async def _aretrieve(self, tavily_query):
+        """Versione asincrona di _retrieve."""
+        if RETRIEVAL_STRATEGY != "adaptive":
+            return await self.retriever.asearch(tavily_query)
+        basic_results = await self.retriever.asearch(tavily_query, search_depth="basic", max_results=ADAPTIVE_BASIC_RESULTS)
+        if not self._needs_escalation(basic_results):
+            return basic_results
+        return self._merge_results(await self.retriever.asearch(tavily_query), basic_results)
+
+    def _fuse(self, queries, result_lists):
+        """Con più query i risultati vengono fusi con la RRF prima del re-ranking."""
+        if len(result_lists) == 1:
+            return result_lists[0]
+        fused = reciprocal_rank_fusion(result_lists, k=RRF_K)
+        record_count('queries', len(queries))
+        print(f"Fan-out: {len(queries)} query, {sum(len(r) for r in result_lists)} risultati -> "
+              f"{len(fused)} URL distinti dopo la fusione RRF.")
+        return fused
+
+    def _retrieve_lists(self, queries):
+        """Esegue le query in parallelo (thread) e restituisce i risultati di ciascuna."""
+        if len(queries) <= 1:
+            return [self._retrieve(q) for q in queries]
+        with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+            # Ogni thread riceve una copia del contesto, così le misure finiscono nella traccia del claim
+            futures = [executor.submit(contextvars.copy_context().run, self._retrieve, q) for q in queries]
+            return [f.result() for f in futures]
+
+    def _retrieve_all(self, queries):
+        """Esegue le query in parallelo e ne fonde i risultati."""
+        return self._fuse(queries, self._retrieve_lists(queries))
+
+    async def _aretrieve_all(self, queries):
+        """Versione asincrona di _retrieve_all: le query partono tutte insieme."""
+        if len(queries) == 1:
+            return await self._aretrieve(queries[0])
+        result_lists = await asyncio.gather(*(self._aretrieve(q) for q in queries))
+        return self._fuse(queries, list(result_lists))
+
+    @staticmethod
+    def _template_query(claim):
+        """Query deterministica senza Pianificatore: il claim tra virgolette + 'fact-check'."""
+        claim = " ".join(claim.split())
+        if len(claim) > TEMPLATE_QUERY_MAX_CHARS:
+            claim = claim[:TEMPLATE_QUERY_MAX_CHARS].rsplit(' ', 1)[0]
+        return f'"{claim}" fact-check'
 
-        # --- NUOVA FASE: RE-RANKING ---
+    def _template_is_enough(self, template_results):
+        """True se i risultati della query template coprono già abbastanza fonti affidabili."""
+        trusted = self.reranker.trusted_domains(template_results, ADAPTIVE_TRUST_THRESHOLD)
+        enough = len(trusted) >= PLANNER_BYPASS_MIN_TRUSTED_DOMAINS
+        record_label('planner_bypass', 'template' if enough else 'merged')
+        print(f"Query template: {len(trusted)} domini affidabili -> "
+              f"{'Pianificatore scartato' if enough else 'unisco con le query del Pianificatore'}.")
+        return enough
+
+    def _plan(self, claim, metadata):
+        with stage('planner'):
+            return self.generator.generate_query_set(claim, metadata)
+
+    async def _aplan(self, claim, metadata):
+        with stage('planner'):
+            return await self.generator.agenerate_query_set(claim, metadata)
+
+    def _background_plan(self, claim, metadata):
+        """
+        Pianificatore del percorso veloce sincrono, in un thread a parte: ha una
+        traccia propria, addebitata al registro dei costi appena la chiamata
+        termina, anche se nel frattempo il claim è già stato chiuso.
+        """
+        trace = self.metrics.start_trace(claim, kind='speculative_planner')
+        try:
+            return self._plan(claim, metadata)
+        finally:
+            self._finish_trace(trace, None, is_claim=False)
+
+    def _speculative_retrieve(self, claim, metadata):
+        """
+        Percorso veloce (PLANNER_BYPASS): la ricerca sulla query template parte
+        insieme al Pianificatore. Se le fonti affidabili bastano il risultato del
+        Pianificatore viene ignorato, altrimenti i risultati vengono fusi (RRF).
+        Nella versione sincrona la chiamata al Pianificatore già avviata non può
+        essere interrotta: si risparmia la latenza, non il costo, che viene
+        addebitato in background (vedi _background_plan).
+        """
+        template = self._template_query(claim)
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            planner = executor.submit(self._background_plan, claim, metadata)
+            template_results = self._retrieve(template)
+            if self._template_is_enough(template_results):
+                planner.cancel()
+                return template_results
+            queries = [q for q in planner.result() if q != template]
+        finally:
+            executor.shutdown(wait=False)
+        return self._fuse([template] + queries, [template_results] + self._retrieve_lists(queries))
+
+    async def _aspeculative_retrieve(self, claim, metadata):
+        """
+        Versione asincrona di _speculative_retrieve: il Pianificatore superfluo
+        viene annullato e atteso, così termina prima della chiusura della traccia.
+        """
+        template = self._template_query(claim)
+        planner = asyncio.create_task(self._aplan(claim, metadata))
+        try:
+            template_results = await self._aretrieve(template)
+        except BaseException:
+            planner.cancel()
+            await asyncio.gather(planner, return_exceptions=True)
+            raise
+        if self._template_is_enough(template_results):
+            planner.cancel()
+            await asyncio.gather(planner, return_exceptions=True)
+            return template_results
+
+        queries = [q for q in await planner if q != template]
+        result_lists = await asyncio.gather(*(self._aretrieve(q) for q in queries))
+        return self._fuse([template] + queries, [template_results] + list(result_lists))
+
+    def _prepare_context(self, claim, evidence_results):
+        """
+        Re-ranking dei risultati e costruzione del contesto per il Giudice.
+        Restituisce (final_evidence, context, context_tokens).
+        """
         print(f"Fase 2a: Trovati {len(evidence_results)} frammenti. Riordino per credibilità...")
-        reranked_evidence = self.reranker.rank(evidence_results)
+        with stage('rerank'):
+            reranked_evidence = self.reranker.rank_top_k(evidence_results, RERANK_CANDIDATES, claim=claim)
+
+        # Le copie sindacate della stessa notizia occuperebbero più posti nel contesto
+        with stage('dedup'):
+            reranked_evidence = self.evidence_deduplicator.dedupe(reranked_evidence)
         
-        # --- FASE 3: PREPARAZIONE CONTESTO ---
-        # Selezioniamo i Top-K DOPO il re-ranking
-        final_evidence = reranked_evidence[:TOP_K_ARTICLES]
+        # Selezioniamo i Top-K DOPO il re-ranking, entro il budget di token
+        with stage('context'):
+            final_evidence, context, context_tokens = self.context_builder.build(reranked_evidence)
+        record_count('evidence_selected', len(final_evidence))
         
-        print(f"Fase 2b: Selezionati i Top {len(final_evidence)} articoli più credibili per il Giudice.")
-        context = ""
-        for i, doc in enumerate(final_evidence):
-            context += f"PROVA {i+1} (Fonte: {doc.get('url')})\n"
-            context += f"CONTENUTO: {doc.get('content', 'N/A')}\n\n"
+        print(f"Fase 2b: Selezionati i Top {len(final_evidence)} articoli più credibili per il Giudice "
+              f"(~{context_tokens} token).")
+        return final_evidence, context, context_tokens
+
+    def run(self, claim, metadata={}): 
+        """
+        Esegue la pipeline di fact-checking completa di Re-Ranking.
+        """
+        trace = self.metrics.start_trace(claim)
+        result = None
+        try:
+            if PLANNER_BYPASS:
+                # --- FASI 1 e 2 IN PARALLELO: query template + Pianificatore ---
+                with stage('retrieval'):
+                    evidence_results = self._speculative_retrieve(claim, metadata)
+            else:
+                # --- FASE 1: PIANIFICAZIONE QUERY ---
+                queries = self._plan(claim, metadata)
+
+                # --- FASE 2: RECUPERO ---
+                print("Fase 1b: Recupero contesto con Tavily...")
+                with stage('retrieval'):
+                    evidence_results = self._retrieve_all(queries)
+            record_count('tavily_results', len(evidence_results))
             
-        # --- FASE 4: GENERAZIONE VERDETTO ---
-        print("Fase 3: Generazione verdetto LLM...")
-        result = self.generator.generate_verdict(claim, context)
-        
-        result['evidence'] = final_evidence
-        return result
\ No newline at end of file
+            if not evidence_results:
+                result = {"verdetto": "BASELESS", "motivazione": "Nessuna informazione trovata da Tavily.", "evidence": []}
+                return result
+
+            # --- FASE 3: RE-RANKING E PREPARAZIONE CONTESTO ---
+            final_evidence, context, context_tokens = self._prepare_context(claim, evidence_results)
+                
+            # --- FASE 4: GENERAZIONE VERDETTO ---
+            print("Fase 3: Generazione verdetto LLM...")
+            with stage('judge'):
+                result = self.generator.generate_verdict(claim, context)
+            
+            result['evidence'] = final_evidence
+            result['context_tokens'] = context_tokens
+            return result
+        finally:
+            metrics = self._finish_trace(trace, result)
+            if result is not None:
+                result['metrics'] = metrics
+
+    async def arun(self, claim, metadata={}, tavily_query=None):
+        """
+        Versione asincrona di run: stesse fasi, ma le chiamate a OpenAI e Tavily
+        non bloccano l'event loop e possono sovrapporsi tra claim diversi.
+        Se `tavily_query` è già stata pianificata (es. in batch) la fase 1 viene saltata;
+        può essere una singola query o una lista di query (fan-out, vedi QUERY_FANOUT).
+        """
+        trace = self.metrics.start_trace(claim)
+        result = None
+        try:
+            if tavily_query is None and PLANNER_BYPASS:
+                with stage('retrieval'):
+                    evidence_results = await self._aspeculative_retrieve(claim, metadata)
+            else:
+                if tavily_query is None:
+                    queries = await self._aplan(claim, metadata)
+                else:
+                    queries = [tavily_query] if isinstance(tavily_query, str) else list(tavily_query)
+
+                with stage('retrieval'):
+                    evidence_results = await self._aretrieve_all(queries)
+            record_count('tavily_results', len(evidence_results))
+
+            if not evidence_results:
+                result = {"verdetto": "BASELESS", "motivazione": "Nessuna informazione trovata da Tavily.", "evidence": []}
+                return result
+
+            final_evidence, context, context_tokens = self._prepare_context(claim, evidence_results)
+
+            with stage('judge'):
+                result = await self.generator.agenerate_verdict(claim, context)
+
+            result['evidence'] = final_evidence
+            result['context_tokens'] = context_tokens
+            return result
+        finally:
+            metrics = self._finish_trace(trace, result)
+            if result is not None:
+                result['metrics'] = metrics
+
+    async def run_many(self, jobs, on_result=None, concurrency=MAX_CONCURRENCY, planner_batch_size=PLANNER_BATCH_SIZE,
+                       run_id=None):
+        """
+        Esegue la pipeline su molti claim in parallelo, con al massimo
+        `concurrency` chiamate in volo contemporaneamente.
+        Con `planner_batch_size` > 1 le query vengono pianificate a gruppi,
+        con una sola chiamata al Pianificatore per gruppo (ignorato con
+        PLANNER_BYPASS: ogni claim avvia il proprio Pianificatore in parallelo
+        alla query template, così lo può annullare).
+
+        `jobs` è una lista di dizionari con almeno la chiave 'claim' (e opzionalmente
+        'metadata'). Appena un claim termina viene chiamato `on_result(job, result)`:
+        il callback è sincrono e gira nell'event loop, quindi le scritture sul
+        checkpoint non si sovrappongono mai.
+        Un claim che solleva un'eccezione viene saltato (e non salvato), così
+        verrà ritentato alla prossima esecuzione.
+        Le misure di ogni claim vengono scritte in streaming in un file JSONL
+        sotto METRICS_DIR; a fine batch si salvano anche il riepilogo JSON e
+        l'esportazione Prometheus. I nomi dei file contengono data, ora e pid
+        (più `run_id`, se indicato), così processi avviati nello stesso
+        secondo non scrivono negli stessi file.
+        Quando il budget del registro dei costi è raggiunto i claim non ancora
+        avviati vengono saltati (e ritentati alla prossima esecuzione).
+        Restituisce il numero di claim completati.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        completed = 0
+        run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}" + (f"-{run_id}" if run_id else "")
+        self.metrics.trace_path = os.path.join(METRICS_DIR, f"claims_{run_id}.jsonl")
+        started = time.perf_counter()
+
+        async def plan(chunk):
+            async with semaphore:
+                if self.ledger.over_budget():
+                    return None
+                trace = self.metrics.start_trace(kind='planner_batch')
+                try:
+                    with stage('planner_batch'):
+                        return await self.generator.agenerate_tavily_queries(
+                            [(job['claim'], job.get('metadata', {})) for job in chunk],
+                            n_queries=self.generator.query_fanout
+                        )
+                finally:
+                    self._finish_trace(trace, None, is_claim=False)
+
+        async def worker(job, plan_task=None, position=None):
+            try:
+                tavily_query = None
+                if plan_task is not None:
+                    queries = await plan_task
+                    if queries is None:
+                        return job, None
+                    tavily_query = queries[position]
+                async with semaphore:
+                    if not self.ledger.can_start():
+                        return job, None
+                    try:
+                        return job, await self.arun(job['claim'], job.get('metadata', {}), tavily_query=tavily_query)
+                    finally:
+                        self.ledger.release()
+            except Exception as e:
+                print(f"Errore durante l'elaborazione di '{job['claim'][:50]}...': {e}")
+                return job, None
+
+        tasks = []
+        if planner_batch_size > 1 and not PLANNER_BYPASS:
+            for start in range(0, len(jobs), planner_batch_size):
+                chunk = jobs[start:start + planner_batch_size]
+                plan_task = asyncio.create_task(plan(chunk))
+                tasks.extend(asyncio.create_task(worker(job, plan_task, i)) for i, job in enumerate(chunk))
+        else:
+            tasks = [asyncio.create_task(worker(job)) for job in jobs]
+        for done, next_done in enumerate(asyncio.as_completed(tasks), start=1):
+            job, result = await next_done
+            if result is None:
+                continue
+
+            completed += 1
+            print(f"[{completed}/{len(tasks)}] {result.get('verdetto')}: {job['claim'][:50]}...")
+            if on_result is not None:
+                on_result(job, result)
+            if completed % 25 == 0:
+                remaining = len(tasks) - done
+                print(f"💰 Spesa finora: ${self.ledger.spent_usd:.2f} | "
+                      f"previsto a fine batch: ~${self.ledger.spent_usd + self.ledger.project(remaining):.2f}")
+
+        elapsed = time.perf_counter() - started
+        self.metrics.observe("batch_claims_per_minute", completed / elapsed * 60 if elapsed else 0.0)
+        self.metrics.dump(
+            json_path=os.path.join(METRICS_DIR, f"metrics_{run_id}.json"),
+            prometheus_path=os.path.join(METRICS_DIR, f"metrics_{run_id}.prom")
+        )
+        with open(os.path.join(METRICS_DIR, f"costs_{run_id}.json"), mode='w', encoding='utf-8') as f:
+            json.dump(self.ledger.summary(), f, indent=2)
+        self.metrics.close()
+        self.metrics.print_stage_report()
+        self.ledger.print_report()
+        self.ledger.save()
+        print(f"Throughput: {completed} claim in {elapsed:.1f}s | Metriche salvate in {METRICS_DIR}")
+        print(f"Cache Tavily: {self.retriever.cache.stats()} | Cache LLM: {self.generator.cache.stats()}")
+        cassette = get_cassette()
+        if cassette.mode != "off":
+            cassette.save()
+            print(f"Cassetta: {cassette.stats()}")
+        return completed
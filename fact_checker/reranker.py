@@ -1,57 +1,153 @@
-import json
+import heapq
 import os
-from .utils import get_domain_from_url
+import numpy as np
+from .domains import DomainIndex, ReloadingDomainIndex, split_url, registrable_domain
+from .lexical import BM25Scorer
+from config.settings import RERANK_WEIGHTS
 
 class CredibilityReranker:
-    def __init__(self):
-        self.scores = {}
-        self.default_score = 3
+    def __init__(self, weights=None):
+        # Formula di fusione: somma pesata di credibilità, score Tavily e BM25 normalizzato
+        self.weights = dict(RERANK_WEIGHTS if weights is None else weights)
+        self.lexical = BM25Scorer()
+        config_path = os.path.join(os.path.dirname(__file__), '..', 'config', 'sources.json')
         
         try:
-            config_path = os.path.join(os.path.dirname(__file__), '..', 'config', 'sources.json')
-            with open(config_path, 'r') as f:
-                config = json.load(f)
-            
-            self.default_score = config['sources'].get('default_score', 3)
-            
-            # Carica i punteggi appiattendo la struttura JSON
-            for category, data in config['sources'].items():
-                if isinstance(data, dict) and 'domains' in data:
-                    score = data.get('score', self.default_score)
-                    for domain in data['domains']:
-                        self.scores[domain] = score
-                        
-            print(f"Re-Ranker caricato con {len(self.scores)} domini autorevoli.")
+            # Indice compilato con ricarica automatica quando sources.json cambia
+            self.index = ReloadingDomainIndex(config_path)
+            print(f"Re-Ranker caricato con {len(self.index.index)} domini autorevoli.")
             
         except FileNotFoundError:
             print("ATTENZIONE: config/sources.json non trovato. Il Re-Ranker userà solo punteggi di default.")
+            self.index = DomainIndex({})
         except Exception as e:
             print(f"Errore durante il caricamento di sources.json: {e}")
+            self.index = DomainIndex({})
+
+    @property
+    def default_score(self):
+        index = getattr(self.index, 'index', self.index)
+        return index.default_score
+
+    def credibility_of_url(self, url):
+        return self.index.lookup(url or '')
+
+    def _credibility(self, article):
+        return self.credibility_of_url(article.get('url', ''))
 
-    def rank(self, articles):
+    def trusted_domains(self, articles, min_credibility):
+        """
+        Domini registrabili distinti con credibilità almeno `min_credibility`
+        (es. agenzie e fact-checker). Misura la copertura di una ricerca.
+        """
+        self.index.maybe_reload()
+        domains = set()
+        for article in articles:
+            url = article.get('url', '')
+            if self.credibility_of_url(url) >= min_credibility:
+                domains.add(registrable_domain(split_url(url or '')[0]))
+        return domains
+
+    def _final_scores(self, articles, claim=None):
+        """
+        Punteggio finale ibrido per ogni articolo. Tavily assegna un suo "score"
+        di rilevanza; alla credibilità diamo un peso enorme, e la rilevanza
+        lessicale (BM25 tra claim e titolo + contenuto) riordina gli articoli
+        all'interno della stessa fascia di credibilità.
+        """
+        credibility = np.array([self._credibility(a) for a in articles], dtype=float)
+        relevance = np.array([a.get('score', 0.0) or 0.0 for a in articles], dtype=float)
+        scores = self.weights.get('credibility', 10.0) * credibility + self.weights.get('relevance', 1.0) * relevance
+
+        lexical_weight = self.weights.get('lexical', 0.0)
+        if claim and lexical_weight:
+            texts = [f"{a.get('title', '')} {a.get('content', '')}" for a in articles]
+            scores += lexical_weight * self.lexical.score(claim, texts)
+        return scores
+
+    @staticmethod
+    def _scored(article, score):
+        """Copia dell'articolo con il punteggio finale del re-ranking ('rerank_score')."""
+        return {**article, 'rerank_score': float(score)}
+
+    def rank(self, articles, claim=None):
         """
         Riordina una lista di articoli (da Tavily) in base al punteggio di credibilità.
+        Ogni articolo restituito è una copia con il proprio 'rerank_score'.
         """
         print(f"Re-ranking di {len(articles)} articoli per credibilità...")
+        self.index.maybe_reload()
+        if not articles:
+            return []
         
-        reranked_list = []
-        for article in articles:
-            domain = get_domain_from_url(article.get('url', ''))
-            
-            # Tavily assegna un suo "score" di rilevanza. Lo usiamo come base.
-            relevance_score = article.get('score', 0.0)
-            
-            # Cerchiamo il nostro punteggio di credibilità
-            credibility_score = self.scores.get(domain, self.default_score)
-            
-            # Calcoliamo un punteggio finale ibrido.
-            # Diamo un peso enorme alla credibilità.
-            final_score = (credibility_score * 10) + relevance_score
-            
-            reranked_list.append((final_score, article))
-        
-        # Ordina per punteggio finale, dal più alto al più basso
-        reranked_list.sort(key=lambda x: x[0], reverse=True)
-        
-        # Restituisci solo gli articoli, senza lo score
-        return [article for score, article in reranked_list]
\ No newline at end of file
+        # Ordina per punteggio finale, dal più alto al più basso (stabile sui pari merito)
+        scores = self._final_scores(articles, claim)
+        order = np.argsort(-scores, kind='stable')
+        return [self._scored(articles[i], scores[i]) for i in order]
+
+    def rank_top_k(self, articles, k, claim=None):
+        """
+        Come rank, ma restituisce solo i migliori `k` articoli usando una
+        selezione parziale con heap (O(n log k) invece di un ordinamento completo).
+        """
+        print(f"Re-ranking di {len(articles)} articoli per credibilità (top {k})...")
+        self.index.maybe_reload()
+        if not articles:
+            return []
+        scores = self._final_scores(articles, claim).tolist()
+        top = heapq.nlargest(k, range(len(articles)), key=scores.__getitem__)
+        return [self._scored(articles[i], scores[i]) for i in top]
+
+    @staticmethod
+    def _top_k_order(scores, k):
+        """
+        Indici dei top-`k` punteggi di ogni riga, in ordine decrescente. Come un
+        ordinamento stabile completo, i pari merito mantengono l'ordine di Tavily.
+        """
+        if k <= 0:
+            return np.empty((len(scores), 0), dtype=np.intp)
+        if k >= scores.shape[1]:
+            return np.argsort(-scores, axis=1, kind='stable')
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top.sort(axis=1)  # Ordine originale tra i selezionati
+        top_scores = np.take_along_axis(scores, top, axis=1)
+
+        # Se un pari merito del k-esimo punteggio è rimasto fuori, argpartition può
+        # aver scelto quello sbagliato: per quelle righe (rare, o con padding -inf)
+        # si ripiega sull'ordinamento stabile completo
+        kth = top_scores.min(axis=1, keepdims=True)
+        left_out = (scores == kth).sum(axis=1) > (top_scores == kth).sum(axis=1)
+        if left_out.any():
+            top[left_out] = np.argsort(-scores[left_out], axis=1, kind='stable')[:, :k]
+            top_scores[left_out] = np.take_along_axis(scores[left_out], top[left_out], axis=1)
+
+        return np.take_along_axis(top, np.argsort(-top_scores, axis=1, kind='stable'), axis=1)
+
+    def rank_batch(self, result_lists, k, claims=None):
+        """
+        Re-ranking di molti claim in una volta: i punteggi di tutti i risultati
+        vengono raccolti in una matrice NumPy (una riga per claim); per ogni
+        riga si selezionano i top-`k` con argpartition (O(n)) e si ordinano solo quelli.
+        Restituisce una lista di liste con i top-`k` articoli per claim.
+        """
+        if not result_lists:
+            return []
+        self.index.maybe_reload()
+
+        width = max((len(articles) for articles in result_lists), default=0)
+        if width == 0:
+            return [[] for _ in result_lists]
+
+        final_scores = np.full((len(result_lists), width), -np.inf)
+        for row, articles in enumerate(result_lists):
+            if articles:
+                claim = claims[row] if claims is not None else None
+                final_scores[row, :len(articles)] = self._final_scores(articles, claim)
+
+        order = self._top_k_order(final_scores, k)
+
+        return [
+            [self._scored(articles[i], final_scores[row, i]) for i in order[row] if i < len(articles)]
+            for row, articles in enumerate(result_lists)
+        ]
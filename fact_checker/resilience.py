@@ -0,0 +1,250 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from .metrics import record_retry, record_error
+from config.settings import PROVIDER_LIMITS, RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY
+from config.settings import CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS
+
+# Stati HTTP che indicano un problema temporaneo del provider (vale la pena riprovare)
+TRANSIENT_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+# Eccezioni temporanee riconosciute per nome (nella gerarchia della classe), così il
+# modulo non dipende dagli SDK: openai, tavily, httpx, requests e le built-in
+TRANSIENT_EXCEPTIONS = {
+    "RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError",
+    "TimeoutError", "TimeoutException", "TransportError", "ConnectionError", "Timeout",
+}
+
+# Eccezioni permanenti anche se l'SDK le accompagna con uno stato "temporaneo":
+# UsageLimitExceededError di Tavily è il piano/quota esaurito, ritentare non serve
+PERMANENT_EXCEPTIONS = {"UsageLimitExceededError"}
+
+
+class CircuitOpenError(Exception):
+    """Il circuito del provider è aperto: la chiamata non viene nemmeno tentata."""
+
+
+def status_code_of(exc):
+    status = getattr(exc, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(exc, 'response', None), 'status_code', None)
+    return status if isinstance(status, int) else None
+
+
+def is_transient(exc):
+    """True se l'errore è temporaneo (rate limit, timeout, 5xx, rete) e va ritentato."""
+    if isinstance(exc, CircuitOpenError):
+        return True
+    if any(cls.__name__ in PERMANENT_EXCEPTIONS for cls in type(exc).__mro__):
+        return False
+    status = status_code_of(exc)
+    if status is not None:
+        return status in TRANSIENT_STATUS or status >= 500
+    return any(cls.__name__ in TRANSIENT_EXCEPTIONS for cls in type(exc).__mro__)
+
+
+def is_request_error(exc):
+    """True se è la richiesta stessa a essere rifiutata (400/422): ritentare non serve."""
+    status = status_code_of(exc)
+    if status is not None:
+        return status in (400, 422)
+    return type(exc).__name__ == "BadRequestError"
+
+
+def retry_after_of(exc):
+    """Secondi suggeriti dal provider (header Retry-After / retry-after-ms), se presenti."""
+    seconds = getattr(exc, 'retry_after_seconds', None)
+    if seconds is not None:
+        return float(seconds)
+    headers = getattr(getattr(exc, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            # Formato data HTTP
+            when = email.utils.parsedate_to_datetime(value)
+            return max(0.0, when.timestamp() - time.time())
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+class TokenBucket:
+    """
+    Limitatore a secchiello: `rate` richieste al secondo in media, con raffiche
+    fino a `burst`. Il gettone viene prenotato sotto lock (il saldo può andare
+    in negativo) e poi si attende fuori dal lock, quindi funziona sia da thread
+    sia da coroutine (`acquire` / `aacquire`).
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Prenota un gettone e restituisce quanti secondi attendere prima di usarlo."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Interruttore: dopo `failure_threshold` errori temporanei consecutivi si apre
+    e per `reset_timeout` secondi le chiamate falliscono subito; poi lascia
+    passare una chiamata di prova (semi-aperto) e si richiude se va a buon fine.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self, provider):
+        if self.state == "open":
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            raise CircuitOpenError(f"Circuito '{provider}' aperto: nuovo tentativo tra {remaining:.0f}s.")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            # In semi-apertura basta un errore per riaprire il circuito
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+class ProviderGuard:
+    """
+    Protezione condivisa di un provider: limite di frequenza, retry con backoff
+    esponenziale e jitter (rispettando Retry-After) e circuit breaker.
+    Gli errori permanenti (es. 400, chiave non valida) non vengono ritentati.
+    """
+
+    def __init__(self, provider, rate, burst=1, max_attempts=RETRY_MAX_ATTEMPTS,
+                 base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY,
+                 failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_SECONDS):
+        self.provider = provider
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt, exc):
+        """Attesa prima del tentativo successivo: "full jitter", ma mai meno del Retry-After."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = retry_after_of(exc)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def _on_failure(self, attempt, exc):
+        """Registra l'errore e restituisce l'attesa prima di riprovare (None = rilancia)."""
+        if not is_transient(exc) or isinstance(exc, CircuitOpenError):
+            record_error(self.provider)
+            return None
+        self.breaker.record_failure()
+        if attempt + 1 >= self.max_attempts:
+            record_error(self.provider)
+            return None
+        record_retry(self.provider)
+        delay = self.backoff(attempt, exc)
+        print(f"[{self.provider}] Errore temporaneo ({type(exc).__name__}), "
+              f"tentativo {attempt + 2}/{self.max_attempts} tra {delay:.1f}s.")
+        return delay
+
+    def call(self, fn):
+        """Esegue `fn()` con limite di frequenza, retry e circuit breaker."""
+        for attempt in range(self.max_attempts):
+            try:
+                self.breaker.before_call(self.provider)
+                self.bucket.acquire()
+                result = fn()
+            except Exception as e:
+                delay = self._on_failure(attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, fn):
+        """Versione asincrona di call: `fn()` restituisce una coroutine."""
+        for attempt in range(self.max_attempts):
+            try:
+                self.breaker.before_call(self.provider)
+                await self.bucket.aacquire()
+                result = await fn()
+            except Exception as e:
+                delay = self._on_failure(attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+def get_guard(provider):
+    """Protezione condivisa del processo per `provider` (limiti da PROVIDER_LIMITS)."""
+    with _guards_lock:
+        if provider not in _guards:
+            limits = PROVIDER_LIMITS.get(provider, {})
+            _guards[provider] = ProviderGuard(provider, limits.get("rate", 0), limits.get("burst", 1))
+        return _guards[provider]
+
+def share_limit(provider, processes):
+    """
+    I limiti di PROVIDER_LIMITS valgono per processo: quando `processes`
+    processi usano la stessa chiave API (es. gli shard di run_sharded.py),
+    ciascuno ne riceve una parte uguale, così insieme restano entro il limite.
+    """
+    limits = PROVIDER_LIMITS.get(provider, {})
+    processes = max(1, processes)
+    get_guard(provider).bucket = TokenBucket(limits.get("rate", 0) / processes,
+                                             max(1, limits.get("burst", 1) // processes))
@@ -0,0 +1,204 @@
+import csv
+import itertools
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+from .checkpoint import content_hash
+from config.settings import RESULTS_TOP_K_EVIDENCE, RESULTS_FLUSH_EVERY, RESULTS_FLUSH_INTERVAL
+
+# Fasi della pipeline salvate come colonne "<fase>_seconds" (vedi fact_checker/metrics.py)
+STAGES = ('planner', 'retrieval', 'rerank', 'dedup', 'context', 'judge', 'total')
+
+SCHEMA = pa.schema(
+    [
+        ('claim', pa.string()),
+        ('claim_hash', pa.int64()),
+        ('run_id', pa.string()),
+        ('recorded_at', pa.timestamp('ms', tz='UTC')),
+        ('source', pa.string()),              # pipeline, reused (quasi-duplicato), csv o checkpoint (import)
+        ('politifact_label', pa.string()),    # Solo per il dataset PolitiFact
+        ('rag_label', pa.string()),
+        ('rag_motivation', pa.string()),
+        ('context_tokens', pa.int32()),
+        ('prompt_tokens', pa.int32()),
+        ('completion_tokens', pa.int32()),
+        ('llm_calls', pa.int32()),
+        ('cost_usd', pa.float64()),
+    ]
+    + [(f'{name}_seconds', pa.float32()) for name in STAGES]
+    + [
+        ('evidence_urls', pa.list_(pa.string())),
+        ('evidence_scores', pa.list_(pa.float32())),
+    ]
+)
+
+# Numero progressivo degli archivi aperti dal processo (entra nel run_id)
+_store_counter = itertools.count(1)
+
+
+class ResultsStore:
+    """
+    Archivio colonnare dei risultati: ogni `flush_every` claim o
+    `flush_interval` secondi (gli stessi intervalli del commit del checkpoint)
+    un nuovo file Parquet viene aggiunto al dataset `path`, partizionato per giorno
+    (path/run_date=AAAA-MM-GG/part-<run>-<n>.parquet). Oltre a verdetto e
+    motivazione conserva tempi per fase, token, costo e i primi `top_k`
+    articoli del contesto (URL e punteggio del re-ranking), così le analisi non devono
+    rieseguire la pipeline per sapere quali fonti hanno portato a un verdetto.
+
+    I file vengono scritti in modo atomico (temporaneo + rename) e ogni
+    processo usa un proprio run_id, quindi gli shard di run_sharded.py
+    possono scrivere nello stesso dataset.
+    """
+
+    def __init__(self, path, top_k=RESULTS_TOP_K_EVIDENCE, flush_every=RESULTS_FLUSH_EVERY,
+                 flush_interval=RESULTS_FLUSH_INTERVAL):
+        self.path = path
+        self.top_k = top_k
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        # Unico anche per due archivi aperti dallo stesso processo nello stesso secondo,
+        # altrimenti i loro file part-<run_id>-<n> si sovrascriverebbero
+        self.run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_store_counter)}"
+        self._records = []
+        self._parts = 0
+        self._last_flush = time.monotonic()
+
+    def add(self, claim, result, politifact_label=None, source='pipeline'):
+        """
+        Accoda il risultato di un claim; la scrittura su disco avviene a gruppi.
+        `source` distingue i verdetti della pipeline da quelli riutilizzati
+        ('reused', quasi-duplicati) o importati ('csv').
+        """
+        self._records.append(self._record(claim, result, politifact_label, source))
+        if len(self._records) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def _record(self, claim, result, politifact_label, source):
+        metrics = result.get('metrics') or {}
+        stages = metrics.get('stages') or {}
+        evidence = (result.get('evidence') or [])[:self.top_k]
+        record = {
+            'claim': claim,
+            'claim_hash': content_hash(claim),
+            'run_id': self.run_id,
+            'recorded_at': int(time.time() * 1000),
+            'source': source,
+            'politifact_label': politifact_label,
+            'rag_label': result.get('verdetto'),
+            'rag_motivation': result.get('motivazione'),
+            'context_tokens': result.get('context_tokens'),
+            'prompt_tokens': metrics.get('prompt_tokens'),
+            'completion_tokens': metrics.get('completion_tokens'),
+            'llm_calls': metrics.get('llm_calls'),
+            'cost_usd': metrics.get('cost_usd'),
+            'evidence_urls': [article.get('url') for article in evidence],
+            'evidence_scores': [article.get('rerank_score') for article in evidence],
+        }
+        for name in STAGES:
+            record[f'{name}_seconds'] = stages.get(name)
+        return record
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._records:
+            return
+        table = pa.Table.from_pylist(self._records, schema=SCHEMA)
+        partition = os.path.join(self.path, f"run_date={time.strftime('%Y-%m-%d', time.gmtime())}")
+        os.makedirs(partition, exist_ok=True)
+        file_path = os.path.join(partition, f"part-{self.run_id}-{self._parts:05d}.parquet")
+        # Il prefisso "." esclude il file temporaneo dalla lettura del dataset
+        tmp_path = os.path.join(partition, f".{os.path.basename(file_path)}.tmp")
+        pq.write_table(table, tmp_path, compression='zstd')
+        os.replace(tmp_path, file_path)
+        self._parts += 1
+        self._records = []
+
+    def close(self):
+        self.flush()
+
+    def import_rows(self, rows, key_field, source, skip_hashes=(), rows_per_file=50_000):
+        """
+        Importa righe di output già salvate altrove (CSV o checkpoint, senza
+        prove né tempi), saltando i claim in `skip_hashes`, in file da
+        `rows_per_file` righe. Restituisce il numero di righe importate.
+        """
+        self.flush()
+        imported = 0
+        for row in rows:
+            if not row.get(key_field) or content_hash(row[key_field]) in skip_hashes:
+                continue
+            result = {'verdetto': row.get('rag_label'), 'motivazione': row.get('rag_motivation')}
+            self._records.append(self._record(row[key_field], result, row.get('politifact_label') or None, source))
+            imported += 1
+            if len(self._records) >= rows_per_file:
+                self.flush()
+        self.flush()
+        return imported
+
+    def import_csv(self, csv_path, key_field, skip_hashes=()):
+        """Importa un CSV di output esistente (vedi import_rows)."""
+        if not os.path.exists(csv_path):
+            return 0
+        with open(csv_path, mode='r', encoding='utf-8', newline='') as f:
+            return self.import_rows(csv.DictReader(f), key_field, 'csv', skip_hashes)
+
+
+def _has_files(path):
+    return any(name.endswith('.parquet') for _, _, files in os.walk(path) for name in files)
+
+
+def _dataset(path):
+    return ds.dataset(path, schema=SCHEMA, format='parquet', partitioning='hive',
+                      filesystem=pafs.LocalFileSystem(use_mmap=True))
+
+
+def stored_hashes(path):
+    """Impronte dei claim già presenti nel dataset (legge solo la colonna claim_hash)."""
+    if not os.path.isdir(path) or not _has_files(path):
+        return set()
+    return set(_dataset(path).to_table(columns=['claim_hash']).column('claim_hash').to_pylist())
+
+
+def open_results(path, csv_path, key_field, checkpoint=None):
+    """
+    Apre l'archivio dei risultati e lo riallinea con l'output già salvato:
+    le righe del checkpoint (o, se non è indicato, del CSV di output) il cui
+    claim manca dal dataset vengono importate. Così né il primo utilizzo né
+    un crash prima dello svuotamento del buffer lasciano claim fuori dalle analisi.
+    """
+    store = ResultsStore(path)
+    known = stored_hashes(path)
+    if checkpoint is not None:
+        imported = store.import_rows(checkpoint.rows(), key_field, 'checkpoint', known)
+        origin = checkpoint.path
+    else:
+        imported = store.import_csv(csv_path, key_field, known)
+        origin = csv_path
+    if imported:
+        print(f"Importate {imported} righe da {origin} nell'archivio dei risultati {path}.")
+    return store
+
+
+def read_results(path, columns=None):
+    """
+    Legge dal dataset solo le colonne richieste (file mappati in memoria) e
+    restituisce un DataFrame con l'ultimo risultato salvato per ogni claim,
+    oppure None se il dataset non esiste ancora. Sola lettura: l'allineamento
+    con checkpoint e CSV avviene in open_results, dagli script che scrivono.
+    """
+    if not os.path.isdir(path) or not _has_files(path):
+        return None
+
+    wanted = list(columns) if columns is not None else SCHEMA.names
+    read_columns = list(dict.fromkeys(wanted + ['claim_hash', 'recorded_at']))
+    df = _dataset(path).to_table(columns=read_columns).to_pandas()
+
+    # Un claim salvato in più esecuzioni (es. shard ripresi) conta una volta sola
+    df = df.sort_values('recorded_at', kind='stable').drop_duplicates('claim_hash', keep='last')
+    return df[wanted].reset_index(drop=True)
@@ -1,27 +1,93 @@
-from tavily import TavilyClient
-from config.settings import TAVILY_API_KEY, TAVILY_MAX_RESULTS
+from tavily import TavilyClient, AsyncTavilyClient
+from config.settings import (
+    TAVILY_API_KEY, TAVILY_MAX_RESULTS, TAVILY_BASE_URL,
+    RETRIEVAL_CACHE_PATH, RETRIEVAL_CACHE_MODE, RETRIEVAL_CACHE_TTL, RETRIEVAL_CACHE_MAX_BYTES
+)
+from .cache import DiskCache, make_cache_key, normalize_query
+from .metrics import record_tavily_call
+from .resilience import get_guard, is_request_error
+from .cassette import wrap_clients
 
 class TavilyRetriever:
-    def __init__(self):
-        self.client = TavilyClient(api_key=TAVILY_API_KEY)
+    def __init__(self, api_key=None):
+        api_key = api_key or TAVILY_API_KEY
+        # L'endpoint viene passato solo se configurato (le versioni vecchie dell'SDK non lo supportano)
+        client_options = {"api_base_url": TAVILY_BASE_URL} if TAVILY_BASE_URL else {}
+        self.client, self.async_client = wrap_clients(
+            "tavily",
+            lambda: TavilyClient(api_key=api_key, **client_options),
+            lambda: AsyncTavilyClient(api_key=api_key, **client_options)
+        )
+        # Limite di frequenza, retry e circuit breaker condivisi con gli altri client Tavily
+        self.guard = get_guard("tavily")
         self.max_results = TAVILY_MAX_RESULTS
+        self.cache = DiskCache(
+            RETRIEVAL_CACHE_PATH,
+            mode=RETRIEVAL_CACHE_MODE,
+            ttl_seconds=RETRIEVAL_CACHE_TTL,
+            max_bytes=RETRIEVAL_CACHE_MAX_BYTES
+        )
+
+    def _search_params(self, claim_query, search_depth="advanced", max_results=None):
+        """Parametri di ricerca condivisi tra la versione sincrona e asincrona."""
+        return {
+            "query": claim_query,
+            "search_depth": search_depth,
+            "include_raw_content": False,
+            "max_results": max_results or self.max_results
+        }
+
+    def _cache_key(self, params):
+        """Chiave della cache: query normalizzata + tutti i parametri di ricerca."""
+        return make_cache_key({**params, "query": normalize_query(params["query"])})
         
-    def search(self, claim_query):
+    def search(self, claim_query, search_depth="advanced", max_results=None):
         """
         Interroga Tavily usando il claim in linguaggio naturale
         e ottiene un contesto pulito e le fonti.
+        Di default usa la ricerca più profonda (advanced, TAVILY_MAX_RESULTS risultati).
         """
+        params = self._search_params(claim_query, search_depth, max_results)
+        cache_key = self._cache_key(params)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            print("Risultati Tavily recuperati dalla cache locale.")
+            return cached
+
         try:
-            response = self.client.search(
-                query=claim_query,
-                search_depth="advanced", 
-                include_raw_content=False, 
-                max_results=self.max_results
-            )
+            response = self.guard.call(lambda: self.client.search(**params))
+            record_tavily_call(params["search_depth"])
             
             # La lista di risultati è nella chiave 'results'
-            return response.get('results', []) 
+            results = response.get('results', [])
+            self.cache.set(cache_key, results)
+            return results
         
         except Exception as e:
+            # Solo una query rifiutata (400) equivale a "nessun risultato"; gli altri errori
+            # (temporanei o di configurazione) risalgono, così il claim non viene salvato come BASELESS
+            if not is_request_error(e):
+                raise
+            print(f"Errore durante la chiamata a Tavily: {e}")
+            return []
+
+    async def asearch(self, claim_query, search_depth="advanced", max_results=None):
+        """Versione asincrona di search, usata da FactCheckPipeline.arun."""
+        params = self._search_params(claim_query, search_depth, max_results)
+        cache_key = self._cache_key(params)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            response = await self.guard.acall(lambda: self.async_client.search(**params))
+            record_tavily_call(params["search_depth"])
+            results = response.get('results', [])
+            self.cache.set(cache_key, results)
+            return results
+
+        except Exception as e:
+            if not is_request_error(e):
+                raise
             print(f"Errore durante la chiamata a Tavily: {e}")
             return []
\ No newline at end of file
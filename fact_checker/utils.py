@@ -1,11 +1,6 @@
-from urllib.parse import urlparse
+from .domains import split_url
 
 def get_domain_from_url(url):
     """Estrae il dominio pulito da un URL (es. 'www.repubblica.it' -> 'repubblica.it')."""
-    try:
-        domain = urlparse(url).netloc
-        if domain.startswith('www.'):
-            return domain[4:]
-        return domain
-    except:
-        return None
\ No newline at end of file
+    host, _ = split_url(url or '')
+    return host or None
\ No newline at end of file
@@ -0,0 +1,176 @@
+import argparse
+import asyncio
+import glob
+import importlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from fact_checker.checkpoint import CheckpointStore, content_hash, open_checkpoint
+from fact_checker.results_store import ResultsStore, open_results
+from config.settings import OPENAI_API_KEYS, TAVILY_API_KEYS, COST_BUDGET_USD, COST_BUDGET_TOKENS
+
+# Dataset supportati -> script di valutazione che espone INPUT/OUTPUT/CHECKPOINT,
+# RESULTS_DATASET, KEY_FIELD, OUTPUT_HEADERS, iter_input_jobs() e build_output_row()
+DATASETS = {
+    'politifact': 'evaluate',
+    'trump': 'evaluate_trump',
+}
+
+# Ogni shard ha il proprio checkpoint, così può essere ripreso indipendentemente
+SHARD_DIR = "output/shards"
+
+
+def shard_of(claim, num_shards):
+    """Shard di un claim: dipende solo dal suo testo, quindi è stabile tra esecuzioni."""
+    return content_hash(claim) % num_shards
+
+def shard_path(dataset, shard, num_shards):
+    return os.path.join(SHARD_DIR, f"{dataset}.{shard}-of-{num_shards}.sqlite")
+
+def all_shard_paths(dataset):
+    """
+    Checkpoint di tutti gli shard del dataset, qualunque fosse il numero di
+    shard dell'esecuzione che li ha creati (il default dipende dalla macchina).
+    """
+    return sorted(glob.glob(os.path.join(SHARD_DIR, f"{dataset}.*-of-*.sqlite")))
+
+def shards_per_key(shard, num_shards, num_keys):
+    """Shard che usano la stessa chiave API di `shard` (assegnate a rotazione)."""
+    return len(range(shard % num_keys, num_shards, num_keys))
+
+def run_shard(dataset, shard, num_shards, limit):
+    """
+    Worker di un singolo processo: esegue una FactCheckPipeline indipendente
+    sui claim del proprio shard non ancora presenti nel checkpoint canonico
+    né in quelli degli shard (anche di esecuzioni con un altro numero di shard).
+    """
+    from fact_checker.pipeline import FactCheckPipeline
+    from fact_checker.costs import CostLedger
+    from fact_checker.resilience import share_limit
+
+    evaluator = importlib.import_module(DATASETS[dataset])
+    canonical = CheckpointStore(evaluator.CHECKPOINT_PATH, evaluator.KEY_FIELD)
+    own_path = shard_path(dataset, shard, num_shards)
+    store = CheckpointStore(own_path, evaluator.KEY_FIELD)
+    # Risultati già pagati in shard di esecuzioni precedenti non ancora uniti
+    others = [CheckpointStore(path, evaluator.KEY_FIELD)
+              for path in all_shard_paths(dataset) if os.path.abspath(path) != os.path.abspath(own_path)]
+
+    jobs = []
+    seen = set()
+    for job in evaluator.iter_input_jobs():
+        claim = job['claim']
+        if shard_of(claim, num_shards) != shard:
+            continue
+        if claim in canonical or claim in store or claim in seen:
+            continue
+        if any(claim in other for other in others):
+            continue
+        if limit is not None and len(jobs) >= limit:
+            break
+        seen.add(claim)
+        jobs.append(job)
+    canonical.close()
+    for other in others:
+        other.close()
+
+    print(f"[Shard {shard}/{num_shards}] {len(jobs)} claim da processare.")
+    if not jobs:
+        store.close()
+        return shard, 0, 0
+
+    # Il budget viene diviso in parti uguali tra gli shard; lo storico dei costi
+    # non viene salvato dai worker per non sovrascriversi a vicenda
+    ledger = CostLedger(
+        budget_usd=COST_BUDGET_USD / num_shards if COST_BUDGET_USD else None,
+        budget_tokens=COST_BUDGET_TOKENS // num_shards if COST_BUDGET_TOKENS else None,
+        path=None
+    )
+    # Una chiave API per shard (a rotazione se gli shard sono più delle chiavi):
+    # gli shard sulla stessa chiave si dividono i limiti di frequenza del provider
+    share_limit("openai", shards_per_key(shard, num_shards, len(OPENAI_API_KEYS)))
+    share_limit("tavily", shards_per_key(shard, num_shards, len(TAVILY_API_KEYS)))
+    pipeline = FactCheckPipeline(
+        openai_api_key=OPENAI_API_KEYS[shard % len(OPENAI_API_KEYS)],
+        tavily_api_key=TAVILY_API_KEYS[shard % len(TAVILY_API_KEYS)],
+        ledger=ledger
+    )
+    # Ogni shard aggiunge i propri file (run_id distinto) all'archivio dei risultati
+    results = ResultsStore(evaluator.RESULTS_DATASET)
+
+    def save_result(job, result):
+        store.add(evaluator.build_output_row(job, result))
+        results.add(job['claim'], result, politifact_label=job.get('politifact_label'))
+
+    try:
+        completed = asyncio.run(pipeline.run_many(jobs, on_result=save_result, run_id=f"shard{shard}-of-{num_shards}"))
+    finally:
+        store.close()
+        results.close()
+    return shard, len(jobs), completed
+
+def merge_shards(dataset):
+    """
+    Unisce i checkpoint di tutti gli shard presenti in SHARD_DIR (anche di
+    esecuzioni con un altro numero di shard) in quello canonico, senza
+    duplicati, e rigenera il CSV di output nell'ordine del file di input.
+    """
+    evaluator = importlib.import_module(DATASETS[dataset])
+    canonical = open_checkpoint(evaluator.CHECKPOINT_PATH, evaluator.OUTPUT_FILE_PATH, evaluator.KEY_FIELD)
+
+    merged = 0
+    for path in all_shard_paths(dataset):
+        store = CheckpointStore(path, evaluator.KEY_FIELD)
+        for row in store.rows():
+            if canonical.add(row):
+                merged += 1
+        store.close()
+
+    input_order = (job['claim'] for job in evaluator.iter_input_jobs())
+    canonical.export_csv(evaluator.OUTPUT_FILE_PATH, evaluator.OUTPUT_HEADERS, order=input_order)
+    # Recupera nell'archivio dei risultati i claim di shard interrotti prima dello svuotamento del buffer
+    open_results(evaluator.RESULTS_DATASET, evaluator.OUTPUT_FILE_PATH, evaluator.KEY_FIELD, checkpoint=canonical).close()
+    print(f"Merge completato: {merged} nuove righe, {len(canonical)} totali in {evaluator.OUTPUT_FILE_PATH}.")
+    canonical.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Valutazione RAG suddivisa in shard su più processi.")
+    parser.add_argument('dataset', choices=sorted(DATASETS))
+    parser.add_argument('--shards', type=int, default=os.cpu_count() or 1, help="Numero di processi/shard.")
+    parser.add_argument('--limit', type=int, default=None, help="Massimo di nuovi claim per shard.")
+    parser.add_argument('--merge-only', action='store_true', help="Esegue solo il merge dei checkpoint esistenti.")
+    args = parser.parse_args()
+
+    evaluator = importlib.import_module(DATASETS[args.dataset])
+    if not os.path.exists(evaluator.INPUT_FILE_PATH):
+        print(f"ERRORE: File di input non trovato: {evaluator.INPUT_FILE_PATH}")
+        return
+
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    # Inizializza checkpoint canonico e archivio dei risultati (import dal CSV) prima di avviare i worker
+    canonical = open_checkpoint(evaluator.CHECKPOINT_PATH, evaluator.OUTPUT_FILE_PATH, evaluator.KEY_FIELD)
+    open_results(evaluator.RESULTS_DATASET, evaluator.OUTPUT_FILE_PATH, evaluator.KEY_FIELD, checkpoint=canonical).close()
+    canonical.close()
+
+    if not args.merge_only:
+        print(f"Avvio di {args.shards} shard per '{args.dataset}' "
+              f"({len(OPENAI_API_KEYS)} chiavi OpenAI, {len(TAVILY_API_KEYS)} chiavi Tavily).")
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=args.shards, mp_context=context) as executor:
+            futures = {
+                executor.submit(run_shard, args.dataset, shard, args.shards, args.limit): shard
+                for shard in range(args.shards)
+            }
+            for future in as_completed(futures):
+                try:
+                    shard, planned, completed = future.result()
+                    print(f"✅ Shard {shard}: {completed}/{planned} claim completati.")
+                except Exception as e:
+                    # Lo shard fallito riprenderà dal suo checkpoint alla prossima esecuzione
+                    print(f"❌ Shard {futures[future]} interrotto: {e}")
+
+    merge_shards(args.dataset)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# I moduli del progetto si importano dalla radice del repository (come fanno gli script)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
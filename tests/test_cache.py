@@ -0,0 +1,119 @@
+import time
+
+import pytest
+
+import fact_checker.cache as cache_module
+from fact_checker.cache import (
+    CACHE_BYPASS, CACHE_READ_ONLY, DiskCache, MemoryCache, make_cache_key, normalize_query
+)
+
+
+def test_make_cache_key_ignores_key_order():
+    assert make_cache_key({'a': 1, 'b': [1, 2]}) == make_cache_key({'b': [1, 2], 'a': 1})
+    assert make_cache_key({'a': 1}) != make_cache_key({'a': 2})
+
+
+def test_normalize_query():
+    assert normalize_query("  Biden   Tax\tPlan ") == "biden tax plan"
+    assert normalize_query(None) == ""
+
+
+def test_invalid_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        DiskCache(str(tmp_path / "c.sqlite"), mode="scrivi")
+
+
+def test_round_trip_and_stats(tmp_path):
+    cache = DiskCache(str(tmp_path / "c.sqlite"))
+    assert cache.get("k") is None
+    cache.set("k", {"query": "q", "n": [1, 2]})
+    assert cache.get("k") == {"query": "q", "n": [1, 2]}
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+    assert cache.invalidate("k")
+    assert not cache.invalidate("k")
+    assert cache.get("k") is None
+    cache.close()
+
+
+def test_ttl_expires_entries(tmp_path):
+    cache = DiskCache(str(tmp_path / "c.sqlite"), ttl_seconds=60)
+    cache.set("k", "v")
+    cache._conn.execute("UPDATE cache SET created_at = created_at - 120")
+    cache._conn.commit()
+    assert cache.get("k") is None
+    # La voce scaduta viene eliminata dalla successiva scrittura
+    cache.set("other", "v")
+    assert cache._conn.execute("SELECT COUNT(*) FROM cache WHERE key = 'k'").fetchone()[0] == 0
+    cache.close()
+
+
+def test_lru_eviction_respects_max_bytes(tmp_path):
+    cache = DiskCache(str(tmp_path / "c.sqlite"), max_bytes=30)
+    cache.set("a", "x" * 10)  # 12 byte serializzati
+    cache.set("b", "y" * 10)
+    cache.set("c", "z" * 10)
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 10 and cache.get("c") == "z" * 10
+    cache.close()
+
+
+def test_hits_do_not_write_but_still_count_for_lru(tmp_path):
+    cache = DiskCache(str(tmp_path / "c.sqlite"), max_bytes=30)
+    cache.set("a", "x" * 10)
+    cache.set("b", "y" * 10)
+    cache._conn.execute("UPDATE cache SET accessed_at = accessed_at - ?", (2 * cache_module.ACCESS_TOUCH_INTERVAL,))
+    cache._conn.execute("UPDATE cache SET accessed_at = accessed_at - 1 WHERE key = 'a'")
+    cache._conn.commit()
+
+    assert cache.get("a") == "x" * 10
+    assert not cache._conn.in_transaction
+
+    # "a" è stato letto di recente: a far posto a "c" è "b"
+    cache.set("c", "z" * 10)
+    keys = {key for (key,) in cache._conn.execute("SELECT key FROM cache")}
+    assert keys == {"a", "c"}
+    cache.close()
+
+
+def test_pending_access_times_are_written_on_close(tmp_path):
+    path = str(tmp_path / "c.sqlite")
+    cache = DiskCache(path)
+    cache.set("a", 1)
+    cache._conn.execute("UPDATE cache SET accessed_at = 0")
+    cache._conn.commit()
+    cache.get("a")
+    cache.close()
+
+    cache = DiskCache(path)
+    (accessed_at,) = cache._conn.execute("SELECT accessed_at FROM cache WHERE key = 'a'").fetchone()
+    assert accessed_at > time.time() - 60
+    cache.close()
+
+
+def test_read_only_and_bypass_modes(tmp_path):
+    path = str(tmp_path / "c.sqlite")
+    writer = DiskCache(path)
+    writer.set("k", "v")
+    writer.close()
+
+    reader = DiskCache(path, mode=CACHE_READ_ONLY)
+    reader.set("new", "v")
+    assert reader.get("k") == "v"
+    assert reader.get("new") is None
+    assert not reader.invalidate("k")
+    reader.close()
+
+    bypass = DiskCache(str(tmp_path / "unused" / "c.sqlite"), mode=CACHE_BYPASS)
+    bypass.set("k", "v")
+    assert bypass.get("k") is None
+    assert not (tmp_path / "unused").exists()
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
@@ -0,0 +1,88 @@
+import csv
+
+from fact_checker.checkpoint import CheckpointStore, content_hash, open_checkpoint
+
+
+def _row(claim, label="FALSE"):
+    return {'claim': claim, 'rag_label': label, 'rag_motivation': f"m {claim}"}
+
+
+def test_content_hash_is_stable_signed_64bit():
+    h = content_hash("  Claim di prova ")
+    assert h == content_hash("Claim di prova")
+    assert -2 ** 63 <= h < 2 ** 63
+    assert content_hash("altro claim") != h
+    assert content_hash(None) == content_hash("")
+
+
+def test_add_skips_duplicates_and_survives_reopen(tmp_path):
+    path = str(tmp_path / "cp.sqlite")
+    store = CheckpointStore(path, 'claim', commit_every=2)
+    assert store.add(_row("a"))
+    assert not store.add(_row("a", "TRUE"))
+    assert store.add(_row("b"))
+    assert store.add(_row("c"))
+    store.close()
+
+    store = CheckpointStore(path, 'claim')
+    assert len(store) == 3
+    assert "a" in store and "d" not in store
+    assert store.get("a")['rag_label'] == "FALSE"
+    assert store.get_hash(content_hash("b"))['claim'] == "b"
+    assert store.get("d") is None
+    assert [row['claim'] for row in store.rows()] == ["a", "b", "c"]
+    store.close()
+
+
+def test_rows_since_resumes_from_position(tmp_path):
+    store = CheckpointStore(str(tmp_path / "cp.sqlite"), 'claim')
+    for claim in "abc":
+        store.add(_row(claim))
+    positions = [seq for seq, _ in store.rows_since(0)]
+    assert [row['claim'] for _, row in store.rows_since(positions[0])] == ["b", "c"]
+    assert list(store.rows_since(positions[-1])) == []
+    store.close()
+
+
+def test_group_commit_is_visible_to_other_connections_after_flush(tmp_path):
+    path = str(tmp_path / "cp.sqlite")
+    writer = CheckpointStore(path, 'claim', commit_every=100, commit_interval=3600)
+    writer.add(_row("a"))
+    assert len(CheckpointStore(path, 'claim')) == 0
+    writer.flush()
+    assert len(CheckpointStore(path, 'claim')) == 1
+    writer.close()
+
+
+def test_export_csv_follows_input_order_and_appends_the_rest(tmp_path):
+    store = CheckpointStore(str(tmp_path / "cp.sqlite"), 'claim')
+    for claim in "abc":
+        store.add(_row(claim))
+    out = str(tmp_path / "out.csv")
+    store.export_csv(out, ['claim', 'rag_label'], order=["c", "x", "a", "c"])
+    with open(out, encoding='utf-8', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['claim'] for row in rows] == ["c", "a", "b"]
+    assert set(rows[0]) == {'claim', 'rag_label'}
+    assert not (tmp_path / "out.csv.tmp").exists()
+    store.close()
+
+
+def test_open_checkpoint_imports_existing_csv_once(tmp_path):
+    csv_path = str(tmp_path / "out.csv")
+    with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['claim', 'rag_label'])
+        writer.writeheader()
+        writer.writerows([{'claim': "a", 'rag_label': "TRUE"}, {'claim': "", 'rag_label': "X"},
+                          {'claim': "a", 'rag_label': "FALSE"}, {'claim': "b", 'rag_label': "FALSE"}])
+    path = str(tmp_path / "cp.sqlite")
+    store = open_checkpoint(path, csv_path, 'claim')
+    assert len(store) == 2
+    assert store.get("a")['rag_label'] == "TRUE"
+    store.add(_row("c"))
+    store.close()
+
+    # Alla riapertura il checkpoint non è vuoto: il CSV non viene reimportato
+    store = open_checkpoint(path, csv_path, 'claim')
+    assert len(store) == 3
+    store.close()
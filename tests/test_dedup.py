@@ -0,0 +1,106 @@
+import numpy as np
+
+from fact_checker.checkpoint import CheckpointStore, content_hash
+from fact_checker.dedup import (
+    REUSED_PREFIX, ClaimDeduplicator, EvidenceDeduplicator, LSHIndex, MinHasher, PersistentLSHIndex,
+    _choose_bands, estimate_jaccard, shingles
+)
+
+CLAIM = "The unemployment rate fell to its lowest level in fifty years under my administration"
+NEAR = "The unemployment rate fell to its lowest level in fifty years under my administration!!"
+OTHER = "Millions of illegal votes were cast in the last presidential election in California"
+
+
+def test_shingles():
+    assert shingles("A b c d") == {"a b c", "b c d"}
+    assert shingles("Solo due") == {"solo due"}
+    assert shingles("") == set()
+
+
+def test_minhash_estimates_jaccard():
+    hasher = MinHasher()
+    signature = hasher.signature(CLAIM)
+    assert signature.dtype == np.uint64 and len(signature) == 128
+    assert np.array_equal(signature, MinHasher().signature(CLAIM))
+    assert estimate_jaccard(signature, hasher.signature(NEAR)) == 1.0
+    assert estimate_jaccard(signature, hasher.signature(OTHER)) < 0.2
+
+
+def test_choose_bands_divides_num_perm():
+    for threshold in (0.5, 0.8, 0.9):
+        bands, rows = _choose_bands(128, threshold)
+        assert bands * rows == 128
+        assert abs((1 / bands) ** (1 / rows) - threshold) < 0.1
+
+
+def test_lsh_index_query():
+    index = LSHIndex(threshold=0.9)
+    index.add("a", CLAIM, payload=1)
+    index.add("b", OTHER, payload=2)
+    assert [(key, payload) for key, payload, _ in index.query(NEAR)] == [("a", 1)]
+
+
+def test_persistent_index_survives_reopen_and_rebuilds_on_new_params(tmp_path):
+    path = str(tmp_path / "lsh.sqlite")
+    index = PersistentLSHIndex(path, threshold=0.9)
+    assert index.add(1, CLAIM)
+    assert not index.add(1, CLAIM)
+    index.add(2, OTHER)
+    index.position = 7
+    index.close()
+
+    index = PersistentLSHIndex(path, threshold=0.9)
+    assert len(index) == 2 and index.position == 7
+    assert [key for key, _ in index.query(NEAR)] == [1]
+    index.close()
+
+    index = PersistentLSHIndex(path, threshold=0.5)
+    assert len(index) == 0 and index.position == 0
+    index.close()
+
+
+def _checkpoint(tmp_path, rows):
+    checkpoint = CheckpointStore(str(tmp_path / "cp.sqlite"), 'claim')
+    for claim, label, motivation in rows:
+        checkpoint.add({'claim': claim, 'rag_label': label, 'rag_motivation': motivation})
+    return checkpoint
+
+
+def test_claim_deduplicator_reuses_verdicts_from_checkpoint(tmp_path):
+    checkpoint = _checkpoint(tmp_path, [(CLAIM, "FALSE", "smentito"), (OTHER, "ERRORE", "timeout")])
+    index_path = str(tmp_path / "lsh.sqlite")
+    dedup = ClaimDeduplicator(checkpoint, index_path)
+    assert dedup.sync() == 1  # Il verdetto ERRORE non si propaga
+    assert dedup.sync() == 0
+
+    reused = dedup.reuse(NEAR)
+    assert reused['verdetto'] == "FALSE" and reused['source_claim'] == CLAIM
+    assert reused['motivazione'].startswith(REUSED_PREFIX) and reused['motivazione'].endswith("smentito")
+    assert dedup.reuse(OTHER) is None
+    assert dedup.calls_saved == ClaimDeduplicator.CALLS_PER_CLAIM
+
+    # Il verdetto riutilizzato finisce nel checkpoint ma non nell'indice
+    checkpoint.add({'claim': NEAR, 'rag_label': reused['verdetto'], 'rag_motivation': reused['motivazione']})
+    dedup.add(NEAR, reused)
+    assert dedup.sync() == 0
+    assert content_hash(NEAR) not in dedup.index
+    dedup.close()
+
+    # Riaprendo, l'indice riparte dalla posizione salvata
+    dedup = ClaimDeduplicator(checkpoint, index_path)
+    assert dedup.sync() == 0
+    assert dedup.find(NEAR)[0]['claim'] == CLAIM
+    dedup.close()
+    checkpoint.close()
+
+
+def test_evidence_deduplicator_keeps_first_of_each_cluster():
+    docs = [
+        {'url': "https://reuters.com/a", 'content': CLAIM},
+        {'url': "https://other.com/a", 'content': NEAR},
+        {'url': "https://x.com/b", 'content': OTHER},
+    ]
+    kept = EvidenceDeduplicator().dedupe(docs)
+    assert [doc['url'] for doc in kept] == ["https://reuters.com/a", "https://x.com/b"]
+    assert kept[0]['cluster_size'] == 2 and kept[0]['duplicate_urls'] == ["https://other.com/a"]
+    assert 'cluster_size' not in docs[0]
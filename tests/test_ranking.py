@@ -0,0 +1,50 @@
+import numpy as np
+
+from fact_checker.fusion import reciprocal_rank_fusion
+from fact_checker.reranker import CredibilityReranker
+
+
+def test_rrf_rewards_urls_found_by_several_queries():
+    lists = [
+        [{'url': "a", 'score': 0.9}, {'url': "b", 'score': 0.8}],
+        [{'url': "b", 'score': 0.7}, {'url': "c", 'score': 0.6}],
+    ]
+    fused = reciprocal_rank_fusion(lists, k=60)
+    assert [article['url'] for article in fused] == ["b", "a", "c"]
+    assert fused[0]['score'] == 1.0
+    assert fused[0]['tavily_score'] == 0.8  # Dalla prima lista in cui compare
+    assert fused[0]['rrf_score'] == 1 / 62 + 1 / 61
+    assert lists[0][1]['score'] == 0.8  # Gli input non vengono modificati
+
+
+def test_rrf_empty_and_missing_urls():
+    assert reciprocal_rank_fusion([]) == []
+    assert reciprocal_rank_fusion([[], []]) == []
+    fused = reciprocal_rank_fusion([[{'title': "x"}, {'title': "y"}]])
+    assert [article['title'] for article in fused] == ["x", "y"]
+
+
+def test_top_k_order_matches_stable_argsort():
+    rng = np.random.RandomState(0)
+    for _ in range(200):
+        rows, width = rng.randint(1, 6), rng.randint(1, 12)
+        # Pochi valori distinti: molti pari merito sul k-esimo punteggio
+        scores = rng.randint(0, 4, size=(rows, width)).astype(float)
+        scores[rng.rand(rows, width) < 0.2] = -np.inf
+        for k in range(0, width + 2):
+            expected = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+            assert np.array_equal(CredibilityReranker._top_k_order(scores, k), expected)
+
+
+def test_rank_batch_agrees_with_rank():
+    reranker = CredibilityReranker()
+    lists = [
+        [{'url': "https://www.reuters.com/a", 'score': 0.2}, {'url': "https://blog.example/b", 'score': 0.9},
+         {'url': "https://apnews.com/c", 'score': 0.5}],
+        [],
+        [{'url': "https://blog.example/d", 'score': 0.1}],
+    ]
+    batch = reranker.rank_batch(lists, k=2)
+    assert [len(ranked) for ranked in batch] == [2, 0, 1]
+    for articles, ranked in zip(lists, batch):
+        assert ranked == reranker.rank(articles)[:2]
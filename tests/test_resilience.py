@@ -0,0 +1,156 @@
+import asyncio
+import time
+
+import pytest
+
+from fact_checker.resilience import (
+    CircuitBreaker, CircuitOpenError, ProviderGuard, TokenBucket, is_request_error, is_transient, retry_after_of
+)
+
+
+class FakeResponse:
+    def __init__(self, status_code=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class APIStatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.response = FakeResponse(status_code, headers)
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class UsageLimitExceededError(Exception):
+    # Tavily la solleva con uno stato 429/432, ma la quota esaurita non torna da sola
+    status_code = 429
+
+
+def _guard(**kwargs):
+    options = dict(max_attempts=3, base_delay=0, max_delay=0, failure_threshold=5, reset_timeout=60)
+    options.update(kwargs)
+    return ProviderGuard("test", rate=0, **options)
+
+
+def test_transient_classification():
+    assert is_transient(APIStatusError(503))
+    assert is_transient(APIStatusError(429))
+    assert is_transient(RateLimitError())
+    assert is_transient(TimeoutError())
+    assert is_transient(CircuitOpenError())
+    assert not is_transient(APIStatusError(401))
+    assert not is_transient(ValueError())
+    assert not is_transient(UsageLimitExceededError())
+
+
+def test_request_errors():
+    assert is_request_error(APIStatusError(400))
+    assert is_request_error(APIStatusError(422))
+    assert not is_request_error(APIStatusError(429))
+
+
+def test_retry_after_headers():
+    assert retry_after_of(APIStatusError(429, {'retry-after': "3"})) == 3.0
+    assert retry_after_of(APIStatusError(429, {'retry-after-ms': "1500"})) == 1.5
+    assert retry_after_of(APIStatusError(429)) is None
+
+
+def test_call_retries_transient_errors_then_succeeds():
+    guard = _guard()
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise APIStatusError(503)
+        return "ok"
+
+    assert guard.call(flaky) == "ok"
+    assert len(attempts) == 3
+    assert guard.breaker.state == "closed" and guard.breaker.failures == 0
+
+
+def test_call_gives_up_after_max_attempts():
+    guard = _guard(max_attempts=2)
+    attempts = []
+
+    def failing():
+        attempts.append(1)
+        raise RateLimitError()
+
+    with pytest.raises(RateLimitError):
+        guard.call(failing)
+    assert len(attempts) == 2
+
+
+@pytest.mark.parametrize("exc", [APIStatusError(400), UsageLimitExceededError(), ValueError()])
+def test_permanent_errors_are_not_retried(exc):
+    guard = _guard()
+    attempts = []
+
+    def failing():
+        attempts.append(1)
+        raise exc
+
+    with pytest.raises(type(exc)):
+        guard.call(failing)
+    assert len(attempts) == 1
+    assert guard.breaker.failures == 0
+
+
+def test_breaker_opens_and_fails_fast():
+    guard = _guard(max_attempts=1, failure_threshold=2)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise APIStatusError(502)
+
+    for _ in range(2):
+        with pytest.raises(APIStatusError):
+            guard.call(failing)
+    assert guard.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        guard.call(failing)
+    assert len(calls) == 2
+
+
+def test_breaker_half_open_closes_on_success_and_reopens_on_failure():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    breaker.opened_at -= 61
+    assert breaker.state == "half_open"
+    breaker.before_call("test")  # La chiamata di prova passa
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    breaker.opened_at -= 61
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_acall_retries_like_call():
+    guard = _guard()
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise TimeoutError()
+        return "ok"
+
+    assert asyncio.run(guard.acall(lambda: flaky())) == "ok"
+    assert len(attempts) == 2
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=100, burst=2)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # 2 gettoni subito, gli altri 4 a 10 ms l'uno
+    assert time.monotonic() - start >= 0.035
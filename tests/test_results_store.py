@@ -0,0 +1,98 @@
+import csv
+import os
+
+from fact_checker.checkpoint import CheckpointStore, content_hash
+from fact_checker.results_store import ResultsStore, open_results, read_results, stored_hashes
+
+
+def _result(verdict, urls=()):
+    return {
+        'verdetto': verdict,
+        'motivazione': f"motivazione {verdict}",
+        'context_tokens': 120,
+        'evidence': [{'url': url, 'rerank_score': 10.0 - i} for i, url in enumerate(urls)],
+        'metrics': {'prompt_tokens': 900, 'completion_tokens': 80, 'llm_calls': 2, 'cost_usd': 0.001,
+                    'stages': {'retrieval': 0.5, 'total': 1.25}},
+    }
+
+
+def test_round_trip_keeps_metrics_and_top_k_evidence(tmp_path):
+    path = str(tmp_path / "results")
+    store = ResultsStore(path, top_k=2, flush_every=100, flush_interval=3600)
+    store.add("claim a", _result("FALSE", ["u1", "u2", "u3"]), politifact_label="false")
+    assert read_results(path) is None  # Nulla su disco prima del flush
+    store.close()
+
+    df = read_results(path)
+    assert len(df) == 1
+    row = df.iloc[0]
+    assert row['claim'] == "claim a" and row['claim_hash'] == content_hash("claim a")
+    assert row['rag_label'] == "FALSE" and row['politifact_label'] == "false"
+    assert row['source'] == "pipeline" and row['llm_calls'] == 2
+    assert list(row['evidence_urls']) == ["u1", "u2"]
+    assert list(row['evidence_scores']) == [10.0, 9.0]
+    assert row['retrieval_seconds'] == 0.5 and row['planner_seconds'] != row['planner_seconds']  # NaN
+
+
+def test_flush_every_writes_atomic_parts(tmp_path):
+    path = str(tmp_path / "results")
+    store = ResultsStore(path, flush_every=2, flush_interval=3600)
+    for i in range(5):
+        store.add(f"c{i}", _result("TRUE"))
+    files = [name for _, _, names in os.walk(path) for name in names]
+    assert len(files) == 2 and all(name.endswith(".parquet") for name in files)
+    store.close()
+    assert len(read_results(path, columns=['claim'])) == 5
+
+
+def test_read_results_keeps_last_result_per_claim(tmp_path):
+    path = str(tmp_path / "results")
+    first = ResultsStore(path)
+    first.add("c", _result("ERRORE"))
+    first.close()
+    second = ResultsStore(path)
+    second.add("c", _result("FALSE"))
+    second.add("d", _result("TRUE"))
+    second.close()
+
+    df = read_results(path, columns=['claim', 'rag_label'])
+    assert list(df.columns) == ['claim', 'rag_label']
+    assert dict(zip(df['claim'], df['rag_label'])) == {"c": "FALSE", "d": "TRUE"}
+
+
+def test_read_results_is_read_only(tmp_path):
+    path = str(tmp_path / "results")
+    assert read_results(path) is None
+    assert not os.path.exists(path)
+
+
+def test_open_results_imports_missing_checkpoint_rows(tmp_path):
+    checkpoint = CheckpointStore(str(tmp_path / "cp.sqlite"), 'claim')
+    for claim in ("a", "b", "c"):
+        checkpoint.add({'claim': claim, 'rag_label': "FALSE", 'rag_motivation': "m"})
+    path = str(tmp_path / "results")
+    store = ResultsStore(path)
+    store.add("a", _result("FALSE"))
+    store.close()
+
+    open_results(path, None, 'claim', checkpoint).close()
+    df = read_results(path, columns=['claim', 'source'])
+    assert dict(zip(df['claim'], df['source'])) == {"a": "pipeline", "b": "checkpoint", "c": "checkpoint"}
+
+    # Una seconda apertura non importa nulla di nuovo
+    open_results(path, None, 'claim', checkpoint).close()
+    assert stored_hashes(path) == {content_hash(c) for c in ("a", "b", "c")}
+    assert len([n for _, _, names in os.walk(path) for n in names]) == 2
+    checkpoint.close()
+
+
+def test_open_results_imports_csv_without_checkpoint(tmp_path):
+    csv_path = str(tmp_path / "out.csv")
+    with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['claim', 'politifact_label', 'rag_label', 'rag_motivation'])
+        writer.writeheader()
+        writer.writerow({'claim': "a", 'politifact_label': "true", 'rag_label': "TRUE", 'rag_motivation': "m"})
+    path = str(tmp_path / "results")
+    open_results(path, csv_path, 'claim').close()
+    df = read_results(path, columns=['claim', 'politifact_label', 'source'])
+    assert df.to_dict('records') == [{'claim': "a", 'politifact_label': "true", 'source': "csv"}]
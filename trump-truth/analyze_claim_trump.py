@@ -1,10 +1,18 @@
 import pandas as pd
-import time
 import os
+import re
+import sys
+import json
 import numpy as np
-from openai import OpenAI, OpenAIError
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from openai import OpenAI
 from tqdm import tqdm
 
+# Modulo di resilienza condiviso con la pipeline (cartella principale del progetto)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fact_checker.resilience import get_guard, is_transient
+from claim_prefilter import ClaimPrefilter
+
 # --- CONFIGURAZIONE ---
 # 1. Incolla la tua chiave API di Novita AI qui
 NOVITA_API_KEY = "..." 
@@ -13,21 +21,35 @@ NOVITA_API_KEY = "..."
 MODEL_NAME = "meta-llama/llama-3.3-70b-instruct"
 
 # 3. Nomi dei file
-INPUT_FILE = 'trump_posts_cleaned.csv'
+INPUT_FILE = 'trump_posts_cleaned.parquet'   # Output di prefilter_trump_post.py
 OUTPUT_FILE = 'trump_posts_classified.csv'
+
+# 4. Classificazione in batch: post per richiesta e richieste in parallelo
+#    (la frequenza massima resta quella del limitatore "novita", NOVITA_RPS)
+BATCH_SIZE = 25
+MAX_WORKERS = 4
+MAX_POST_CHARS = 1500   # I post più lunghi vengono troncati nel prompt batch
+
+# 5. Prefiltro locale (addestrato con claim_prefilter.py): i post su cui è sicuro
+#    non vengono inviati all'LLM. Se il file non esiste si usa solo l'LLM.
+PREFILTER_MODEL = 'claim_prefilter.npz'
 # --- FINE CONFIGURAZIONE ---
 
 # Inizializza il client OpenAI con il base_url di Novita
 try:
     client = OpenAI(
         api_key=NOVITA_API_KEY,
-        base_url="https://api.novita.ai/openai"
+        base_url="https://api.novita.ai/openai",
+        max_retries=0  # I retry sono gestiti da fact_checker/resilience.py
     )
 
 except Exception as e:
     print(f"Errore nell'inizializzazione del client: {e}")
     exit()
 
+# Limite di frequenza (NOVITA_RPS), retry con backoff e circuit breaker
+novita_guard = get_guard("novita")
+
 # Questo è il "cervello": il prompt che definisce cosa è un claim
 SYSTEM_PROMPT = """
 Sei un assistente esperto di fact-checking. Il tuo compito è classificare un post sui social media come 'CLAIM' o 'NO_CLAIM'.
@@ -46,57 +68,129 @@ Devi valutare se il tweet che ti viene passato necessita di una valutazione di f
 Analizza il post dell'utente. Rispondi *solo ed esclusivamente* con la parola 'CLAIM' o la parola 'NO_CLAIM'. NON DEVI aggiungere altre parole.
 """
 
-def classify_post(post_text, retries=3, delay=10):
+# Stessi criteri, ma per una lista di post numerati in un'unica richiesta
+BATCH_SYSTEM_PROMPT = SYSTEM_PROMPT.split("Analizza il post dell'utente.")[0] + """
+Riceverai un array JSON di post, ognuno con un "id" e un "text".
+Classifica OGNI post in modo indipendente e rispondi *solo ed esclusivamente* con un array JSON
+con un oggetto per ogni post, nello stesso ordine: [{"id": 0, "label": "CLAIM"}, {"id": 1, "label": "NO_CLAIM"}, ...]
+Non aggiungere altro testo.
+"""
+
+VALID_LABELS = {"CLAIM", "NO_CLAIM"}
+
+def classify_post(post_text):
     """
     Chiama l'API Novita (via client OpenAI) per classificare un singolo post.
-    Implementa una logica di retry in caso di fallimento.
+    Frequenza, retry con backoff (rispettando Retry-After) e circuit breaker
+    sono gestiti da fact_checker/resilience.py.
+    Restituisce None se l'errore è temporaneo: il post resta da classificare
+    e verrà ritentato alla prossima esecuzione invece di essere marcato 'ERROR'.
     
     *** VERSIONE CORRETTA: usa un controllo esatto (==) invece di (in) ***
     """
     if NOVITA_API_KEY == "LA_TUA_CHIAVE_API_QUI":
         raise ValueError("ERRORE: Inserisci la tua NOVITA_API_KEY nello script.")
 
-    for attempt in range(retries):
+    try:
+        response = novita_guard.call(lambda: client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": post_text}
+            ],
+            max_tokens=5,   # Ci aspettiamo solo "CLAIM" o "NO_CLAIM"
+            temperature=0.0 # Vogliamo una risposta deterministica
+        ))
+        
+        # Pulisce la risposta: rimuove spazi, converte in maiuscolo, rimuove virgolette
+        classification = response.choices[0].message.content.strip().upper()
+        classification = classification.replace('"', '').replace("'", "")
+
+        # --- LA LOGICA CORRETTA ---
+        # Controlla l'uguaglianza esatta, non la sottostringa
+        if classification == "CLAIM":
+            return "CLAIM"
+        elif classification == "NO_CLAIM":
+            return "NO_CLAIM"
+        else:
+            # Se il modello risponde in modo strano (es. "QUESTO È UN NO_CLAIM")
+            # lo sapremo perché verrà classificato come "UNSURE".
+            print(f"\n[Warning] Risposta inattesa: '{classification}'")
+            return "UNSURE"
+
+    except Exception as e:
+        if is_transient(e):
+            print(f"\n[Errore temporaneo] Post: {post_text[:30]}... Errore: {e}. Verrà ritentato.")
+            return None
+        print(f"\n[Errore] {e}. Marco come 'ERROR'.")
+        return "ERROR"
+
+def parse_batch_response(content, n_items):
+    """
+    Estrae le etichette dalla risposta JSON del batch: restituisce {id: label}
+    solo per gli id validi (0..n_items-1) con etichetta riconosciuta.
+    Gli elementi mancanti o illeggibili verranno ritentati singolarmente.
+    """
+    match = re.search(r"\[.*\]", content or "", re.DOTALL)
+    if not match:
+        return {}
+    try:
+        items = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return {}
+
+    labels = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
         try:
-            response = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": post_text}
-                ],
-                max_tokens=5,   # Ci aspettiamo solo "CLAIM" o "NO_CLAIM"
-                temperature=0.0 # Vogliamo una risposta deterministica
-            )
-            
-            # Pulisce la risposta: rimuove spazi, converte in maiuscolo, rimuove virgolette
-            classification = response.choices[0].message.content.strip().upper()
-            classification = classification.replace('"', '').replace("'", "")
-
-            # --- LA LOGICA CORRETTA ---
-            # Controlla l'uguaglianza esatta, non la sottostringa
-            if classification == "CLAIM":
-                return "CLAIM"
-            elif classification == "NO_CLAIM":
-                return "NO_CLAIM"
-            else:
-                # Se il modello risponde in modo strano (es. "QUESTO È UN NO_CLAIM")
-                # lo sapremo perché verrà classificato come "UNSURE".
-                print(f"\n[Warning] Risposta inattesa: '{classification}'")
-                return "UNSURE"
-
-        except OpenAIError as e:
-            print(f"\n[Errore OpenAI Tentativo {attempt+1}/{retries}] Post: {post_text[:30]}... Errore: {e}")
-            if attempt < retries - 1:
-                print(f"Riprovo tra {delay} secondi...")
-                time.sleep(delay)
-            else:
-                print("\nMassimo numero di tentativi raggiunto. Marco come 'ERROR'.")
-                return "ERROR"
-        except Exception as e:
-            print(f"\n[Errore Generico] {e}. Marco come 'ERROR'.")
-            return "ERROR"
-            
-    return "ERROR"
+            item_id = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        label = str(item.get("label", "")).strip().upper().replace('"', '').replace("'", "")
+        if 0 <= item_id < n_items and label in VALID_LABELS:
+            labels[item_id] = label
+    return labels
+
+def classify_batch(batch):
+    """
+    Classifica una lista di (indice, testo) con una sola richiesta a Novita.
+    Restituisce {indice: classificazione}; i post che il modello non ha
+    etichettato correttamente vengono riclassificati uno per uno con classify_post.
+    In caso di errore temporaneo sull'intero batch i post restano da classificare (None).
+    """
+    if NOVITA_API_KEY == "LA_TUA_CHIAVE_API_QUI":
+        raise ValueError("ERRORE: Inserisci la tua NOVITA_API_KEY nello script.")
+
+    payload = json.dumps(
+        [{"id": i, "text": text[:MAX_POST_CHARS]} for i, (_, text) in enumerate(batch)],
+        ensure_ascii=False
+    )
+    try:
+        response = novita_guard.call(lambda: client.chat.completions.create(
+            model=MODEL_NAME,
+            messages=[
+                {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+                {"role": "user", "content": payload}
+            ],
+            max_tokens=20 * len(batch) + 20,  # ~ {"id": n, "label": "NO_CLAIM"} per post
+            temperature=0.0
+        ))
+        labels = parse_batch_response(response.choices[0].message.content, len(batch))
+    except Exception as e:
+        if is_transient(e):
+            print(f"\n[Errore temporaneo batch] {e}. I {len(batch)} post verranno ritentati.")
+            return {index: None for index, _ in batch}
+        print(f"\n[Errore batch] {e}. Riprovo i post singolarmente.")
+        labels = {}
+
+    results = {}
+    for i, (index, text) in enumerate(batch):
+        results[index] = labels[i] if i in labels else classify_post(text)
+    missing = len(batch) - len(labels)
+    if missing:
+        print(f"\n[Warning] {missing}/{len(batch)} post senza etichetta valida nel batch: riclassificati singolarmente.")
+    return results
 
 def main():
     """
@@ -104,7 +198,8 @@ def main():
     """
     print(f"Caricamento di '{INPUT_FILE}'...")
     try:
-        df = pd.read_csv(INPUT_FILE)
+        # Solo le colonne usate qui e dalle fasi successive
+        df = pd.read_parquet(INPUT_FILE, columns=['post_id', 'date', 'post_text'])
     except FileNotFoundError:
         print(f"Errore: File '{INPUT_FILE}' non trovato. Assicurati che sia nella stessa cartella.")
         return
@@ -117,6 +212,9 @@ def main():
         print(f"Creo nuovo file di output '{OUTPUT_FILE}'.")
         df_out = df.copy()
         df_out['classification'] = pd.Series(index=df.index, dtype='object')
+    # Chi ha deciso l'etichetta: 'llm', 'prefilter' o 'regola' (post vuoti/cortissimi)
+    if 'classification_source' not in df_out.columns:
+        df_out['classification_source'] = pd.Series(index=df_out.index, dtype='object')
 
     # Filtra solo le righe che non sono ancora state classificate
     to_process = df_out[df_out['classification'].isna()]
@@ -126,24 +224,49 @@ def main():
     else:
         print(f"Avvio classificazione per {len(to_process)} post rimanenti...")
 
-    # Usiamo tqdm per una barra di progresso
-    for index, row in tqdm(to_process.iterrows(), total=len(to_process), desc="Classificando i post"):
-        post_text = row['post_text']
-        
-        # Gestisce il caso in cui il testo sia vuoto/NaN anche se non dovrebbe
+    # Gestisce il caso in cui il testo sia vuoto/NaN anche se non dovrebbe
+    pending = []
+    for index, post_text in to_process['post_text'].items():
         if not isinstance(post_text, str) or len(post_text) < 5:
-            classification = "NO_CLAIM"
+            df_out.at[index, 'classification'] = "NO_CLAIM"
+            df_out.at[index, 'classification_source'] = "regola"
         else:
-            classification = classify_post(post_text)
-            time.sleep(3.1)
+            pending.append((index, post_text))
 
-        # Salva il risultato nel DataFrame
-        df_out.at[index, 'classification'] = classification
-        
-        # Salva i progressi ogni 100 post
-        if (to_process.index.get_loc(index) + 1) % 100 == 0:
-            # print(f"\nSalvataggio progressi...") # Rimuovo per non sporcare la barra tqdm
-            df_out.to_csv(OUTPUT_FILE, index=False, encoding='utf-8-sig')
+    # Prefiltro locale: all'LLM vanno solo i post nella zona di incertezza
+    if pending and os.path.exists(PREFILTER_MODEL):
+        prefilter = ClaimPrefilter.load(PREFILTER_MODEL)
+        decisions = prefilter.decide([text for _, text in pending])
+        uncertain = []
+        for (index, text), decision in zip(pending, decisions):
+            if decision is None:
+                uncertain.append((index, text))
+            else:
+                df_out.at[index, 'classification'] = decision
+                df_out.at[index, 'classification_source'] = "prefilter"
+        print(f"Prefiltro locale: {len(pending) - len(uncertain)} post decisi senza LLM, "
+              f"{len(uncertain)} inviati all'LLM.")
+        pending = uncertain
+
+    batches = [pending[i:i + BATCH_SIZE] for i in range(0, len(pending), BATCH_SIZE)]
+
+    # I batch partono in parallelo; il limitatore "novita" decide la frequenza effettiva.
+    # I risultati vengono scritti solo dal thread principale.
+    with tqdm(total=len(to_process), desc="Classificando i post") as progress:
+        progress.update(len(to_process) - len(pending))
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = [executor.submit(classify_batch, batch) for batch in batches]
+            for done, future in enumerate(as_completed(futures), start=1):
+                results = future.result()
+                for index, classification in results.items():
+                    df_out.at[index, 'classification'] = classification
+                    if classification is not None:
+                        df_out.at[index, 'classification_source'] = "llm"
+                progress.update(len(results))
+
+                # Salva i progressi ogni 4 batch (~100 post)
+                if done % 4 == 0:
+                    df_out.to_csv(OUTPUT_FILE, index=False, encoding='utf-8-sig')
 
     # Salvataggio finale
     print("Classificazione completata. Salvataggio finale...")
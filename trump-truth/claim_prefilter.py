@@ -0,0 +1,237 @@
+"""
+Prefiltro locale CLAIM / NO_CLAIM per i post di Truth Social.
+
+Regressione logistica (solo numpy, CPU) su n-grammi di parole e di caratteri
+proiettati con hashing in uno spazio di dimensione fissa: nessun vocabolario
+da salvare, il modello è un unico vettore di pesi in un file .npz.
+
+Addestramento (dalla cartella trump-truth, dopo analyze_claim_trump.py):
+    python claim_prefilter.py
+    python claim_prefilter.py --input trump_posts_classified.csv --output claim_prefilter.npz
+
+Le soglie salvate nel modello definiscono la zona di incertezza: fino a
+`low` il post è NO_CLAIM, da `high` in su è CLAIM, in mezzo va all'LLM.
+"""
+import argparse
+import json
+import re
+import time
+import zlib
+
+import numpy as np
+
+N_FEATURES = 2 ** 18
+WORD_NGRAMS = (1, 2)
+CHAR_NGRAMS = (3, 5)
+
+TOKEN_RE = re.compile(r"[a-z0-9%$]+(?:'[a-z]+)?")
+URL_RE = re.compile(r"https?://\S+")
+NUMBER_RE = re.compile(r"\d")
+
+
+def _ngram_ids(text, n_features):
+    """Indici hash (crc32, stabili tra processi) degli n-grammi del post."""
+    text = URL_RE.sub(" url ", text.lower())
+    text = NUMBER_RE.sub("0", text)   # "4%" e "7%" sono la stessa feature
+    tokens = TOKEN_RE.findall(text)
+
+    grams = []
+    for n in range(WORD_NGRAMS[0], WORD_NGRAMS[1] + 1):
+        grams.extend("w:" + " ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+    for token in tokens:
+        padded = f" {token} "
+        for n in range(CHAR_NGRAMS[0], CHAR_NGRAMS[1] + 1):
+            grams.extend("c:" + padded[i:i + n] for i in range(len(padded) - n + 1))
+    return {zlib.crc32(g.encode("utf-8")) % n_features for g in grams}
+
+
+def featurize(texts, n_features=N_FEATURES):
+    """
+    Matrice sparsa (riga, colonna, valore) dei post: feature binarie
+    normalizzate L2 per riga, così post lunghi e corti hanno lo stesso peso.
+    """
+    rows, cols, values = [], [], []
+    for row, text in enumerate(texts):
+        ids = _ngram_ids(text if isinstance(text, str) else "", n_features)
+        if not ids:
+            continue
+        rows.extend([row] * len(ids))
+        cols.extend(ids)
+        values.extend([1.0 / np.sqrt(len(ids))] * len(ids))
+    return (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64),
+            np.asarray(values, dtype=np.float32), len(texts))
+
+
+def _sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+class ClaimPrefilter:
+    """Classificatore locale: `predict_proba` restituisce P(CLAIM) per ogni post."""
+
+    def __init__(self, weights=None, bias=0.0, low=0.0, high=1.0, n_features=N_FEATURES, info=None):
+        self.n_features = n_features
+        self.weights = np.zeros(n_features, dtype=np.float32) if weights is None else weights
+        self.bias = float(bias)
+        self.low = float(low)
+        self.high = float(high)
+        self.info = info or {}
+
+    def _logits(self, X):
+        rows, cols, values, n_rows = X
+        return np.bincount(rows, weights=self.weights[cols] * values, minlength=n_rows) + self.bias
+
+    def predict_proba(self, texts):
+        return _sigmoid(self._logits(featurize(texts, self.n_features)))
+
+    def decide(self, texts):
+        """
+        Per ogni post: "CLAIM" / "NO_CLAIM" se il modello è sicuro, None se
+        il post è nella zona di incertezza e va classificato dall'LLM.
+        """
+        proba = self.predict_proba(texts)
+        return ["NO_CLAIM" if p <= self.low else "CLAIM" if p >= self.high else None for p in proba]
+
+    def fit(self, texts, labels, epochs=8, batch_size=256, lr=0.5, l2=1e-6, seed=0):
+        """
+        Regressione logistica con pesi di classe bilanciati, mini-batch e
+        AdaGrad. `labels` sono 1 per CLAIM e 0 per NO_CLAIM.
+        """
+        rows, cols, values, n_rows = featurize(texts, self.n_features)
+        y = np.asarray(labels, dtype=np.float64)
+        positives = max(1.0, y.sum())
+        negatives = max(1.0, len(y) - y.sum())
+        sample_weight = np.where(y == 1, len(y) / (2 * positives), len(y) / (2 * negatives))
+
+        # Indice per riga, per estrarre rapidamente le feature di un mini-batch
+        order = np.argsort(rows, kind="stable")
+        rows, cols, values = rows[order], cols[order], values[order]
+        starts = np.searchsorted(rows, np.arange(n_rows + 1))
+
+        weights = np.zeros(self.n_features, dtype=np.float64)
+        bias = 0.0
+        grad_sq = np.full(self.n_features, 1e-8)
+        bias_sq = 1e-8
+        rng = np.random.default_rng(seed)
+
+        for _ in range(epochs):
+            permutation = rng.permutation(n_rows)
+            for start in range(0, n_rows, batch_size):
+                batch = permutation[start:start + batch_size]
+                spans = [np.arange(starts[r], starts[r + 1]) for r in batch]
+                idx = np.concatenate(spans) if spans else np.array([], dtype=np.int64)
+                local_rows = np.repeat(np.arange(len(batch)), [len(s) for s in spans])
+
+                z = np.bincount(local_rows, weights=weights[cols[idx]] * values[idx], minlength=len(batch)) + bias
+                error = (_sigmoid(z) - y[batch]) * sample_weight[batch]
+
+                touched = np.unique(cols[idx])
+                grad = np.bincount(cols[idx], weights=error[local_rows] * values[idx], minlength=self.n_features)[touched]
+                grad = grad / len(batch) + l2 * weights[touched]
+                grad_sq[touched] += grad ** 2
+                weights[touched] -= lr * grad / np.sqrt(grad_sq[touched])
+
+                bias_grad = error.mean()
+                bias_sq += bias_grad ** 2
+                bias -= lr * bias_grad / np.sqrt(bias_sq)
+
+        self.weights = weights.astype(np.float32)
+        self.bias = bias
+        return self
+
+    def calibrate(self, texts, labels, target_precision=0.97):
+        """
+        Sceglie le soglie su un insieme di validazione: `low` è la soglia più
+        alta per cui i post con P(CLAIM) <= low sono NO_CLAIM con almeno
+        `target_precision`, `high` la più bassa per cui quelli >= high sono CLAIM.
+        Le soglie restano ai due lati di 0.5, così le due zone non si sovrappongono.
+        """
+        proba = self.predict_proba(texts)
+        y = np.asarray(labels)
+
+        order = np.argsort(proba)
+        p_sorted, y_sorted = proba[order], y[order]
+        counts = np.arange(1, len(y) + 1)
+
+        # Precisione NO_CLAIM dei primi k post (probabilità più basse)
+        no_claim_precision = np.cumsum(y_sorted == 0) / counts
+        ok = np.nonzero((no_claim_precision >= target_precision) & (p_sorted <= 0.5))[0]
+        self.low = float(p_sorted[ok[-1]]) if len(ok) else 0.0
+
+        # Precisione CLAIM degli ultimi k post (probabilità più alte)
+        claim_precision = np.cumsum(y_sorted[::-1] == 1) / counts
+        ok = np.nonzero((claim_precision >= target_precision) & (p_sorted[::-1] > 0.5))[0]
+        self.high = float(p_sorted[::-1][ok[-1]]) if len(ok) else 1.0
+
+        claim, no_claim = proba >= self.high, proba <= self.low
+        decided = claim | no_claim
+        correct = (claim & (y == 1)) | (no_claim & (y == 0))
+        self.info.update({
+            "target_precision": target_precision,
+            "validation_posts": int(len(y)),
+            "coverage": float(decided.mean()) if len(y) else 0.0,
+            "accuracy_on_decided": float(correct.sum() / decided.sum()) if decided.any() else 0.0,
+        })
+        return self
+
+    def save(self, path):
+        meta = {"n_features": self.n_features, "bias": self.bias, "low": self.low, "high": self.high, "info": self.info}
+        np.savez_compressed(path, weights=self.weights, meta=np.array(json.dumps(meta)))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(data["weights"], meta["bias"], meta["low"], meta["high"], meta["n_features"], meta.get("info"))
+
+
+def load_training_data(path):
+    """
+    Post etichettati dall'LLM in trump_posts_classified.csv. Sono esclusi i
+    post decisi dal prefiltro stesso (colonna 'classification_source'), per
+    non riaddestrare il modello sulle proprie previsioni.
+    """
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    df = df[df['classification'].isin(["CLAIM", "NO_CLAIM"]) & df['post_text'].notna()]
+    if 'classification_source' in df.columns:
+        df = df[df['classification_source'] != "prefilter"]
+    return df['post_text'].tolist(), (df['classification'] == "CLAIM").astype(int).to_numpy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Addestra il prefiltro locale CLAIM / NO_CLAIM.")
+    parser.add_argument('--input', default='trump_posts_classified.csv')
+    parser.add_argument('--output', default='claim_prefilter.npz')
+    parser.add_argument('--precision', type=float, default=0.97, help="Precisione minima delle decisioni locali.")
+    parser.add_argument('--validation', type=float, default=0.2, help="Frazione di post usata per calibrare le soglie.")
+    parser.add_argument('--epochs', type=int, default=8)
+    args = parser.parse_args()
+
+    texts, labels = load_training_data(args.input)
+    if len(texts) < 100:
+        print(f"Errore: servono almeno 100 post etichettati, trovati {len(texts)}.")
+        return
+    print(f"Post etichettati: {len(texts)} (CLAIM: {labels.sum()}, NO_CLAIM: {len(labels) - labels.sum()})")
+
+    rng = np.random.default_rng(0)
+    permutation = rng.permutation(len(texts))
+    n_val = int(len(texts) * args.validation)
+    val, train = permutation[:n_val], permutation[n_val:]
+
+    started = time.perf_counter()
+    model = ClaimPrefilter().fit([texts[i] for i in train], labels[train], epochs=args.epochs)
+    model.calibrate([texts[i] for i in val], labels[val], target_precision=args.precision)
+    print(f"Addestramento completato in {time.perf_counter() - started:.1f}s.")
+    print(f"Soglie: NO_CLAIM se P(CLAIM) <= {model.low:.3f}, CLAIM se >= {model.high:.3f}")
+    print(f"Post decisi senza LLM (validazione): {model.info['coverage']:.1%} "
+          f"con accuratezza {model.info['accuracy_on_decided']:.1%}")
+
+    # Si salva il modello addestrato senza la validazione: le soglie valgono per questi pesi
+    model.save(args.output)
+    print(f"Modello salvato in '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,103 @@
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 # Nome del file di input e output
 INPUT_FILE = 'trump_truth_social_posts.csv'
-OUTPUT_FILE = 'trump_posts_cleaned.csv'
+OUTPUT_FILE = 'trump_posts_cleaned.parquet'
 
-print(f"Caricamento dataset da '{INPUT_FILE}'...")
-try:
-    df = pd.read_csv(INPUT_FILE)
-except FileNotFoundError:
-    print(f"Errore: File '{INPUT_FILE}' non trovato.")
-    print("Assicurati di aver prima eseguito lo script di scraping.")
-    exit()
+# Righe lette (e scritte) per volta: la memoria resta costante al crescere dell'archivio
+CHUNK_SIZE = 50_000
+
+# Schema dell'output: tipi espliciti invece di quelli dedotti dal CSV chunk per chunk
+SCHEMA = pa.schema([
+    ('date', pa.timestamp('us', tz='UTC')),
+    ('post_id', pa.string()),
+    ('post_text', pa.string()),
+    ('post_url', pa.string()),
+    ('repost_flag', pa.bool_()),
+    ('urls_in_post', pa.string()),
+    ('hashtags', pa.string()),
+])
+TEXT_COLUMNS = ['post_id', 'post_text', 'post_url', 'urls_in_post', 'hashtags']
+PLACEHOLDERS = ['[Image]', '[Video]']
+
+# Post rimossi da ciascun filtro (contati in sequenza, come se fossero applicati uno dopo l'altro)
+removed = {'repost_flag': 0, 'Lunghezza < 10': 0, 'Placeholder': 0, 'Solo Link': 0}
 
-print(f"Numero totale di post originali: {len(df)}")
 
-# --- Inizio Fase 1: Filtro Semplice ---
+def clean_chunk(chunk):
+    """
+    Applica i filtri a un chunk con un'unica maschera combinata e restituisce
+    le righe da tenere, con i tipi dello SCHEMA.
+    """
+    # 0. Preparazione: gestisci valori mancanti (NaN) e rimuovi spazi extra
+    # Questo evita errori nelle prossime fasi
+    text = chunk['post_text'].fillna('').str.strip()
+    # Il CSV contiene "True"/"False": come nel filtro originale (repost_flag == False)
+    # si tengono solo i post esplicitamente originali, quelli senza flag vengono scartati
+    flag = chunk['repost_flag'].fillna('True').astype(str).str.strip().str.lower()
+    repost = ~flag.isin(['false', '0'])
 
-# 0. Preparazione: gestisci valori mancanti (NaN) e rimuovi spazi extra
-# Questo evita errori nelle prossime fasi
-df_cleaned = df.copy()
-df_cleaned['post_text'] = df_cleaned['post_text'].fillna('').str.strip()
+    # 1. Re-Post (basato sulla colonna 'repost_flag'), più affidabile che cercare 'RT @'
+    # 2. Post troppo corti (sotto i 10 caratteri)
+    # 3. Placeholder [Image] o [Video]
+    # 4. Post che sono SOLO link (che iniziano con 'http')
+    masks = [
+        ('repost_flag', ~repost.to_numpy()),
+        ('Lunghezza < 10', (text.str.len() > 10).to_numpy()),
+        ('Placeholder', (~text.isin(PLACEHOLDERS)).to_numpy()),
+        ('Solo Link', (~text.str.startswith('http')).to_numpy()),
+    ]
+    keep = np.ones(len(chunk), dtype=bool)
+    for name, mask in masks:
+        survivors = keep & mask
+        removed[name] += int(keep.sum() - survivors.sum())
+        keep = survivors
 
-# 1. Filtro: Rimuovi i Re-Post (basato sulla colonna 'repost_flag')
-# Questo è il modo più affidabile, meglio che cercare 'RT @'
-initial_count = len(df_cleaned)
-df_cleaned = df_cleaned[df_cleaned['repost_flag'] == False]
-print(f"Filtro [repost_flag]: Rimossi {initial_count - len(df_cleaned)} re-post.")
+    kept = chunk.loc[keep, [field.name for field in SCHEMA]].copy()
+    kept['post_text'] = text[keep]
+    kept['repost_flag'] = repost[keep]
+    kept['date'] = pd.to_datetime(kept['date'], errors='coerce', utc=True)
+    return kept
 
-# 2. Filtro: Rimuovi post troppo corti (sotto i 10 caratteri, come hai chiesto)
-initial_count = len(df_cleaned)
-df_cleaned = df_cleaned[df_cleaned['post_text'].str.len() > 10]
-print(f"Filtro [Lunghezza < 10]: Rimossi {initial_count - len(df_cleaned)} post.")
 
-# 3. Filtro: Rimuovi placeholder [Image] o [Video]
-initial_count = len(df_cleaned)
-placeholders = ['[Image]', '[Video]']
-df_cleaned = df_cleaned[~df_cleaned['post_text'].isin(placeholders)]
-print(f"Filtro [Placeholder]: Rimossi {initial_count - len(df_cleaned)} post.")
+print(f"Lettura di '{INPUT_FILE}' a blocchi di {CHUNK_SIZE} righe...")
+try:
+    reader = pd.read_csv(INPUT_FILE, chunksize=CHUNK_SIZE, dtype={c: str for c in TEXT_COLUMNS + ['repost_flag', 'date']},
+                         keep_default_na=False, na_values=[''])
+except FileNotFoundError:
+    print(f"Errore: File '{INPUT_FILE}' non trovato.")
+    print("Assicurati di aver prima eseguito lo script di scraping.")
+    exit()
+
+total_count = 0
+kept_count = 0
+with pq.ParquetWriter(OUTPUT_FILE, SCHEMA, compression='zstd') as writer:
+    for chunk in reader:
+        total_count += len(chunk)
+        kept = clean_chunk(chunk)
+        kept_count += len(kept)
+        writer.write_table(pa.Table.from_pandas(kept, schema=SCHEMA, preserve_index=False))
 
-# 4. Filtro: Rimuovi post che sono SOLO link (che iniziano con 'http')
-initial_count = len(df_cleaned)
-df_cleaned = df_cleaned[~df_cleaned['post_text'].str.startswith('http')]
-print(f"Filtro [Solo Link]: Rimossi {initial_count - len(df_cleaned)} post.")
- 
-# --- Fine Filtri ---
+print(f"Numero totale di post originali: {total_count}")
+for name, count in removed.items():
+    print(f"Filtro [{name}]: Rimossi {count} post.")
 
 print("\n--- RIEPILOGO ---")
-print(f"Post totali prima del filtro: {len(df)}")
-print(f"Post rimasti dopo il filtro: {len(df_cleaned)}")
-print(f"Percentuale di post 'rumorosi' rimossa: {100 * (len(df) - len(df_cleaned)) / len(df):.2f}%")
+print(f"Post totali prima del filtro: {total_count}")
+print(f"Post rimasti dopo il filtro: {kept_count}")
+if total_count:
+    print(f"Percentuale di post 'rumorosi' rimossa: {100 * (total_count - kept_count) / total_count:.2f}%")
 
-# Salvataggio del nuovo dataset pulito
-df_cleaned.to_csv(OUTPUT_FILE, index=False, encoding='utf-8-sig')
 print(f"\nDataset pulito salvato in '{OUTPUT_FILE}'.")
 
-# Mostra un'anteprima dei post "candidati" per la Fase 2
+# Mostra un'anteprima dei post "candidati" per la Fase 2 (solo le colonne e il blocco necessari)
 print("\n--- Esempio di post 'puliti' ---")
-try:
-    print(df_cleaned[['post_id', 'post_text']].sample(5))
-except ValueError:
-    print("Non ci sono abbastanza post rimasti per mostrare un campione.")
\ No newline at end of file
+preview_file = pq.ParquetFile(OUTPUT_FILE)
+if preview_file.metadata.num_rows >= 5:
+    preview = preview_file.read_row_group(0, columns=['post_id', 'post_text']).to_pandas()
+    print(preview.sample(min(5, len(preview))))
+else:
+    print("Non ci sono abbastanza post rimasti per mostrare un campione.")
@@ -1,6 +1,17 @@
-import requests
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
-import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# Modulo di resilienza condiviso con la pipeline (cartella principale del progetto)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fact_checker.resilience import get_guard
 
 # L'URL di base dell'API che hai trovato
 BASE_URL = "http://api.factsquared.com/json/factba.se-trump-social.php"
@@ -13,86 +24,210 @@ PARAMS = {
     'sort_order': 'desc'
 }
 
-def get_all_posts():
+OUTPUT_FILE = 'trump_truth_social_posts.csv'
+# Post scaricati in questa esecuzione (scritti man mano) e stato per riprendere dopo un errore
+PARTIAL_FILE = 'trump_truth_social_posts.partial.csv'
+STATE_FILE = 'trump_truth_social_posts.partial.json'
+
+MAX_CONCURRENCY = 4   # Pagine scaricate in parallelo (la frequenza è limitata da FACTBASE_RPS)
+REQUEST_TIMEOUT = 30
+# Post più recenti di OUTPUT_FILE (in testa al file) usati per trovare il punto di ripresa:
+# più di uno, nel caso in cui l'ultimo post salvato sia stato cancellato
+KNOWN_IDS_WINDOW = 500
+
+FIELDS = ['date', 'post_id', 'post_text', 'post_url', 'repost_flag', 'urls_in_post', 'hashtags']
+
+# Limite di frequenza, retry con backoff e circuit breaker per l'API di Factba.se
+factbase_guard = get_guard("factbase")
+
+
+def make_session():
+    """Sessione HTTP con connessioni riutilizzate (keep-alive) per tutti i thread."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENCY)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_page(session, page_num):
+    """Scarica una pagina dell'API e restituisce (meta, post estratti)."""
+    def request():
+        response = session.get(BASE_URL, params={**PARAMS, 'page': page_num}, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status() # Controlla se ci sono errori HTTP
+        return response.json()
+
+    data = factbase_guard.call(request)
+
+    # Estrai i dati che ci interessano
+    posts = []
+    for post in data.get('data', []):
+        social_data = post.get('social', {})
+        posts.append({
+            'date': post.get('date'),
+            'post_id': post.get('document_id'),
+            'post_text': social_data.get('post_text'),
+            'post_url': post.get('post_url'),
+            'repost_flag': social_data.get('repost_flag'),
+            'urls_in_post': ", ".join(social_data.get('urls', [])), # Unisce le URL in una stringa
+            'hashtags': ", ".join(social_data.get('hashtags', [])), # Unisce gli hashtag
+        })
+    return data.get('meta', {}), posts
+
+
+def read_post_ids(path, nrows=None):
+    """
+    Legge solo la colonna post_id di un CSV già scaricato (insieme vuoto se
+    non esiste); con `nrows` solo le prime righe, cioè i post più recenti.
+    """
+    if not os.path.exists(path):
+        return set()
+    ids = pd.read_csv(path, usecols=['post_id'], dtype={'post_id': str}, nrows=nrows)['post_id']
+    return set(ids.dropna())
+
+
+def load_state():
+    if os.path.exists(STATE_FILE) and os.path.exists(PARTIAL_FILE):
+        with open(STATE_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    return None
+
+
+def save_state(state):
+    tmp_path = STATE_FILE + '.tmp'
+    with open(tmp_path, mode='w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, STATE_FILE)
+
+
+def scrape(full=False):
     """
-    Esegue lo scraping di tutte le pagine dell'API di Factba.se
-    e restituisce un elenco di tutti i post.
+    Scarica le pagine (dalla più recente) in parallelo, al massimo
+    MAX_CONCURRENCY alla volta, e scrive i post in PARTIAL_FILE nell'ordine
+    delle pagine appena arrivano. In modalità incrementale si ferma alla prima
+    pagina che contiene uno dei post più recenti di OUTPUT_FILE (il file è
+    ordinato dal più recente, quindi basta leggerne le prime righe).
+    Se un'esecuzione precedente si è interrotta, riprende dall'ultima pagina salvata.
+    Restituisce il numero di post nuovi scaricati in questa esecuzione.
     """
-    
-    all_posts_data = []
-    page_num = 1
-    total_pages = 1 # Inizializziamo a 1, verrà aggiornato alla prima chiamata
-    
+    known_ids = set() if full else read_post_ids(OUTPUT_FILE, nrows=KNOWN_IDS_WINDOW)
+    state = load_state()
+    if state and state.get('full') == full:
+        print(f"Riprendo lo scraping interrotto dalla pagina {state['next_page']}...")
+        # Con nuovi post pubblicati nel frattempo le pagine scorrono: si scartano i doppioni
+        seen_ids = read_post_ids(PARTIAL_FILE)
+    else:
+        state = {'full': full, 'next_page': 1, 'total_pages': None}
+        seen_ids = set()
+        with open(PARTIAL_FILE, mode='w', newline='', encoding='utf-8') as f:
+            csv.DictWriter(f, fieldnames=FIELDS).writeheader()
+        save_state(state)
+
+    if known_ids:
+        print(f"Modalità incrementale: mi fermo ai {len(known_ids)} post più recenti di '{OUTPUT_FILE}'.")
     print("Avvio dello scraping dell'API di Factba.se...")
 
-    while True:
-        # Imposta il numero di pagina corrente nei parametri
-        PARAMS['page'] = page_num
-        
-        try:
-            # Esegui la richiesta GET all'API
-            response = requests.get(BASE_URL, params=PARAMS)
-            response.raise_for_status() # Controlla se ci sono errori HTTP
-            
-            data = response.json()
-            
-            # Aggiorna il numero totale di pagine alla prima iterazione
-            if page_num == 1:
-                total_pages = data['meta']['page_count']
-                print(f"Trovate {data['meta']['total_hits']} post su {total_pages} pagine.")
-
-            # Estrai i post dalla risposta
-            posts_in_page = data.get('data', [])
-            if not posts_in_page:
+    new_posts = 0
+    session = make_session()
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor, \
+            open(PARTIAL_FILE, mode='a', newline='', encoding='utf-8') as out:
+        writer = csv.DictWriter(out, fieldnames=FIELDS)
+        in_flight = {}
+        page_num = state['next_page']
+        total_pages = state['total_pages']
+        next_to_submit = page_num
+
+        while True:
+            # Finestra di pagine in volo: in memoria restano al massimo MAX_CONCURRENCY pagine.
+            # Finché il numero di pagine non è noto si scarica solo la prima.
+            last_page = total_pages if total_pages is not None else page_num
+            while len(in_flight) < MAX_CONCURRENCY and next_to_submit <= last_page:
+                in_flight[next_to_submit] = executor.submit(fetch_page, session, next_to_submit)
+                next_to_submit += 1
+            if page_num not in in_flight:
+                print("Scraping completato. Tutte le pagine sono state scaricate.")
+                break
+
+            # Le pagine vengono scritte in ordine, anche se completano in ordine sparso
+            meta, posts = in_flight.pop(page_num).result()
+            if total_pages is None:
+                total_pages = meta.get('page_count', page_num)
+                print(f"Trovate {meta.get('total_hits')} post su {total_pages} pagine.")
+
+            if not posts:
                 print("Nessun altro post trovato. Uscita.")
-                break # Esce se la pagina è vuota
-
-            # Estrai i dati che ci interessano
-            for post in posts_in_page:
-                social_data = post.get('social', {})
-                all_posts_data.append({
-                    'date': post.get('date'),
-                    'post_id': post.get('document_id'),
-                    'post_text': social_data.get('post_text'),
-                    'post_url': post.get('post_url'),
-                    'repost_flag': social_data.get('repost_flag'),
-                    'urls_in_post': ", ".join(social_data.get('urls', [])), # Unisce le URL in una stringa
-                    'hashtags': ", ".join(social_data.get('hashtags', [])), # Unisce gli hashtag
-                })
-
-            print(f"Pagina {page_num}/{total_pages} scaricata. ({len(all_posts_data)} post totali)")
-
-            # Controlla se abbiamo finito
+                break
+
+            reached_known = False
+            for post in posts:
+                post_id = str(post['post_id'])
+                if post_id in known_ids:
+                    reached_known = True
+                    continue
+                if post_id not in seen_ids:
+                    seen_ids.add(post_id)
+                    writer.writerow(post)
+                    new_posts += 1
+            out.flush()
+            state.update(next_page=page_num + 1, total_pages=total_pages)
+            save_state(state)
+            print(f"Pagina {page_num}/{total_pages} scaricata. ({new_posts} post nuovi)")
+
+            if reached_known:
+                print("Raggiunti i post già scaricati: aggiornamento incrementale completato.")
+                break
             if page_num >= total_pages:
                 print("Scraping completato. Tutte le pagine sono state scaricate.")
                 break
-                
-            # Incrementa la pagina e attendi per non sovraccaricare il server
             page_num += 1
-            time.sleep(0.5) # Pausa di mezzo secondo tra una richiesta e l'altra
 
-        except requests.exceptions.RequestException as e:
-            print(f"Errore durante la richiesta alla pagina {page_num}: {e}")
-            print("Attendo 10 secondi e riprovo...")
-            time.sleep(10)
-            
-    return all_posts_data
+        for future in in_flight.values():
+            future.cancel()
+    return new_posts
+
+
+def merge_into_output(full=False):
+    """
+    Mette i post nuovi (più recenti) in testa a OUTPUT_FILE copiando i file
+    riga per riga, senza caricarli in memoria, poi elimina i file parziali.
+    """
+    tmp_path = OUTPUT_FILE + '.tmp'
+    with open(tmp_path, mode='w', newline='', encoding='utf-8-sig') as out:
+        with open(PARTIAL_FILE, newline='', encoding='utf-8') as new:
+            for line in new:
+                out.write(line)
+        if not full and os.path.exists(OUTPUT_FILE):
+            with open(OUTPUT_FILE, newline='', encoding='utf-8-sig') as old:
+                next(old, None)  # Intestazione già scritta
+                for line in old:
+                    out.write(line)
+    os.replace(tmp_path, OUTPUT_FILE)
+    os.remove(PARTIAL_FILE)
+    os.remove(STATE_FILE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scarica i post di Truth Social da Factba.se.")
+    parser.add_argument('--full', action='store_true',
+                        help="Riscarica tutto lo storico invece di fermarsi ai post già salvati.")
+    args = parser.parse_args()
+
+    try:
+        new_posts = scrape(full=args.full)
+    except Exception as e:
+        print(f"\nScraping interrotto: {e}")
+        print(f"I post già scaricati sono in '{PARTIAL_FILE}': rilancia lo script per riprendere.")
+        return
+    merge_into_output(full=args.full)
+
+    print(f"\nDownload completato. Post nuovi estratti: {new_posts}")
+    print(f"Dati salvati con successo in '{OUTPUT_FILE}'")
 
-# --- ESECUZIONE ---
-posts_list = get_all_posts()
-
-if posts_list:
-    print(f"\nDownload completato. Totale post estratti: {len(posts_list)}")
-    
-    # Converti la lista di post in un DataFrame pandas
-    df = pd.DataFrame(posts_list)
-    
-    # Salva il DataFrame in un file CSV
-    output_file = 'trump_truth_social_posts.csv'
-    df.to_csv(output_file, index=False, encoding='utf-8-sig')
-    
-    print(f"Dati salvati con successo in '{output_file}'")
-    
     # Mostra i primi 5 post
     print("\n--- Anteprima dei dati ---")
-    print(df.head())
\ No newline at end of file
+    print(pd.read_csv(OUTPUT_FILE, nrows=5))
+
+
+# --- ESECUZIONE ---
+if __name__ == "__main__":
+    main()